@@ -0,0 +1,164 @@
+"""Ordering, timeouts and speedup of the batch engine, with a stub conversion.
+
+Runs `--documents` stub conversions that sleep for a random time on a `BatchEngine` of `--workers` threads: a few
+fail, a few run until the checks are done, past `--timeout`. Checks that
+
+- `ordered`: results come back in input order
+- `unordered`: every result comes back once, each as soon as its document is done
+- `errors`: exactly the slow documents time out and the failing ones fail
+- `timeouts`: the slow documents time out `--timeout` seconds after a worker picked them up
+- `abandoned`: the threads of timed-out conversions are counted busy until they return, documents that find every
+  thread held fail without starting
+- `shared_converter`: documents taking turns on one converter lock don't time out while they wait for it
+
+and reports the wall time of each run against the sum of the sleeps as JSON, exiting with 1 when a check fails.
+
+    PYTHONPATH=src python benchmarks/bench_batch.py --documents 40 --workers 4
+"""
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from doc_parser.batch import BatchEngine, BatchPool, holding
+from doc_parser.schema import ConversionResult
+
+FAILURE = "stub conversion failed"
+HELD = "Every batch worker is held by a conversion that timed out"
+# seconds a result may take to come out once its document is done or past its timeout
+TOLERANCE = 0.1
+
+
+class StubConversion:
+    """Sleeps for the duration of each document, or until `released` for slow ones, and records when it started and
+    finished."""
+
+    def __init__(self, durations: Dict[str, float], slow: set, failing: set):
+        self.durations = durations
+        self.slow = slow
+        self.failing = failing
+        self.released = threading.Event()
+        self.started: Dict[str, float] = {}
+        self.finished: Dict[str, float] = {}
+
+    def __call__(self, document: Tuple[str, Any]) -> ConversionResult:
+        filename = document[0]
+        self.started[filename] = time.perf_counter()
+        if filename in self.slow:
+            self.released.wait()
+        else:
+            time.sleep(self.durations[filename])
+        self.finished[filename] = time.perf_counter()
+        if filename in self.failing:
+            raise RuntimeError(FAILURE)
+        return ConversionResult(filename=filename)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--max-seconds", type=float, default=0.2, help="longest sleep of a document that finishes")
+    parser.add_argument("--timeout", type=float, default=0.5, help="document timeout in seconds")
+    parser.add_argument("--slow-share", type=float, default=0.1, help="fraction of documents that time out")
+    parser.add_argument("--failing-share", type=float, default=0.1, help="fraction of documents that fail")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+    # every failing and timed-out document is logged with its traceback
+    logging.getLogger("doc_parser.settings").setLevel(logging.CRITICAL)
+
+    rng = random.Random(args.seed)
+    documents = [(f"document-{i}", None) for i in range(args.documents)]
+    slow = {filename for filename, _ in documents if rng.random() < args.slow_share}
+    failing = {filename for filename, _ in documents if filename not in slow and rng.random() < args.failing_share}
+    durations = {filename: rng.uniform(0, args.max_seconds) for filename, _ in documents}
+
+    def expected_error(filename: str, convert: StubConversion) -> Optional[str]:
+        if filename not in convert.started:
+            # every worker was held by a slow document
+            return HELD
+        if filename in slow:
+            return f"Conversion timed out after {args.timeout:g}s"
+        return FAILURE if filename in failing else None
+
+    checks: Dict[str, bool] = {}
+    report: Dict[str, Any] = {
+        "documents": args.documents,
+        "workers": args.workers,
+        "slow": len(slow),
+        "failing": len(failing),
+        "serial_seconds": sum(args.timeout if filename in slow else durations[filename] for filename in durations),
+    }
+
+    for ordered in (True, False):
+        name = "ordered" if ordered else "unordered"
+        convert = StubConversion(durations, slow, failing)
+        # a pool per run, so the slow conversions of the previous run don't hold its workers
+        pool = BatchPool(max_workers=args.workers)
+        engine = BatchEngine(pool, timeout=None)
+        started = time.perf_counter()
+        results: List[Tuple[int, ConversionResult, float]] = []
+        for index, result in engine.iter_results(convert, documents, ordered=ordered, timeout=args.timeout):
+            results.append((index, result, time.perf_counter()))
+        report[f"{name}_seconds"] = time.perf_counter() - started
+
+        indices = [index for index, _, _ in results]
+        checks[name] = (indices if ordered else sorted(indices)) == list(range(len(documents)))
+        checks[f"{name}_errors"] = all(
+            result.error == expected_error(documents[index][0], convert) for index, result, _ in results
+        )
+        if not ordered:
+            # each result comes out as soon as its document is done, not after the ones before it
+            checks["unordered_as_finished"] = all(
+                emitted - convert.finished[documents[index][0]] < TOLERANCE
+                for index, _, emitted in results
+                if documents[index][0] in convert.finished
+            )
+            # the timeout is counted from the moment a worker picks the document up
+            checks["unordered_timeouts"] = all(
+                args.timeout <= emitted - convert.started[documents[index][0]] < args.timeout + TOLERANCE
+                for index, _, emitted in results
+                if documents[index][0] in slow and documents[index][0] in convert.started
+            )
+        # the slow documents still run until they are released
+        checks[f"{name}_abandoned"] = pool.abandoned == len(slow & set(convert.started))
+        convert.released.set()
+        pool.shutdown(wait=True)
+        checks[f"{name}_released"] = pool.abandoned == 0
+
+    # every document is shorter than the timeout but together they take longer, one after the other on one lock
+    converter_lock = threading.Lock()
+
+    def convert_shared(document: Tuple[str, Any]) -> ConversionResult:
+        with holding(converter_lock):
+            time.sleep(args.timeout / 4)
+        return ConversionResult(filename=document[0])
+
+    pool = BatchPool(max_workers=args.workers)
+    shared = [(f"shared-{i}", None) for i in range(max(8, 2 * args.workers))]
+    shared_results = list(BatchEngine(pool, timeout=None).iter_results(convert_shared, shared, timeout=args.timeout))
+    pool.shutdown(wait=True)
+    checks["shared_converter"] = len(shared_results) == len(shared) and all(
+        result.error is None for _, result in shared_results
+    )
+
+    report["speedup"] = report["serial_seconds"] / report["unordered_seconds"]
+    report["checks"] = checks
+    report["ok"] = all(checks.values())
+
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(payload)
+    else:
+        print(payload)
+    sys.exit(0 if report["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
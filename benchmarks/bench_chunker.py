@@ -0,0 +1,376 @@
+"""Micro-benchmark of the chunker hot loops (`DoclingChunker.iter_chunks` and `iter_post_processed_chunks`).
+
+Builds a synthetic `DoclingDocument` of `--pages` pages (numbered and plain headings, paragraphs, lists,
+footnotes, captioned tables, page-number texts and a few pictures) and times chunking plus merging with the
+heading stack, precompiled patterns and list-of-parts accumulation against the previous implementation,
+checking that both produce the same chunks. Pictures are described by a deterministic stub, not the VLM.
+
+    PYTHONPATH=src python benchmarks/bench_chunker.py --pages 1000
+"""
+import re
+import time
+import random
+import argparse
+import statistics
+from typing import Any, Callable, Iterable, Iterator, List, Optional
+
+from docling_core.transforms.chunker.hierarchical_chunker import DocChunk, DocMeta, HierarchicalChunker
+from docling_core.types.doc import BoundingBox, DocItemLabel, DoclingDocument, ProvenanceItem, TableCell, TableData
+from docling_core.types.doc.document import (
+    DocItem,
+    DocumentOrigin,
+    ImageRef,
+    LevelNumber,
+    ListItem,
+    PictureItem,
+    SectionHeaderItem,
+    TableItem,
+    TextItem,
+)
+
+import doc_parser.service as service
+from doc_parser.schema import ParserChunk
+from doc_parser.service import DoclingChunker, DoclingDocumentConversion
+from doc_parser.sizing import ChunkSizer, get_chunk_sizer
+from doc_parser.settings import CHUNK_MAX_TOKENS
+
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore".split()
+# a 1x1 PNG, pictures only need an image for the stub to describe
+PIXEL_URI = (
+    "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=="
+)
+
+
+def install_stub_vlm() -> None:
+    def images_to_text(images: List[bytes], postprocess: Callable[[str], str], **kwargs) -> List[str]:
+        return [postprocess(f"Stub text for picture {i}" if i % 3 else "no text") for i in range(len(images))]
+
+    service.image_text_memo.images_to_text = images_to_text
+
+
+def _prov(page_no: int) -> ProvenanceItem:
+    return ProvenanceItem(page_no=page_no, bbox=BoundingBox(l=0, t=0, r=1, b=1), charspan=(0, 1))
+
+
+def build_document(pages: int, seed: int = 0) -> DoclingDocument:
+    rnd = random.Random(seed)
+    doc = DoclingDocument(name="synthetic")
+    doc.origin = DocumentOrigin(mimetype="application/pdf", binary_hash=seed, filename="synthetic.pdf")
+    image = ImageRef.model_construct(mimetype="image/png", dpi=72, size=None, uri=PIXEL_URI)
+
+    def sentence(low: int, high: int) -> str:
+        return " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(low, high)))
+
+    doc.add_text(DocItemLabel.TITLE, "Synthetic benchmark document", prov=_prov(1))
+    section = 0
+    for page_no in range(1, pages + 1):
+        for _ in range(rnd.randint(1, 3)):
+            section += 1
+            kind = rnd.random()
+            if kind < 0.3:
+                doc.add_heading(f"{section} {sentence(2, 5)}", level=1, prov=_prov(page_no))
+            elif kind < 0.5:
+                doc.add_heading(f"{section}.{rnd.randint(1, 9)} {sentence(2, 5)}", level=2, prov=_prov(page_no))
+            elif kind < 0.6:
+                doc.add_text(DocItemLabel.SECTION_HEADER, sentence(2, 5), prov=_prov(page_no))
+            else:
+                doc.add_heading(sentence(2, 5), level=rnd.randint(1, 3), prov=_prov(page_no))
+
+            for _ in range(rnd.randint(2, 8)):
+                kind = rnd.random()
+                if kind < 0.55:
+                    doc.add_text(DocItemLabel.TEXT, sentence(5, 120), prov=_prov(page_no))
+                elif kind < 0.7:
+                    group = doc.add_group(name="list")
+                    for _ in range(rnd.randint(1, 5)):
+                        doc.add_list_item(sentence(3, 12), prov=_prov(page_no), parent=group)
+                elif kind < 0.75:
+                    doc.add_text(DocItemLabel.FOOTNOTE, sentence(3, 15), prov=_prov(page_no))
+                elif kind < 0.85:
+                    caption = doc.add_text(DocItemLabel.CAPTION, f"Table {section}: {sentence(2, 6)}", prov=_prov(page_no))
+                    cells = [
+                        TableCell(
+                            text=sentence(1, 3),
+                            start_row_offset_idx=row,
+                            end_row_offset_idx=row + 1,
+                            start_col_offset_idx=col,
+                            end_col_offset_idx=col + 1,
+                        )
+                        for row in range(3)
+                        for col in range(3)
+                    ]
+                    doc.add_table(TableData(table_cells=cells, num_rows=3, num_cols=3), caption=caption, prov=_prov(page_no))
+                elif kind < 0.88:
+                    doc.add_picture(image=image, prov=_prov(page_no))
+                elif kind < 0.94:
+                    doc.add_text(DocItemLabel.TEXT, str(page_no), prov=_prov(page_no))
+                else:
+                    doc.add_text(DocItemLabel.CAPTION, sentence(3, 10), prov=_prov(page_no))
+    return doc
+
+
+# Previous implementation, kept verbatim for comparison
+def legacy_iter_chunks(chunker: HierarchicalChunker, dl_doc: DoclingDocument, indent=4, **kwargs: Any) -> Iterator[DocChunk]:
+    previous: Optional[DocChunk] = None
+    heading_by_level: dict[LevelNumber, str] = {}
+    list_items: list[TextItem] = []
+
+    # send every picture to the VLM up front, concurrently, and stitch the texts back in document order
+    pictures = [item for item, _ in dl_doc.iterate_items() if isinstance(item, PictureItem)]
+    picture_texts = dict(
+        zip(
+            [picture.self_ref for picture in pictures],
+            DoclingDocumentConversion._process_document_images(dl_doc, pictures, **kwargs),
+        )
+    )
+
+    for item, level in dl_doc.iterate_items():
+        captions = None
+        chunk_indent = " " * indent * (level - 1) if level > 1 else ""
+
+        if isinstance(item, DocItem):
+            # first handle any merging needed
+            if chunker.merge_list_items:
+                if isinstance(item, ListItem) or (  # TODO remove when all captured as ListItem:
+                    isinstance(item, TextItem) and item.label == DocItemLabel.LIST_ITEM
+                ):
+                    item.text = f"{chunk_indent}{item.text}"
+                    list_items.append(item)
+                    continue
+                elif list_items:  # need to yield
+                    # not add chunk if level higher than current
+                    if item.label == DocItemLabel.FOOTNOTE or (
+                        previous is not None and heading_by_level and level > max(heading_by_level)
+                    ):
+                        previous.text = f"{previous.text}\n{chunker.delim.join([i.text for i in list_items])}"
+                    else:
+                        if previous is not None:
+                            yield previous
+                        previous = DocChunk(
+                            text=chunker.delim.join([i.text for i in list_items]),
+                            meta=DocMeta(
+                                doc_items=list_items,
+                                headings=[heading_by_level[k] for k in sorted(heading_by_level)] or None,
+                                origin=dl_doc.origin,
+                            ),
+                        )
+                    list_items = []  # reset
+
+            if isinstance(item, SectionHeaderItem) or (
+                isinstance(item, TextItem) and item.label in [DocItemLabel.SECTION_HEADER, DocItemLabel.TITLE]
+            ):
+                level = (
+                    item.level
+                    if isinstance(item, SectionHeaderItem)
+                    else (0 if item.label == DocItemLabel.TITLE else 1)
+                )
+                # check header hierarchy due to docling detection (6->6.1->heading text)
+                # if match, increase the level to maximum
+                if re.match(r"\d+\.\d+ ", item.text):
+                    level = 2
+                elif (
+                    heading_by_level
+                    and re.sub(r"#+ ", "", heading_by_level[min(heading_by_level)])[0].isdigit()
+                    and not re.match(r"\d+\.? ", item.text)
+                ):
+                    level = min(max(heading_by_level) + 1, 3)
+                marker = "#" * level if level > 1 else "#"
+                heading_by_level[level] = f"{marker} {item.text}"
+
+                # remove headings of higher level as they just went out of scope
+                keys_to_del = [k for k in heading_by_level if k > level]
+                for k in keys_to_del:
+                    heading_by_level.pop(k, None)
+                continue
+
+            # skip page number text
+            if isinstance(item, TextItem) and item.prov and item.text == str(item.prov[0].page_no):
+                continue
+
+            if isinstance(item, TextItem) or ((not chunker.merge_list_items) and isinstance(item, ListItem)):
+                text = item.text
+            elif isinstance(item, TableItem):
+                md_table = item.export_to_markdown()
+                text = item.caption_text(dl_doc) + "\n" + md_table + "\n"
+                captions = [c.text for c in [r.resolve(dl_doc) for r in item.captions]] or None
+            elif isinstance(item, PictureItem):
+                text = picture_texts[item.self_ref]
+                if not text:
+                    continue
+            else:
+                text = item.text
+
+            c = DocChunk(
+                text=f"{chunk_indent}{text}".strip(),
+                meta=DocMeta(
+                    doc_items=[item],
+                    headings=[heading_by_level[k] for k in sorted(heading_by_level)] or None,
+                    captions=captions,
+                    origin=dl_doc.origin,
+                ),
+            )
+            if previous is not None:
+                yield previous
+            previous = c
+
+    if previous is not None:
+        yield previous
+
+    if chunker.merge_list_items and list_items:  # need to yield
+        yield DocChunk(
+            text=chunker.delim.join([i.text for i in list_items]).strip(),
+            meta=DocMeta(
+                doc_items=list_items,
+                headings=[heading_by_level[k] for k in sorted(heading_by_level)] or None,
+                origin=dl_doc.origin,
+            ),
+        )
+
+
+def legacy_iter_post_processed_chunks(
+    chunker: HierarchicalChunker,
+    chunks: Iterable[DocChunk],
+    indent: int = 4,
+    min_length: int = 32,
+    max_tokens: int = CHUNK_MAX_TOKENS,
+    sizer: Optional[ChunkSizer] = None,
+) -> Iterator[ParserChunk]:
+    sizer = sizer or get_chunk_sizer()
+    current_item = {}
+    current_length = 0
+    for chunk in chunks:
+        if not current_item:
+            heading_text = (
+                chunker.delim.join(chunk.meta.headings)
+                if chunk.meta.headings and re.sub(r"^#+ ", "", chunk.meta.headings[0]) not in chunk.text
+                else ""
+            )
+            current_item = {
+                "text": f"{heading_text}\n\n{chunk.text}".strip(),
+                "metadata": {
+                    "page_number": chunk.meta.doc_items[0].prov[0].page_no
+                    if chunk.meta.doc_items[0].prov
+                    else 1,
+                    "chunk_type": chunk.meta.doc_items[0].label.value,
+                    "bbox": None,  # current we don't consider bbox
+                    "file_type": chunk.meta.origin.mimetype,
+                    "filename": chunk.meta.origin.filename,
+                    "headings": chunk.meta.headings,
+                },
+            }
+            current_length = sizer.count(current_item["text"])
+            continue
+
+        if (
+            (  # add footnote to table
+                current_item["metadata"]["chunk_type"] == "table"
+                and chunk.meta.doc_items[0].label.value == "footnote"
+            )
+            or (  # add notes (list item) with higher level to table
+                current_item["metadata"]["chunk_type"] == "table"
+                and chunk.meta.doc_items[0].label.value == "list_item"
+                and chunk.text.startswith(" " * indent)
+            )
+            or (  # add caption to table
+                current_item["metadata"]["chunk_type"] == "caption"
+                and chunk.meta.doc_items[0].label.value == "table"
+            )
+            or (  # add text with same heading and page_number with current text length < INPUT_LEN_LIMIT // 4
+                current_item["metadata"]["chunk_type"] != "table"
+                and chunk.meta.doc_items[0].label.value not in ["caption", "table"]
+                and chunk.meta.headings
+                and current_item["metadata"]["headings"]
+                and chunk.meta.headings[0] == current_item["metadata"]["headings"][0]
+                and current_length < max_tokens
+                and chunk.meta.doc_items[0].prov
+                and current_item["metadata"]["page_number"] == chunk.meta.doc_items[0].prov[0].page_no
+            )
+        ):
+            if (  # change chunk_type if caption is above table chunk
+                current_item["metadata"]["chunk_type"] == "caption"
+                and chunk.meta.doc_items[0].label.value == "table"
+            ):
+                current_item["metadata"]["chunk_type"] = "table"
+            current_item["text"] = f"{current_item['text']}\n{chunk.text}"
+            current_length = sizer.extend(current_length, f"\n{chunk.text}")
+            continue
+
+        # just add chunks with length > min_length
+        if len(current_item["text"]) > min_length:
+            current_item["text"] = (
+                f"{current_item['text'].strip()}\n\nPage Number: {current_item['metadata']['page_number']}"
+            )
+            yield ParserChunk(**current_item)
+
+        current_item = {
+            "text": f"{chunker.delim.join(chunk.meta.headings) if chunk.meta.headings and re.sub(r'^#+ ','',chunk.meta.headings[0]) not in chunk.text else ''}\n\n{chunk.text}",  # noqa: E501
+            "metadata": {
+                "page_number": chunk.meta.doc_items[0].prov[0].page_no if chunk.meta.doc_items[0].prov else 1,
+                "chunk_type": chunk.meta.doc_items[0].label.value,
+                "bbox": None,
+                "file_type": chunk.meta.origin.mimetype,
+                "filename": chunk.meta.origin.filename,
+                "headings": chunk.meta.headings,
+            },
+        }
+        current_length = sizer.count(current_item["text"])
+
+    # documents without any chunk leave current_item empty
+    if current_item and len(current_item["text"]) > min_length:
+        current_item["text"] = (
+            f"{current_item['text'].strip()}\n\nPage Number: {current_item['metadata']['page_number']}"
+        )
+        yield ParserChunk(**current_item)
+
+
+def current(dl_doc: DoclingDocument, max_tokens: int) -> List[ParserChunk]:
+    chunker = DoclingChunker()
+    chunks = chunker.iter_chunks(dl_doc, indent=4)
+    return list(
+        DoclingDocumentConversion().iter_post_processed_chunks(chunker.chunker, chunks, indent=4, max_tokens=max_tokens)
+    )
+
+
+def legacy(dl_doc: DoclingDocument, max_tokens: int) -> List[ParserChunk]:
+    chunker = DoclingChunker().chunker
+    chunks = legacy_iter_chunks(chunker, dl_doc, indent=4)
+    return list(legacy_iter_post_processed_chunks(chunker, chunks, indent=4, max_tokens=max_tokens))
+
+
+def bench(fn: Callable[..., List[ParserChunk]], document: DoclingDocument, max_tokens: int, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        # list items are indented in place while chunking, every run needs a pristine copy
+        dl_doc = document.model_copy(deep=True)
+        start = time.perf_counter()
+        fn(dl_doc, max_tokens)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--chunk-max-tokens", type=int, default=CHUNK_MAX_TOKENS, help="merge budget, larger means longer merges")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    install_stub_vlm()
+    document = build_document(args.pages)
+    items = sum(1 for _ in document.iterate_items())
+
+    chunks = current(document.model_copy(deep=True), args.chunk_max_tokens)
+    legacy_chunks = legacy(document.model_copy(deep=True), args.chunk_max_tokens)
+    assert [c.model_dump_json() for c in chunks] == [c.model_dump_json() for c in legacy_chunks], "chunks differ from legacy"
+
+    legacy_seconds = bench(legacy, document, args.chunk_max_tokens, args.repeat)
+    current_seconds = bench(current, document, args.chunk_max_tokens, args.repeat)
+    print(f"{args.pages} pages, {items} items, {len(chunks)} chunks")
+    print(f"{'implementation':<16} {'ms':>10} {'pages/s':>10}")
+    print(f"{'legacy':<16} {legacy_seconds * 1000:>10.1f} {args.pages / legacy_seconds:>10.0f}")
+    print(f"{'current':<16} {current_seconds * 1000:>10.1f} {args.pages / current_seconds:>10.0f}")
+    print(f"speedup {legacy_seconds / current_seconds:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
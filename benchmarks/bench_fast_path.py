@@ -0,0 +1,132 @@
+"""Latency of small text-native documents through DocumentConverter against the fast path.
+
+Every mode runs in a fresh process and converts small Markdown, HTML and AsciiDoc documents to a DoclingDocument:
+
+- `docling`: `DoclingDocumentConversion._convert_to_document` with the fast path off, i.e. a DocumentConverter
+- `fast_path`: the same call with the fast path on, parsed in the spawned fast path workers
+- `fast_path_inline`: the fast path with `FAST_PATH_WORKERS=0`, parsed in the calling thread
+
+and reports the import time, the fast path worker start-up the service does before reporting ready, the latency of
+the first document (converter and pipeline set-up) and the p50/p95 latency of the following ones, in milliseconds.
+The `docling` mode needs the full docling install.
+
+    PYTHONPATH=src python benchmarks/bench_fast_path.py --repeat 50
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, List
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from corpus import build_html, build_markdown  # noqa: E402
+
+ROOT = Path(__file__).resolve().parent.parent
+
+MODES = {
+    "docling": {"FAST_PATH_ENABLED": "false"},
+    "fast_path": {"FAST_PATH_ENABLED": "true"},
+    "fast_path_inline": {"FAST_PATH_ENABLED": "true", "FAST_PATH_WORKERS": "0"},
+}
+
+
+def build_asciidoc(num_sections: int) -> bytes:
+    sections = "".join(
+        f"== {i}. Section {i}\n\nThe supplier shall deliver the goods described in section {i}.\n\n"
+        f"* First obligation\n* Second obligation\n\n"
+        for i in range(1, num_sections + 1)
+    )
+    return f"= Service Agreement\n\n{sections}".encode()
+
+
+def documents(sections: int) -> Dict[str, bytes]:
+    return {
+        "notes.md": build_markdown(sections),
+        "page.html": build_html(sections),
+        "guide.adoc": build_asciidoc(sections),
+    }
+
+
+def percentile(samples: List[float], q: float) -> float:
+    return statistics.quantiles(samples, n=100)[int(q) - 1] if len(samples) > 1 else samples[0]
+
+
+def child(args: argparse.Namespace) -> None:
+    """Runs in the fresh process of one mode, prints its measurements as JSON."""
+    started = time.perf_counter()
+    from doc_parser import fastpath
+    from doc_parser.service import DoclingDocumentConversion
+    from doc_parser.settings import FAST_PATH_ENABLED
+
+    import_seconds = time.perf_counter() - started
+    converter = DoclingDocumentConversion()
+
+    # the service starts the fast path workers at startup, before it reports ready
+    started = time.perf_counter()
+    if FAST_PATH_ENABLED:
+        fastpath.warm_up()
+    warm_up_seconds = time.perf_counter() - started
+
+    report: Dict[str, Any] = {"import_ms": import_seconds * 1000, "warm_up_ms": warm_up_seconds * 1000, "formats": {}}
+    for filename, content in documents(args.sections).items():
+        latencies = []
+        for _ in range(args.repeat + 1):
+            started = time.perf_counter()
+            dl_doc, error, _ = converter._convert_to_document((filename, BytesIO(content)))
+            latencies.append((time.perf_counter() - started) * 1000)
+            if error:
+                raise RuntimeError(f"{filename}: {error}")
+
+        first, warm = latencies[0], latencies[1:]
+        report["formats"][filename] = {
+            "items": len(dl_doc.texts) + len(dl_doc.tables),
+            "first_ms": first,
+            "p50_ms": percentile(warm, 50),
+            "p95_ms": percentile(warm, 95),
+        }
+    print(json.dumps(report))
+
+
+def run_mode(name: str, args: argparse.Namespace) -> Dict[str, Any]:
+    env = {
+        **os.environ,
+        **MODES[name],
+        "PYTHONPATH": os.pathsep.join(filter(None, [str(ROOT / "src"), os.environ.get("PYTHONPATH")])),
+        "RESULT_CACHE_ENABLED": "false",
+        "METRICS_ENABLED": "false",
+    }
+    command = [sys.executable, __file__, "--child", "--repeat", str(args.repeat), "--sections", str(args.sections)]
+    completed = subprocess.run(command, env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        return {"mode": name, "error": completed.stderr.strip().splitlines()[-1:]}
+    return {"mode": name, **json.loads(completed.stdout.strip().splitlines()[-1])}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20, help="warm conversions per document")
+    parser.add_argument("--sections", type=int, default=5, help="sections per document, keep them small")
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--output", type=Path, help="write the JSON report here instead of stdout")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    payload = json.dumps({"modes": [run_mode(name, args) for name in args.modes]}, indent=2)
+    if args.output:
+        args.output.write_text(payload)
+    else:
+        print(payload)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Micro-benchmark of upload format detection (`utils.guess_format`).
+
+Builds a synthetic corpus with one sample per InputFormat, padded to `--size-mb`, and times the
+bounded-prefix sniffer against the previous whole-payload implementation.
+
+    PYTHONPATH=src python benchmarks/bench_format_detection.py --size-mb 100
+"""
+import io
+import re
+import time
+import zipfile
+import argparse
+import statistics
+from typing import Callable, Dict, Optional, Tuple
+
+import filetype
+
+from doc_parser.utils import InputFormat, MimeTypeToFormat, guess_format, mime_from_extension
+
+
+def legacy_detect_html_xhtml(content):
+    content_str = content.decode("ascii", errors="ignore").lower()
+    content_str = re.sub(r"<!--(.*?)-->", "", content_str, flags=re.DOTALL)
+    content_str = content_str.lstrip()
+
+    if re.match(r"<\?xml", content_str):
+        if "xhtml" in content_str[:1000]:
+            return "application/xhtml+xml"
+
+    if re.match(r"<!doctype\s+html|<html|<head|<body", content_str):
+        return "text/html"
+
+    return None
+
+
+def legacy_guess_format(obj: bytes, filename: str = None):
+    content = obj
+    mime = filetype.guess_mime(content)
+    if mime is None:
+        ext = filename.rsplit(".", 1)[-1] if ("." in filename and not filename.startswith(".")) else ""
+        mime = mime_from_extension(ext)
+    mime = mime or legacy_detect_html_xhtml(content)
+    mime = mime or "text/plain"
+    return MimeTypeToFormat.get(mime)
+
+
+def _zip(members: Dict[str, bytes], padding: int) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_STORED) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+        archive.writestr("media/padding.bin", b"\0" * padding)
+    return buffer.getvalue()
+
+
+def build_corpus(size: int) -> Dict[str, Tuple[str, bytes, Optional[InputFormat]]]:
+    text_padding = b"lorem ipsum dolor sit amet\n" * (size // 27)
+    return {
+        "pdf": ("sample.pdf", b"%PDF-1.7\n" + b"\0" * size, InputFormat.PDF),
+        # leading bytes before the magic number defeat `filetype`, so detection falls through to the HTML sniffer
+        "pdf-no-magic": ("scan.pdf", b"\r\n%PDF-1.4\n" + b"\0" * size, None),
+        "png": ("sample.png", b"\x89PNG\r\n\x1a\n" + b"\0" * size, InputFormat.IMAGE),
+        "docx": (
+            "sample.docx",
+            _zip({"[Content_Types].xml": b"<Types/>", "word/document.xml": b"<w:document/>"}, size),
+            InputFormat.DOCX,
+        ),
+        "pptx": (
+            "sample.pptx",
+            _zip({"[Content_Types].xml": b"<Types/>", "ppt/presentation.xml": b"<p:presentation/>"}, size),
+            InputFormat.PPTX,
+        ),
+        "html": ("sample.html", b"<!-- generated -->\n<!doctype html><html><body>" + text_padding, InputFormat.HTML),
+        "html-no-ext": ("sample", b"<!-- generated -->\n<html><body>" + text_padding, InputFormat.HTML),
+        "md": ("sample.md", b"# Title\n\n" + text_padding, InputFormat.MD),
+        "asciidoc": ("sample.adoc", b"= Title\n\n" + text_padding, InputFormat.ASCIIDOC),
+    }
+
+
+def bench(fn: Callable, content: bytes, filename: str, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(content, filename)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=float, default=20, help="payload size of every sample")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    corpus = build_corpus(int(args.size_mb * 1024 * 1024))
+    print(f"{'sample':<12} {'format':<10} {'legacy ms':>12} {'bounded ms':>12} {'speedup':>9}")
+    for name, (filename, content, expected) in corpus.items():
+        legacy = bench(legacy_guess_format, content, filename, args.repeat)
+        bounded = bench(guess_format, content, filename, args.repeat)
+        detected = guess_format(content, filename)
+        assert detected == legacy_guess_format(content, filename), f"{name}: {detected} differs from legacy"
+        print(
+            f"{name:<12} {str(detected.value if detected else None):<10} "
+            f"{legacy * 1000:>12.3f} {bounded * 1000:>12.3f} {legacy / bounded:>8.0f}x"
+            + ("" if detected == expected else f"  (expected {expected})")
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""Benchmark of the conversion and chunking pipeline with a stub VLM.
+
+Drives `DoclingDocumentConversion.convert`/`convert_batch`, `DoclingChunker.hierarchical_chunk` and
+`post_process_chunks` over a fixed corpus, with `utils.image_to_text` replaced by a deterministic local
+stub, and reports per-stage wall time, pages/sec, peak RSS and chunk counts as JSON.
+
+    PYTHONPATH=src python benchmarks/bench_pipeline.py --output bench.json
+    PYTHONPATH=src python benchmarks/bench_pipeline.py --save-baseline benchmarks/baseline.json
+    PYTHONPATH=src python benchmarks/bench_pipeline.py --baseline benchmarks/baseline.json --max-regression 0.2
+
+Exits with status 1 when a stage is slower than the baseline by more than `--max-regression`, or when
+chunk counts differ (the output changed). Only the documents in the baseline are gated, the run lists the corpus
+documents it leaves out and whether any picture went through the stub VLM. The committed `benchmarks/baseline.json`
+only has HTML and Markdown, which convert without the layout and OCR models: it gates neither PDF/DOCX/PPTX/image
+conversion nor picture description. Save a full one, on the machine that runs the gate, with the models downloaded.
+"""
+import os
+
+# caches would turn every run after the first into a lookup
+os.environ.setdefault("RESULT_CACHE_ENABLED", "false")
+os.environ.setdefault("IMAGE_CACHE_ENABLED", "false")
+os.environ.setdefault("CONVERTER_POOL_WARM_UP", "false")
+
+import sys
+import json
+import time
+import hashlib
+import argparse
+import resource
+import platform
+from io import BytesIO
+from pathlib import Path
+from collections import defaultdict
+from typing import Any, Dict, List
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from corpus import build_corpus  # noqa: E402
+
+import doc_parser.utils as utils  # noqa: E402
+from doc_parser.service import DoclingChunker, DoclingDocumentConversion  # noqa: E402
+
+
+def install_stub_vlm(latency: float) -> List[str]:
+    """Replace the Bedrock call with a deterministic stub that sleeps `latency` seconds.
+
+    Returns the list the stub appends the digest of each image it is called with to.
+    """
+    calls: List[str] = []
+
+    def image_to_text(image: bytes, **kwargs) -> str:
+        time.sleep(latency)
+        digest = hashlib.sha256(image).hexdigest()[:12]
+        calls.append(digest)
+        return f"Stub text for image {digest}"
+
+    utils.image_to_text = image_to_text
+    return calls
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if platform.system() == "Darwin" else peak / 1024
+
+
+def best_pass(timings: List[float], per_pass: int) -> float:
+    """Wall time of the fastest pass over the corpus, to limit noise."""
+    return min(sum(timings[i : i + per_pass]) for i in range(0, len(timings), per_pass))
+
+
+def run(paths: List[Path], repeat: int, scale: int) -> Dict[str, Any]:
+    converter = DoclingDocumentConversion()
+    stages: Dict[str, List[float]] = defaultdict(list)
+    documents: Dict[str, Dict[str, Any]] = {}
+
+    # the first pass loads the models, it is reported separately from the steady state
+    start = time.perf_counter()
+    converter.convert((paths[0].name, BytesIO(paths[0].read_bytes())))
+    warm_up = time.perf_counter() - start
+
+    for _ in range(repeat):
+        for path in paths:
+            file_bytes = path.read_bytes()
+
+            start = time.perf_counter()
+            dl_doc, error, _ = converter._convert_to_document((path.name, BytesIO(file_bytes)))
+            docling_seconds = time.perf_counter() - start
+            if error:
+                raise RuntimeError(f"Failed to convert {path.name}: {error}")
+
+            chunker = DoclingChunker()
+            start = time.perf_counter()
+            chunks = chunker.hierarchical_chunk(dl_doc, indent=4)
+            chunk_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            chunk_dicts = converter.post_process_chunks(chunker.chunker, chunks, indent=4)
+            post_process_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            result = converter.convert((path.name, BytesIO(file_bytes)))
+            convert_seconds = time.perf_counter() - start
+
+            pages = max(1, len(dl_doc.pages))
+            stages["docling"].append(docling_seconds)
+            stages["hierarchical_chunk"].append(chunk_seconds)
+            stages["post_process_chunks"].append(post_process_seconds)
+            stages["convert"].append(convert_seconds)
+            documents[path.name] = {
+                "pages": pages,
+                "raw_chunks": len(chunks),
+                "chunks": len(chunk_dicts),
+                "convert_chunks": len(result.chunk_dicts),
+                "docling_seconds": docling_seconds,
+                "hierarchical_chunk_seconds": chunk_seconds,
+                "post_process_chunks_seconds": post_process_seconds,
+                "convert_seconds": convert_seconds,
+                "pages_per_second": pages / convert_seconds,
+            }
+
+        start = time.perf_counter()
+        converter.convert_batch([(path.name, BytesIO(path.read_bytes())) for path in paths])
+        stages["convert_batch"].append(time.perf_counter() - start)
+
+    total_pages = sum(document["pages"] for document in documents.values())
+    return {
+        "python": platform.python_version(),
+        "scale": scale,
+        "warm_up_seconds": warm_up,
+        "stages": {
+            name: best_pass(timings, len(paths) if name != "convert_batch" else 1) for name, timings in stages.items()
+        },
+        "pages_per_second": total_pages / min(stages["convert_batch"]),
+        "peak_rss_mb": peak_rss_mb(),
+        "documents": documents,
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    failures = []
+    for name, seconds in report["stages"].items():
+        reference = baseline["stages"].get(name)
+        if reference and seconds > reference * (1 + max_regression):
+            failures.append(f"{name}: {seconds:.3f}s vs baseline {reference:.3f}s (+{seconds / reference - 1:.0%})")
+    for name, document in report["documents"].items():
+        reference = baseline["documents"].get(name)
+        if reference and document["chunks"] != reference["chunks"]:
+            failures.append(f"{name}: {document['chunks']} chunks vs baseline {reference['chunks']}")
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--corpus", type=Path, default=Path(__file__).parent / ".corpus", help="corpus directory, generated if missing"
+    )
+    parser.add_argument("--scale", type=int, default=1, help="corpus size multiplier, each scale has its own files")
+    parser.add_argument("--documents", help="comma-separated corpus files to run, e.g. notes.md,page.html, default all")
+    parser.add_argument("--vlm-latency", type=float, default=0.2, help="seconds the stub VLM sleeps per image")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", type=Path, help="write the JSON report here instead of stdout")
+    parser.add_argument(
+        "--baseline", type=Path, help="baseline report to compare against, the run takes its scale and documents"
+    )
+    parser.add_argument("--save-baseline", type=Path, help="store this run as the new baseline")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed slowdown per stage, 0.2 = 20%%")
+    args = parser.parse_args()
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline else None
+    if baseline:
+        # only the same documents at the same scale are comparable
+        args.scale = baseline.get("scale", 1)
+        args.documents = ",".join(baseline["documents"])
+
+    vlm_calls = install_stub_vlm(args.vlm_latency)
+    corpus = sorted(path for path in build_corpus(args.corpus, args.scale))
+    paths = [path for path in corpus if path.name in args.documents.split(",")] if args.documents else corpus
+    report = run(paths, args.repeat, args.scale)
+    report["vlm_calls"] = len(vlm_calls)
+    report["not_covered"] = [path.name for path in corpus if path not in paths]
+
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(payload)
+    else:
+        print(payload)
+    if args.save_baseline:
+        args.save_baseline.write_text(payload)
+
+    if baseline:
+        # what the baseline leaves out is not gated, say so rather than pass it silently
+        if report["not_covered"]:
+            print(f"NOT COVERED {', '.join(report['not_covered'])}: not in the baseline", file=sys.stderr)
+        if not report["vlm_calls"]:
+            print("NOT COVERED picture description: no document of the baseline went through the VLM", file=sys.stderr)
+        failures = compare(report, baseline, args.max_regression)
+        for failure in failures:
+            print(f"REGRESSION {failure}", file=sys.stderr)
+        sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
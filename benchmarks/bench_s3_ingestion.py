@@ -0,0 +1,121 @@
+"""S3 ingestion against a local S3 stand-in, offline.
+
+Uploads `--copies` copies of Markdown and HTML documents of the benchmark corpus (`--formats` adds PDF/DOCX/PPTX) to
+`s3://<bucket>/in/` and runs three ingestion jobs into `s3://<bucket>/out/`:
+
+- `cold`: every document is downloaded, converted and its result written
+- `resume`: the same job again, every result is up to date and nothing is converted
+- `changed`: after one document is uploaded again with new content, only that document is converted
+
+and reports the time and counts of each as JSON, exiting with 1 when a job does not convert what it should. The
+stand-in is moto's server (`pip install "moto[server]"`) started in-process, or any S3-compatible endpoint such as
+MinIO with `--endpoint-url`. The result cache is off, so skipped documents are the resume logic, not cache hits.
+
+    PYTHONPATH=src python benchmarks/bench_s3_ingestion.py --copies 10
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+from pathlib import Path
+from typing import Any, Dict
+
+os.environ.setdefault("RESULT_CACHE_ENABLED", "false")
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import boto3  # noqa: E402
+
+from corpus import build_docx, build_html, build_markdown, build_pdf, build_pptx  # noqa: E402
+
+from doc_parser.ingestion import S3Ingestion  # noqa: E402
+from doc_parser.jobs import new_job_id  # noqa: E402
+from doc_parser.schema import IngestionJobResult, S3IngestionRequest  # noqa: E402
+
+DOCUMENTS = {
+    "md": ("notes.md", lambda: build_markdown(30)),
+    "html": ("page.html", lambda: build_html(30)),
+    "pdf": ("contract.pdf", lambda: build_pdf(5)),
+    "docx": ("agreement.docx", lambda: build_docx(15)),
+    "pptx": ("deck.pptx", lambda: build_pptx(10)),
+}
+
+
+def start_moto_server() -> str:
+    try:
+        from moto.server import ThreadedMotoServer
+    except ImportError:
+        raise SystemExit('Install the S3 stand-in with `pip install "moto[server]"` or pass --endpoint-url')
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False).start()
+    return f"http://127.0.0.1:{port}"
+
+
+def run_job(ingestion: S3Ingestion, request: S3IngestionRequest) -> Dict[str, Any]:
+    started = time.perf_counter()
+    progress = ingestion.run(IngestionJobResult(job_id=new_job_id(), target=request.target), request)
+    return {"seconds": time.perf_counter() - started, **progress.model_dump(exclude={"job_id", "target"})}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--copies", type=int, default=5, help="copies of each corpus document to upload")
+    parser.add_argument("--formats", nargs="+", choices=list(DOCUMENTS), default=["md", "html"])
+    parser.add_argument("--endpoint-url", help="S3-compatible endpoint to use instead of an in-process moto server")
+    parser.add_argument("--bucket", default="doc-parser-bench")
+    parser.add_argument("--prefetch", type=int, default=4)
+    parser.add_argument("--output", type=Path, help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    from doc_parser.service import DocumentConverterService, DoclingDocumentConversion
+
+    endpoint_url = args.endpoint_url or start_moto_server()
+    client = boto3.client(
+        "s3",
+        endpoint_url=endpoint_url,
+        region_name="us-east-1",
+        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID", "testing"),
+        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY", "testing"),
+    )
+    client.create_bucket(Bucket=args.bucket)
+
+    documents = [DOCUMENTS[name] for name in args.formats]
+    contents = {filename: build() for filename, build in documents}
+    keys = []
+    for copy in range(args.copies):
+        for filename, content in contents.items():
+            keys.append(f"in/{copy}/{filename}")
+            client.put_object(Bucket=args.bucket, Key=keys[-1], Body=content)
+
+    service = DocumentConverterService(doc_parser=DoclingDocumentConversion())
+    ingestion = S3Ingestion(service, client=client, prefetch=args.prefetch)
+    request = S3IngestionRequest(prefix=f"s3://{args.bucket}/in/", target=f"s3://{args.bucket}/out/")
+
+    report: Dict[str, Any] = {"documents": len(keys), "jobs": {}}
+    report["jobs"]["cold"] = run_job(ingestion, request)
+    report["jobs"]["resume"] = run_job(ingestion, request)
+    # right after its result was written, within the same second of LastModified
+    client.put_object(Bucket=args.bucket, Key=keys[0], Body=contents[documents[0][0]] + b"\n")
+    report["jobs"]["changed"] = run_job(ingestion, request)
+    ingestion.shutdown()
+
+    expected = {"cold": len(keys), "resume": 0, "changed": 1}
+    report["ok"] = all(report["jobs"][name]["converted"] == count for name, count in expected.items()) and not any(
+        job["failed"] for job in report["jobs"].values()
+    )
+
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(payload)
+    else:
+        print(payload)
+    sys.exit(0 if report["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
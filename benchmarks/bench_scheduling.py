@@ -0,0 +1,120 @@
+"""Latency of small documents queued behind large ones, per scheduler policy.
+
+A stream of conversions arrives at random (Poisson) intervals on a one-worker `ConversionExecutor`: mostly small
+one-page documents from an `interactive` tenant and a few 400-page documents from a `bulk` tenant. Each conversion
+sleeps for its cost as estimated by the preflight of a generated PDF, scaled by `--time-scale`. The same arrivals are
+replayed under every policy (fifo, sjf, fair) and the p50/p95/p99 latency of small and large documents is reported
+in estimated seconds, with the longest wait of a large document showing the effect of `--max-wait`. The preflight
+time of the generated PDFs is reported too, in milliseconds.
+
+    PYTHONPATH=src python benchmarks/bench_scheduling.py --jobs 600 --utilization 0.8
+"""
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import statistics
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from corpus import build_pdf  # noqa: E402
+
+from doc_parser.executor import ConversionExecutor  # noqa: E402
+from doc_parser.preflight import estimate_document  # noqa: E402
+from doc_parser.scheduling import SCHEDULER_POLICIES, Scheduler, Ticket  # noqa: E402
+from doc_parser.settings import SCHEDULER_MAX_WAIT  # noqa: E402
+
+
+def percentile(samples: List[float], q: float) -> float:
+    return statistics.quantiles(samples, n=100)[int(q) - 1] if len(samples) > 1 else samples[0]
+
+
+def summary(samples: List[float]) -> Dict[str, float]:
+    return {"p50": percentile(samples, 50), "p95": percentile(samples, 95), "p99": percentile(samples, 99)}
+
+
+def preflight(pages: int, repeat: int = 5) -> Tuple[float, float]:
+    """(estimated cost, preflight milliseconds) of a generated PDF of `pages` pages."""
+    content = build_pdf(pages)
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        estimate = estimate_document(f"{pages}-pages.pdf", BytesIO(content), "none")
+        samples.append((time.perf_counter() - started) * 1000)
+    return estimate.cost, statistics.median(samples)
+
+
+async def replay(policy: str, arrivals: List[Tuple[float, Ticket]], time_scale: float, max_wait: float) -> Dict[str, Any]:
+    executor = ConversionExecutor(kind="thread", max_workers=1, max_queue=len(arrivals), policy=policy)
+    executor.scheduler = Scheduler(1, policy=policy, max_wait=max_wait * time_scale)
+    latencies: Dict[str, List[float]] = {"small": [], "large": []}
+    waits: Dict[str, List[float]] = {"small": [], "large": []}
+
+    async def convert(ticket: Ticket, size: str) -> None:
+        submitted = time.perf_counter()
+        started = await executor.run(lambda: (time.sleep(ticket.cost * time_scale), time.perf_counter())[1], ticket=ticket)
+        finished = time.perf_counter()
+        latencies[size].append((finished - submitted) / time_scale)
+        waits[size].append((started - submitted) / time_scale)
+
+    started_at = time.perf_counter()
+    tasks = []
+    for at, ticket in arrivals:
+        await asyncio.sleep(max(0.0, started_at + at * time_scale - time.perf_counter()))
+        tasks.append(asyncio.create_task(convert(ticket, "large" if ticket.tenant == "bulk" else "small")))
+    await asyncio.gather(*tasks)
+    executor.shutdown()
+
+    return {
+        "policy": policy,
+        "small_latency": summary(latencies["small"]),
+        "large_latency": summary(latencies["large"]),
+        "large_max_wait": max(waits["large"], default=0.0),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=600, help="conversions to replay per policy")
+    parser.add_argument("--large-share", type=float, default=0.05, help="fraction of 400-page documents")
+    parser.add_argument("--utilization", type=float, default=0.8, help="offered load of the single worker")
+    parser.add_argument("--time-scale", type=float, default=0.001, help="wall seconds per estimated second")
+    parser.add_argument("--max-wait", type=float, default=SCHEDULER_MAX_WAIT, help="starvation bound in estimated seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    small_cost, small_ms = preflight(1)
+    large_cost, large_ms = preflight(400)
+    mean_cost = args.large_share * large_cost + (1 - args.large_share) * small_cost
+
+    rng = random.Random(args.seed)
+    arrivals, at = [], 0.0
+    for _ in range(args.jobs):
+        at += rng.expovariate(args.utilization / mean_cost)
+        large = rng.random() < args.large_share
+        arrivals.append((at, Ticket(large_cost, "bulk") if large else Ticket(small_cost, "interactive")))
+
+    report = {
+        "offered_load": sum(ticket.cost for _, ticket in arrivals) / at,
+        "large_documents": sum(ticket.tenant == "bulk" for _, ticket in arrivals),
+        "preflight": {"1_page_ms": small_ms, "400_pages_ms": large_ms, "1_page_cost": small_cost, "400_pages_cost": large_cost},
+        "policies": [
+            asyncio.run(replay(policy, arrivals, args.time_scale, args.max_wait)) for policy in SCHEDULER_POLICIES
+        ],
+    }
+
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(payload)
+    else:
+        print(payload)
+
+
+if __name__ == "__main__":
+    main()
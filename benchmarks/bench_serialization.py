@@ -0,0 +1,123 @@
+"""Cost and size of the conversion response body.
+
+A synthetic `ConversionResult` with `--chunks` chunks is built and encoded the ways the service can answer:
+
+- `build`: constructing the chunks as the chunker does, validating the metadata dict in pydantic-core, against
+  `model_construct`; with pydantic 2 skipping validation is the slower of the two, as it runs in Python
+- `encode`: the body in each response format (json, columnar, msgpack when installed), with its size and time,
+  and `json_stdlib`: the dict dump serialised with the json module, as a `response_model` endpoint would
+- `compress`: the json and columnar bodies compressed with gzip and zstd (when installed) at the configured levels
+
+Times are the median of `--repeat` runs, in milliseconds.
+
+    PYTHONPATH=src python benchmarks/bench_serialization.py --chunks 2000
+"""
+import json
+import time
+import argparse
+import statistics
+import importlib.util
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from pydantic import TypeAdapter
+
+from doc_parser.schema import ConversionResult, ParserChunk, ParserChunkMetadata
+from doc_parser.serialization import RESPONSE_MEDIA_TYPES, _zstandard, compress, encode
+
+
+def chunk_fields(num_chunks: int) -> List[Dict[str, Any]]:
+    return [
+        {
+            "text": f"The supplier shall deliver the goods described in section {i} within thirty days of the order. "
+            * 4,
+            "metadata": {
+                "page_number": i // 8 + 1,
+                "chunk_type": "table" if i % 10 == 0 else "text",
+                "bbox": None,
+                "file_type": "pdf",
+                "filename": "agreement.pdf",
+                "headings": ["Service Agreement", f"{i // 8 + 1}. Section {i // 8 + 1}"],
+            },
+        }
+        for i in range(num_chunks)
+    ]
+
+
+def validated(fields: List[Dict[str, Any]]) -> List[ParserChunk]:
+    return [ParserChunk(text=item["text"], metadata=item["metadata"]) for item in fields]
+
+
+def constructed(fields: List[Dict[str, Any]]) -> List[ParserChunk]:
+    return [
+        ParserChunk.model_construct(text=item["text"], metadata=ParserChunkMetadata.model_construct(**item["metadata"]))
+        for item in fields
+    ]
+
+
+def stdlib_json(adapter: TypeAdapter, result: ConversionResult) -> bytes:
+    content = adapter.dump_python(result, mode="json", exclude_unset=True)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def median_ms(fn: Callable[[], Any], repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=1000, help="chunks in the synthetic result")
+    parser.add_argument("--repeat", type=int, default=20, help="runs per measurement")
+    parser.add_argument("--output", type=Path, help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    fields = chunk_fields(args.chunks)
+    adapter = TypeAdapter(ConversionResult)
+    result = ConversionResult(filename="agreement.pdf", chunk_dicts=constructed(fields))
+
+    report: Dict[str, Any] = {
+        "chunks": args.chunks,
+        "build": {
+            "validated_ms": median_ms(lambda: validated(fields), args.repeat),
+            "model_construct_ms": median_ms(lambda: constructed(fields), args.repeat),
+        },
+        "encode": {},
+        "compress": {},
+    }
+
+    formats = [name for name in RESPONSE_MEDIA_TYPES if name != "msgpack" or importlib.util.find_spec("msgpack")]
+    bodies = {}
+    for name in formats:
+        bodies[name] = encode(adapter, result, name)
+        report["encode"][name] = {
+            "bytes": len(bodies[name]),
+            "ms": median_ms(lambda: encode(adapter, result, name), args.repeat),
+        }
+
+    report["encode"]["json_stdlib"] = {
+        "bytes": len(stdlib_json(adapter, result)),
+        "ms": median_ms(lambda: stdlib_json(adapter, result), args.repeat),
+    }
+
+    encodings = ["gzip"] + (["zstd"] if _zstandard() is not None else [])
+    for name in ("json", "columnar"):
+        for encoding in encodings:
+            report["compress"][f"{name}+{encoding}"] = {
+                "bytes": len(compress(bodies[name], encoding)),
+                "ms": median_ms(lambda: compress(bodies[name], encoding), args.repeat),
+            }
+
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(payload)
+    else:
+        print(payload)
+
+
+if __name__ == "__main__":
+    main()
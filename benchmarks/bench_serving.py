@@ -0,0 +1,265 @@
+"""Throughput per GiB of the single-process server against the preloaded multi-worker gunicorn mode.
+
+Starts the service once as `uvicorn main:app` and once as `gunicorn main:app` (gunicorn.conf.py, `--workers`
+processes forked after the models are loaded), waits for `/health/ready`, then posts the benchmark corpus to
+`/documents/convert` from `--concurrency` clients for `--duration` seconds. Memory is the peak PSS summed over
+the server's process tree, which counts pages shared copy-on-write between workers once instead of per worker
+as RSS would. Pictures are skipped (`image_policy=none`) so no VLM is called. Several gunicorn workers need the
+Redis job store: a throwaway `redis-server` is started unless `--redis-url` is given.
+
+    python benchmarks/bench_serving.py --workers 4 --duration 60
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import signal
+import argparse
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from corpus import build_corpus  # noqa: E402
+
+ROOT = Path(__file__).resolve().parent.parent
+GIB = 1024 ** 3
+
+
+def process_tree(pid: int) -> List[int]:
+    """`pid` and all of its descendants."""
+    children: Dict[int, List[int]] = {}
+    for entry in Path("/proc").iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            ppid = int((entry / "stat").read_text().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry.name))
+
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(children.get(current, []))
+    return tree
+
+
+def memory_bytes(pid: int) -> Dict[str, int]:
+    """PSS and RSS summed over the process tree, from /proc/<pid>/smaps_rollup (Linux only)."""
+    totals = {"pss": 0, "rss": 0}
+    for tree_pid in process_tree(pid):
+        try:
+            lines = Path(f"/proc/{tree_pid}/smaps_rollup").read_text().splitlines()
+        except OSError:
+            continue
+        for line in lines:
+            name, _, value = line.partition(":")
+            if name in ("Pss", "Rss"):
+                totals[name.lower()] += int(value.split()[0]) * 1024
+    return totals
+
+
+class MemorySampler(threading.Thread):
+    def __init__(self, pid: int, interval: float = 0.5):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak = {"pss": 0, "rss": 0}
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            sample = memory_bytes(self.pid)
+            self.peak = {name: max(self.peak[name], sample[name]) for name in sample}
+
+
+def multipart(field: str, filename: str, content: bytes):
+    boundary = uuid.uuid4().hex
+    body = (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f"Content-Type: application/octet-stream\r\n\r\n"
+    ).encode() + content + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def wait_ready(url: str, timeout: float, confirmations: int) -> None:
+    """Poll /health/ready until it answers 200 `confirmations` times in a row, i.e. every worker is likely up."""
+    deadline = time.time() + timeout
+    streak = 0
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"{url}/health/ready", timeout=5) as response:
+                streak = streak + 1 if response.status == 200 else 0
+        except (urllib.error.URLError, ConnectionError):
+            streak = 0
+        if streak >= confirmations:
+            return
+        time.sleep(0.2 if streak else 1.0)
+    raise TimeoutError(f"{url} was not ready after {timeout}s")
+
+
+def load(url: str, documents: List[Path], concurrency: int, duration: float) -> Dict[str, Any]:
+    payloads = [(path.name, path.read_bytes()) for path in documents]
+    deadline = time.time() + duration
+    lock = threading.Lock()
+    counts = {"ok": 0, "failed": 0}
+
+    def client(offset: int) -> None:
+        i = offset
+        while time.time() < deadline:
+            filename, content = payloads[i % len(payloads)]
+            i += 1
+            body, content_type = multipart("document", filename, content)
+            request = urllib.request.Request(
+                f"{url}/documents/convert?image_policy=none", data=body, headers={"Content-Type": content_type}
+            )
+            try:
+                with urllib.request.urlopen(request, timeout=600) as response:
+                    response.read()
+                    outcome = "ok"
+            except (urllib.error.URLError, ConnectionError):
+                outcome = "failed"
+            with lock:
+                counts[outcome] += 1
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(client, range(concurrency)))
+    return {**counts, "seconds": time.time() - start}
+
+
+def run_mode(
+    name: str, command: List[str], env: Dict[str, str], port: int, args: argparse.Namespace, documents: List[Path]
+) -> Dict[str, Any]:
+    url = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        started = time.time()
+        wait_ready(url, args.startup_timeout, confirmations=2 * args.workers if name == "gunicorn" else 1)
+        startup_seconds = time.time() - started
+        idle = memory_bytes(server.pid)
+
+        sampler = MemorySampler(server.pid)
+        sampler.start()
+        result = load(url, documents, args.concurrency, args.duration)
+        sampler.stopped.set()
+        sampler.join()
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+    docs_per_second = result["ok"] / result["seconds"]
+    pss_gib = max(sampler.peak["pss"], idle["pss"]) / GIB
+    return {
+        "mode": name,
+        "startup_seconds": startup_seconds,
+        "documents": result["ok"],
+        "failed": result["failed"],
+        "docs_per_second": docs_per_second,
+        "idle_pss_gib": idle["pss"] / GIB,
+        "peak_pss_gib": pss_gib,
+        "peak_rss_gib": sampler.peak["rss"] / GIB,
+        "docs_per_second_per_gib": docs_per_second / pss_gib if pss_gib else 0.0,
+    }
+
+
+def start_redis(port: int) -> subprocess.Popen:
+    if shutil.which("redis-server") is None:
+        raise SystemExit("Several gunicorn workers need JOB_STORE=redis: install redis-server or pass --redis-url")
+    server = subprocess.Popen(
+        ["redis-server", "--port", str(port), "--save", "", "--appendonly", "no"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    time.sleep(0.5)
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", type=Path, default=Path(__file__).parent / ".corpus", help="corpus directory, generated if missing")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="gunicorn workers")
+    parser.add_argument("--redis-url", help="job store of the gunicorn workers, a redis-server is started if missing")
+    parser.add_argument("--threads", type=int, default=0, help="torch threads per gunicorn worker, 0: CPU quota / workers")
+    parser.add_argument("--concurrency", type=int, default=0, help="concurrent clients, 0: twice the workers")
+    parser.add_argument("--duration", type=float, default=60, help="seconds of load per mode")
+    parser.add_argument("--startup-timeout", type=float, default=600)
+    parser.add_argument("--port", type=int, default=9190)
+    parser.add_argument("--output", type=Path, help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+    args.concurrency = args.concurrency or 2 * args.workers
+
+    documents = sorted(build_corpus(args.corpus))
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join(filter(None, [str(ROOT / "src"), os.environ.get("PYTHONPATH")])),
+        # every request has to convert, and the conversion queue must not turn clients away
+        "RESULT_CACHE_ENABLED": "false",
+        "CONVERSION_MAX_QUEUE": str(args.concurrency),
+        "JOB_WORKERS": "0",
+        "METRICS_ENABLED": "false",
+    }
+    single_env = {**env, "CONVERSION_WORKERS": str(args.workers)}
+    redis = None
+    if args.workers > 1 and not args.redis_url:
+        redis = start_redis(args.port + 2)
+        args.redis_url = f"redis://127.0.0.1:{args.port + 2}/0"
+    gunicorn_env = {**env, "SERVE_WORKERS": str(args.workers), "SERVE_THREADS_PER_WORKER": str(args.threads)}
+    if args.redis_url:
+        gunicorn_env.update(JOB_STORE="redis", REDIS_HOST=args.redis_url)
+
+    try:
+        reports = [
+            run_mode(
+                "uvicorn",
+                [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(args.port)],
+                single_env,
+                args.port,
+                args,
+                documents,
+            ),
+            run_mode(
+                "gunicorn",
+                [sys.executable, "-m", "gunicorn", "main:app", "--bind", f"127.0.0.1:{args.port + 1}"],
+                gunicorn_env,
+                args.port + 1,
+                args,
+                documents,
+            ),
+        ]
+    finally:
+        if redis is not None:
+            redis.terminate()
+
+    single, multi = reports
+    report: Dict[str, Optional[Any]] = {
+        "workers": args.workers,
+        "concurrency": args.concurrency,
+        "modes": reports,
+        "throughput_speedup": multi["docs_per_second"] / single["docs_per_second"] if single["docs_per_second"] else None,
+        "per_gib_speedup": (
+            multi["docs_per_second_per_gib"] / single["docs_per_second_per_gib"] if single["docs_per_second_per_gib"] else None
+        ),
+    }
+
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(payload)
+    else:
+        print(payload)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Deterministic sample corpus (PDF, DOCX, PPTX, HTML, Markdown, image) for the pipeline benchmarks."""
+import io
+from pathlib import Path
+from typing import List
+
+PARAGRAPH = (
+    "The contractor shall deliver the services described in this section within the agreed period. "
+    "Any change to the scope must be approved in writing by both parties before work begins."
+)
+
+
+def _escape_pdf_text(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def build_pdf(num_pages: int) -> bytes:
+    """Born-digital PDF with a heading and a few paragraphs of text per page, written by hand."""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once the page object ids are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+    for page_no in range(1, num_pages + 1):
+        paragraph = [(10, PARAGRAPH[i : i + 90]) for i in range(0, len(PARAGRAPH), 90)]
+        lines = [(18, f"{page_no}. Section {page_no}")] + paragraph * 4
+        ops = ["BT", "72 760 Td"]
+        for size, line in lines:
+            ops += [f"/F1 {size} Tf", f"({_escape_pdf_text(line)}) Tj", f"0 -{size + 8} Td"]
+        ops += ["ET"]
+        content = "\n".join(ops).encode()
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % i for i in page_ids),
+        len(page_ids),
+    )
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % i + obj + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def build_png(text: str, width: int = 800, height: int = 200) -> bytes:
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGB", (width, height), "white")
+    ImageDraw.Draw(image).text((20, 80), text, fill="black")
+    out = io.BytesIO()
+    image.save(out, format="PNG")
+    return out.getvalue()
+
+
+def build_docx(num_sections: int) -> bytes:
+    from docx import Document
+    from docx.shared import Inches
+
+    document = Document()
+    document.add_heading("Service Agreement", level=0)
+    for i in range(1, num_sections + 1):
+        document.add_heading(f"{i}. Section {i}", level=1)
+        document.add_paragraph(PARAGRAPH)
+        document.add_paragraph("First obligation", style="List Bullet")
+        document.add_paragraph("Second obligation", style="List Bullet")
+        table = document.add_table(rows=3, cols=3)
+        for row in range(3):
+            for col in range(3):
+                table.cell(row, col).text = f"R{row}C{col}"
+        if i % 3 == 0:
+            document.add_picture(io.BytesIO(build_png(f"Figure {i}")), width=Inches(4))
+    out = io.BytesIO()
+    document.save(out)
+    return out.getvalue()
+
+
+def build_pptx(num_slides: int) -> bytes:
+    from pptx import Presentation
+    from pptx.util import Inches
+
+    presentation = Presentation()
+    for i in range(1, num_slides + 1):
+        slide = presentation.slides.add_slide(presentation.slide_layouts[1])
+        slide.shapes.title.text = f"Slide {i}"
+        slide.placeholders[1].text = PARAGRAPH
+        slide.shapes.add_picture(io.BytesIO(build_png(f"Chart {i}")), Inches(5), Inches(4), width=Inches(3))
+    out = io.BytesIO()
+    presentation.save(out)
+    return out.getvalue()
+
+
+def build_html(num_sections: int) -> bytes:
+    sections = "".join(
+        f"<h2>{i}. Section {i}</h2><p>{PARAGRAPH}</p><ul><li>First obligation</li><li>Second obligation</li></ul>"
+        f"<table><tr><th>Item</th><th>Price</th></tr><tr><td>Item {i}</td><td>{i * 10}</td></tr></table>"
+        for i in range(1, num_sections + 1)
+    )
+    return f"<!doctype html><html><body><h1>Service Agreement</h1>{sections}</body></html>".encode()
+
+
+def build_markdown(num_sections: int) -> bytes:
+    sections = "".join(
+        f"## {i}. Section {i}\n\n{PARAGRAPH}\n\n- First obligation\n- Second obligation\n\n"
+        f"| Item | Price |\n|---|---|\n| Item {i} | {i * 10} |\n\n"
+        for i in range(1, num_sections + 1)
+    )
+    return f"# Service Agreement\n\n{sections}".encode()
+
+
+def build_corpus(directory: Path, scale: int = 1) -> List[Path]:
+    """Write the corpus of `scale` to its own sub-directory of `directory` (idempotent) and return the file paths in a
+    fixed order."""
+    # files of another scale have the same names, they must not be picked up
+    directory = directory / f"scale-{scale}"
+    directory.mkdir(parents=True, exist_ok=True)
+    files = {
+        "contract.pdf": lambda: build_pdf(20 * scale),
+        "agreement.docx": lambda: build_docx(15 * scale),
+        "deck.pptx": lambda: build_pptx(10 * scale),
+        "page.html": lambda: build_html(30 * scale),
+        "notes.md": lambda: build_markdown(30 * scale),
+        "scan.png": lambda: build_png("Invoice 2024-001 total due 1,250.00 EUR", 1200, 400),
+    }
+    paths = []
+    for name, build in files.items():
+        path = directory / name
+        if not path.exists():
+            path.write_bytes(build())
+        paths.append(path)
+    return paths
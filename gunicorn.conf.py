@@ -0,0 +1,41 @@
+"""Production serving: `gunicorn main:app` (this file is picked up from the working directory).
+
+The master imports docling and loads the default pipeline before forking, so the workers share the model weights
+copy-on-write. SERVE_WORKERS and SERVE_THREADS_PER_WORKER default to the container's CPU quota.
+"""
+from doc_parser import metrics
+from doc_parser.serving import limit_threads, preload, serving_plan
+from doc_parser.settings import METRICS_MULTIPROCESS_DIR, SERVE_TIMEOUT
+
+workers, threads = serving_plan()
+# before anything imports torch in the master, the workers inherit the environment
+limit_threads(threads)
+
+bind = "0.0.0.0:9090"
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+# conversions of large documents hold a worker for minutes
+timeout = SERVE_TIMEOUT
+graceful_timeout = 30
+
+
+def on_starting(server):
+    server.log.info(f"Serving with {workers} workers of {threads} threads")
+    if workers > 1:
+        # every worker has its own registry, /metrics merges their snapshots
+        metrics.enable_multiprocess(METRICS_MULTIPROCESS_DIR)
+
+
+def when_ready(server):
+    # after the listening socket is bound: connections wait in its backlog during the preload instead of being
+    # refused, the startupProbe of the pod covers the time until the first worker answers
+    preload()
+
+
+def post_fork(server, worker):
+    limit_threads(threads)
+    metrics.start_snapshots()
+
+
+def child_exit(server, worker):
+    metrics.mark_process_dead(worker.pid)
@@ -1,9 +1,71 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from doc_parser.route import router as doc_parser_router
+from doc_parser.metrics import server_timing
+from doc_parser.settings import CONVERTER_POOL_WARM_UP, FAST_PATH_ENABLED, JOB_WORKERS, STARTUP_SAMPLE_CONVERSION
+from doc_parser.startup import StartupState, convert_sample_document, health_router, startup, startup_gate
+from doc_parser.uploads import limit_request_size
+
+# set once the routes are imported, see start_service
+services = {}
+
+
+def start_service(state: StartupState) -> None:
+    # docling and torch are only imported here, on the startup thread, so /health/live answers right away
+    with state.phase("import"):
+        from doc_parser import fastpath, sharding
+        from doc_parser.jobs import ConversionWorkerPool
+        from doc_parser.route import (
+            router as doc_parser_router,
+            conversion_executor,
+            converter,
+            ingestion,
+            job_store,
+            text_conversion_executor,
+        )
+
+    app.include_router(doc_parser_router, prefix="", tags=["doc-parser"])
+    # the schema may have been generated before the conversion routes existed
+    app.openapi_schema = None
+    services["conversion_executor"] = conversion_executor
+    services["text_conversion_executor"] = text_conversion_executor
+    services["ingestion"] = ingestion
+    # spawned on the first sharded PDF, its workers would outlive the server
+    services["sharding"] = sharding
+
+    if CONVERTER_POOL_WARM_UP:
+        with state.phase("pipeline"):
+            converter.warm_up()
+    if FAST_PATH_ENABLED:
+        with state.phase("fast_path"):
+            fastpath.warm_up()
+    if STARTUP_SAMPLE_CONVERSION:
+        with state.phase("sample"):
+            convert_sample_document(converter)
 
-app = FastAPI()
+    # API pods can set JOB_WORKERS=0 and leave the queue to `python -m doc_parser.worker`
+    workers = ConversionWorkerPool(job_store, converter, num_workers=JOB_WORKERS)
+    if JOB_WORKERS > 0:
+        workers.start()
+    services["workers"] = workers
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup.start(start_service)
+    yield
+    if "workers" in services:
+        services["workers"].stop(timeout=5)
+    for name in ("conversion_executor", "text_conversion_executor", "sharding"):
+        if name in services:
+            services[name].shutdown(wait=False)
+    if "ingestion" in services:
+        services["ingestion"].shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 app.add_middleware(
@@ -14,5 +76,9 @@ app.add_middleware(
     allow_credentials=True,
 )
 
+app.middleware("http")(limit_request_size)
+app.middleware("http")(server_timing)
+app.middleware("http")(startup_gate)
+
 
-app.include_router(doc_parser_router, prefix="", tags=["doc-parser"])
+app.include_router(health_router, tags=["health"])
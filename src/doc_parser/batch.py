@@ -0,0 +1,188 @@
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from doc_parser.resources import available_cpus
+from doc_parser.schema import ConversionResult
+from doc_parser.settings import BATCH_DOCUMENT_TIMEOUT, BATCH_WORKERS, logger
+from doc_parser.uploads import DocumentSource
+
+
+class BatchPool(ThreadPoolExecutor):
+    """Thread pool that counts the workers still held by conversions that timed out.
+
+    Threads can't be interrupted, a timed-out conversion keeps its worker until it ends on its own, so those
+    workers are busy for every batch even though no batch waits for them.
+    """
+
+    def __init__(self, max_workers: int, thread_name_prefix: str = "batch"):
+        super().__init__(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self.max_workers = max_workers
+        self.abandoned = 0
+        self._abandoned_lock = threading.Lock()
+
+    @property
+    def free_workers(self) -> int:
+        with self._abandoned_lock:
+            return self.max_workers - self.abandoned
+
+    def abandon(self, future: Future) -> None:
+        """Count the worker of the timed-out `future` as busy until it returns."""
+        with self._abandoned_lock:
+            self.abandoned += 1
+        future.add_done_callback(self._release)
+
+    def _release(self, _: Future) -> None:
+        with self._abandoned_lock:
+            self.abandoned -= 1
+
+
+# (start times, input index) of the batch document the current task converts
+_current_document: contextvars.ContextVar[Optional[Tuple[Dict[int, float], int]]] = contextvars.ContextVar(
+    "batch_document", default=None
+)
+
+
+@contextmanager
+def holding(lock: threading.Lock) -> Iterator[None]:
+    """Hold `lock`, not counting the wait for it against the timeout of the batch document being converted.
+
+    Documents of a batch that share a converter take turns on its lock, the deadline of each one starts once it has
+    the converter rather than while it is queued behind its siblings.
+    """
+    current = _current_document.get()
+    if current is None:
+        with lock:
+            yield
+        return
+
+    started, index = current
+    started.pop(index, None)
+    with lock:
+        started[index] = time.monotonic()
+        yield
+
+
+_batch_executor: Optional[BatchPool] = None
+_batch_executor_lock = threading.Lock()
+
+
+def _get_batch_executor() -> BatchPool:
+    """Shared by every batch request, so concurrent batches together stay within the CPU quota."""
+    global _batch_executor
+    with _batch_executor_lock:
+        if _batch_executor is None:
+            _batch_executor = BatchPool(max_workers=BATCH_WORKERS or available_cpus())
+        return _batch_executor
+
+
+class BatchEngine:
+    """Converts and chunks the documents of a batch concurrently, one task per document.
+
+    A document that fails or runs past `timeout` seconds becomes a ConversionResult with an error, the other
+    documents are unaffected. Threads can't be interrupted, so a timed-out conversion keeps its worker until it
+    ends on its own; its result is discarded. While every worker is held that way, documents that haven't
+    started fail right away instead of waiting for them.
+    """
+
+    def __init__(self, executor: Optional[BatchPool] = None, timeout: Optional[float] = BATCH_DOCUMENT_TIMEOUT):
+        self._executor = executor
+        self.timeout = timeout
+
+    @property
+    def executor(self) -> BatchPool:
+        return self._executor or _get_batch_executor()
+
+    @staticmethod
+    def _run(
+        convert: Callable[[Tuple[str, DocumentSource]], ConversionResult],
+        document: Tuple[str, DocumentSource],
+        started: Dict[int, float],
+        index: int,
+    ) -> ConversionResult:
+        started[index] = time.monotonic()
+        _current_document.set((started, index))
+        try:
+            return convert(document)
+        except Exception as e:
+            logger.exception(f"Failed to convert {document[0]}: {e}")
+            return ConversionResult(filename=document[0], error=str(e) or type(e).__name__)
+
+    def iter_results(
+        self,
+        convert: Callable[[Tuple[str, DocumentSource]], ConversionResult],
+        documents: List[Tuple[str, DocumentSource]],
+        ordered: bool = True,
+        timeout: Optional[float] = None,
+    ) -> Iterator[Tuple[int, ConversionResult]]:
+        """Yield (input index, result) for every document, in input order or as soon as each one finishes.
+
+        `timeout` is counted per document from the moment a worker picks it up, not from submission, and restarts
+        once it has its converter (see `holding`).
+        """
+        timeout = timeout or self.timeout
+        executor = self.executor
+        started: Dict[int, float] = {}
+        futures: Dict[Future, int] = {}
+        for index, document in enumerate(documents):
+            # each task runs in a copy of the caller's context, so its stages show up in the request's timings
+            future = executor.submit(
+                contextvars.copy_context().run, self._run, convert, document, started, index
+            )
+            futures[future] = index
+
+        results: Dict[int, ConversionResult] = {}
+        next_index = 0
+        pending = set(futures)
+        try:
+            while pending:
+                wait_seconds = self._next_deadline(started, futures, pending, timeout)
+                done, pending = wait(pending, timeout=wait_seconds, return_when=FIRST_COMPLETED)
+                finished = [(futures[future], future.result()) for future in done]
+
+                if timeout:
+                    now = time.monotonic()
+                    for future in list(pending):
+                        index = futures[future]
+                        # workers take documents out of `started` while they wait for a converter
+                        start = started.get(index)
+                        if start is not None and now - start >= timeout:
+                            error = f"Conversion timed out after {timeout:g}s"
+                            if not future.cancel():
+                                executor.abandon(future)
+                        elif executor.free_workers <= 0 and future.cancel():
+                            error = "Every batch worker is held by a conversion that timed out"
+                        else:
+                            continue
+                        pending.discard(future)
+                        logger.error(f"Failed to convert {documents[index][0]}: {error}")
+                        finished.append((index, ConversionResult(filename=documents[index][0], error=error)))
+
+                if not ordered:
+                    yield from finished
+                    continue
+
+                # hold results back until every document before them is done
+                results.update(finished)
+                while next_index in results:
+                    yield next_index, results.pop(next_index)
+                    next_index += 1
+        finally:
+            # the client went away or the caller stopped early, drop what hasn't started yet
+            for future in pending:
+                future.cancel()
+
+    @staticmethod
+    def _next_deadline(
+        started: Dict[int, float], futures: Dict[Future, int], pending: set, timeout: Optional[float]
+    ) -> Optional[float]:
+        if not timeout:
+            return None
+        starts = [start for future in pending if (start := started.get(futures[future])) is not None]
+        if len(starts) < len(pending):
+            # queued documents have no deadline yet, look again shortly after they may have started
+            return min([max(0.0, start + timeout - time.monotonic()) for start in starts] + [1.0])
+        return max(0.0, min(starts) + timeout - time.monotonic())
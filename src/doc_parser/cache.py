@@ -0,0 +1,229 @@
+import os
+import time
+import tempfile
+import threading
+from concurrent.futures import Future
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from doc_parser.settings import REDIS_HOST, logger
+
+
+class CacheTier(ABC):
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: bytes) -> None:
+        pass
+
+
+class MemoryCacheTier(CacheTier):
+    """LRU of serialised values bounded by their total size in bytes."""
+
+    def __init__(self, max_bytes: int, ttl: int):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+
+    def _pop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+
+class DiskCacheTier(CacheTier):
+    """One file per key, expired by mtime and evicted oldest-first when over `max_bytes`."""
+
+    def __init__(self, directory: str, max_bytes: int, ttl: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(size for _, _, size in self._scan())
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def _scan(self) -> List[Tuple[float, str, int]]:
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, path, stat.st_size))
+        return entries
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            if os.path.getmtime(path) + self.ttl < time.time():
+                self._remove(path)
+                return None
+            with open(path, "rb") as f:
+                value = f.read()
+            # refresh mtime so eviction is least-recently-used
+            os.utime(path)
+            return value
+        except FileNotFoundError:
+            return None
+
+    def set(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as f:
+            f.write(value)
+        self._remove(path)
+        os.replace(f.name, path)
+        with self._lock:
+            self.size += len(value)
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def _remove(self, path: str) -> None:
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            self.size -= size
+
+    def _evict(self) -> None:
+        entries = sorted(self._scan())
+        self.size = sum(size for _, _, size in entries)
+        for _, path, size in entries:
+            if self.size <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+                self.size -= size
+            except FileNotFoundError:
+                pass
+
+
+class RedisCacheTier(CacheTier):
+    """Shared tier, size-based eviction is left to the Redis `maxmemory-policy` (e.g. allkeys-lru)."""
+
+    def __init__(self, ttl: int, url: str = REDIS_HOST, prefix: str = "doc_parser:cache"):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("Redis is not installed. Please install it via `pip install redis` to use the Redis cache.")
+
+        self.ttl = ttl
+        self.prefix = prefix
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(f"{self.prefix}:{key}")
+
+    def set(self, key: str, value: bytes) -> None:
+        self.client.set(f"{self.prefix}:{key}", value, ex=self.ttl)
+
+
+class TieredCache:
+    """Looks keys up tier by tier, promoting lower-tier hits into the tiers above."""
+
+    def __init__(self, tiers: List[CacheTier]):
+        self.tiers = tiers
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        for i, tier in enumerate(self.tiers):
+            try:
+                value = tier.get(key)
+            except Exception as e:
+                logger.warning(f"Cache tier {type(tier).__name__} failed to read {key}: {e}")
+                continue
+            if value is not None:
+                for upper in self.tiers[:i]:
+                    upper.set(key, value)
+                self.hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    def set(self, key: str, value: bytes) -> None:
+        for tier in self.tiers:
+            try:
+                tier.set(key, value)
+            except Exception as e:
+                logger.warning(f"Cache tier {type(tier).__name__} failed to write {key}: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+class SingleFlight:
+    """De-duplicates in-flight calls: concurrent submissions for the same key share one future."""
+
+    def __init__(self):
+        self._calls: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key: str, start: Callable[[], Future]) -> Future:
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future
+            future = start()
+            self._calls[key] = future
+        future.add_done_callback(lambda _: self._forget(key, future))
+        return future
+
+    def _forget(self, key: str, future: Future) -> None:
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+
+
+def create_cache(
+    memory_mb: int,
+    backend: str,
+    ttl: int,
+    directory: Optional[str] = None,
+    disk_mb: int = 0,
+    namespace: str = "results",
+) -> TieredCache:
+    tiers: List[CacheTier] = [MemoryCacheTier(max_bytes=memory_mb * 1024 * 1024, ttl=ttl)]
+    if backend == "disk":
+        tiers.append(DiskCacheTier(directory, max_bytes=disk_mb * 1024 * 1024, ttl=ttl))
+    elif backend == "redis":
+        tiers.append(RedisCacheTier(ttl=ttl, prefix=f"doc_parser:cache:{namespace}"))
+    elif backend != "none":
+        raise ValueError(f"Unsupported cache backend: {backend}")
+    return TieredCache(tiers)
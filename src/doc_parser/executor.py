@@ -0,0 +1,239 @@
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Optional
+
+from fastapi import HTTPException
+
+from doc_parser.metrics import collect_timings, merge_timings
+from doc_parser.scheduling import Scheduler, Ticket
+from doc_parser.settings import (
+    CONVERSION_EXECUTOR,
+    CONVERSION_MAX_QUEUE,
+    CONVERSION_RETRY_AFTER,
+    CONVERSION_WORKERS,
+    SCHEDULER_POLICY,
+    logger,
+)
+
+
+class _RemoteHTTPException(Exception):
+    """Picklable stand-in for HTTPException raised inside a worker process."""
+
+    def __init__(self, status_code: int, detail: Any):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _invoke(fn: Callable, args: tuple, kwargs: Dict[str, Any]):
+    started_at = time.time()
+    # stage timings travel back with the result, worker processes don't share the caller's context
+    with collect_timings() as timings:
+        try:
+            return started_at, fn(*args, **kwargs), timings
+        except HTTPException as e:
+            raise _RemoteHTTPException(e.status_code, e.detail)
+
+
+class ConversionExecutor:
+    """Thread or process pool with a bounded admission queue.
+
+    At most `max_workers` conversions run at once and `max_queue` more may wait; anything beyond
+    that is rejected with 503 and a Retry-After header so the client backs off instead of piling up.
+    Waiting conversions start in the order of the scheduler `policy`, by the cost on their Ticket.
+    """
+
+    def __init__(
+        self,
+        kind: str = CONVERSION_EXECUTOR,
+        max_workers: int = CONVERSION_WORKERS,
+        max_queue: int = CONVERSION_MAX_QUEUE,
+        retry_after: int = CONVERSION_RETRY_AFTER,
+        initializer: Optional[Callable[[], None]] = None,
+        policy: str = SCHEDULER_POLICY,
+    ):
+        self.kind = kind
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.retry_after = retry_after
+        self.initializer = initializer
+        # the pool only ever gets as many tasks as it has workers, the scheduler decides who goes next
+        self.scheduler = Scheduler(self.max_workers, policy=policy)
+        self._pool: Optional[Executor] = None
+        self._stream_pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds_total = 0.0
+        self.wait_samples = 0
+        self.last_wait_seconds = 0.0
+
+    def _get_pool(self) -> Executor:
+        if self._pool is None:
+            if self.kind == "process":
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers, initializer=self.initializer)
+            elif self.kind == "thread":
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="conversion")
+            else:
+                raise ValueError(f"Unsupported conversion executor: {self.kind}")
+        return self._pool
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.max_queue
+
+    @property
+    def running(self) -> int:
+        # pool workers pick up work as soon as they are idle, so everything past max_workers is waiting
+        return min(self.admitted, self.max_workers)
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self.admitted - self.max_workers)
+
+    def _admit(self) -> None:
+        with self._lock:
+            if self.admitted >= self.capacity:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=503,
+                    detail="The conversion queue is full, please retry later",
+                    headers={"Retry-After": str(self.retry_after)},
+                )
+            self.admitted += 1
+
+    def _release(self) -> None:
+        with self._lock:
+            self.admitted -= 1
+            self.completed += 1
+
+    def _free_slot(self) -> None:
+        self.scheduler.release()
+        self._release()
+
+    async def run(self, fn: Callable, *args, ticket: Optional[Ticket] = None, **kwargs):
+        self._admit()
+
+        submitted_at = time.time()
+        try:
+            await self.scheduler.acquire(ticket or Ticket())
+        except BaseException:
+            self._release()
+            raise
+        future = None
+        try:
+            # the worker reports when it actually started so queue wait is measured across processes too
+            future = self._get_pool().submit(_invoke, fn, args, kwargs)
+            started_at, result, timings = await asyncio.wrap_future(future)
+        except _RemoteHTTPException as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+        finally:
+            if future is None:
+                self._free_slot()
+            else:
+                # a request cancelled by a client disconnect stops waiting, but the worker keeps converting: the slot
+                # is only free once the worker is. Nothing is awaited, a cancelled task can't await
+                future.add_done_callback(lambda _: self._free_slot())
+
+        # add the worker's stages to this request; histograms of a worker process are never scraped,
+        # so with a process pool they are observed again here
+        merge_timings(timings, observe=self.kind == "process")
+
+        wait_seconds = max(0.0, started_at - submitted_at)
+        with self._lock:
+            self.last_wait_seconds = wait_seconds
+            self.wait_seconds_total += wait_seconds
+            self.wait_samples += 1
+        if wait_seconds > 1:
+            logger.info(f"Conversion waited {wait_seconds:.2f}s in the queue")
+        return result
+
+    async def iterate(
+        self, fn: Callable[..., Iterable], *args, ticket: Optional[Ticket] = None, **kwargs
+    ) -> AsyncIterator:
+        """Admit `fn` once and pull its items one by one on a worker thread, for streaming responses.
+
+        Generators can't cross process boundaries, so with a process executor streams run on threads.
+        """
+        self._admit()
+        if self.kind == "thread":
+            pool = self._get_pool()
+        else:
+            if self._stream_pool is None:
+                self._stream_pool = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="conversion-stream"
+                )
+            pool = self._stream_pool
+
+        # every step runs in the same copied context, so the generator sees the request's timings
+        context = contextvars.copy_context()
+        iterator = None
+        step: Optional[Future] = None
+        done = object()
+        try:
+            await self.scheduler.acquire(ticket or Ticket())
+        except BaseException:
+            self._release()
+            raise
+
+        def close() -> None:
+            # runs once no step is in flight, so the context isn't entered and the generator isn't executing
+            nonlocal iterator
+            try:
+                if iterator is None and step is not None and not step.cancelled() and step.exception() is None:
+                    # cancelled while the generator was being created
+                    iterator = step.result()
+                if iterator is not None and hasattr(iterator, "close"):
+                    context.run(iterator.close)
+            except Exception as e:
+                logger.warning(f"Closing a conversion stream failed: {e}")
+            finally:
+                self._free_slot()
+
+        try:
+            step = pool.submit(context.run, lambda: iter(fn(*args, **kwargs)))
+            iterator = await asyncio.wrap_future(step)
+            while True:
+                step = pool.submit(context.run, next, iterator, done)
+                item = await asyncio.wrap_future(step)
+                if item is done:
+                    break
+                yield item
+        finally:
+            if step is not None and not step.done():
+                # after a client disconnect the last step still runs on its worker, the generator is closed on that
+                # thread once it returns
+                step.add_done_callback(lambda _: close())
+            else:
+                try:
+                    pool.submit(close)
+                except RuntimeError:
+                    # the pool was shut down
+                    close()
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+            self._pool = None
+        if self._stream_pool is not None:
+            self._stream_pool.shutdown(wait=wait, cancel_futures=True)
+            self._stream_pool = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "kind": self.kind,
+                "policy": self.scheduler.policy,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queue_depth": self.queue_depth,
+                "running": self.running,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "last_wait_seconds": self.last_wait_seconds,
+                "avg_wait_seconds": self.wait_seconds_total / self.wait_samples if self.wait_samples else 0.0,
+            }
@@ -0,0 +1,84 @@
+"""Fast path for text-native formats: Markdown, HTML and AsciiDoc.
+
+docling parses these with a declarative backend and no models, yet a DocumentConverter still sets up a pipeline
+per format and pulls in the import graph of the PDF pipeline (torch, EasyOCR). Here the backend is instantiated
+directly, in spawned processes that only import this module, so the parse never waits on a model-bound worker
+or the GIL of a running conversion.
+"""
+import multiprocessing
+from io import BytesIO
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Tuple, Type, Union
+
+from docling.backend.abstract_backend import DeclarativeDocumentBackend
+from docling.backend.asciidoc_backend import AsciiDocBackend
+from docling.backend.html_backend import HTMLDocumentBackend
+from docling.backend.md_backend import MarkdownDocumentBackend
+from docling.datamodel.base_models import InputFormat
+from docling.datamodel.document import InputDocument
+from docling_core.types.doc.document import DoclingDocument as DLDocument
+
+from doc_parser.settings import FAST_PATH_WORKERS, logger
+
+# The backends DocumentConverter would pick for these formats
+FAST_PATH_BACKENDS: Dict[InputFormat, Type[DeclarativeDocumentBackend]] = {
+    InputFormat.MD: MarkdownDocumentBackend,
+    InputFormat.HTML: HTMLDocumentBackend,
+    InputFormat.ASCIIDOC: AsciiDocBackend,
+}
+
+_fast_path_executor: Optional[ProcessPoolExecutor] = None
+
+
+def parse_document(
+    filename: str, file: Union[Path, bytes], input_format: InputFormat
+) -> Tuple[Optional[DLDocument], Optional[str]]:
+    """Parse a document with its backend, returns the document or the error."""
+    in_doc = InputDocument(
+        path_or_stream=file if isinstance(file, Path) else BytesIO(file),
+        format=input_format,
+        backend=FAST_PATH_BACKENDS[input_format],
+        filename=filename,
+    )
+    if not in_doc.valid:
+        return None, f"Input document {filename} is not valid."
+
+    try:
+        return in_doc._backend.convert(), None
+    except Exception as e:
+        return None, str(e)
+    finally:
+        in_doc._backend.unload()
+
+
+def _get_fast_path_executor() -> ProcessPoolExecutor:
+    global _fast_path_executor
+    if _fast_path_executor is None:
+        # spawn rather than fork, a forked child would inherit the parent's torch and model memory
+        _fast_path_executor = ProcessPoolExecutor(
+            max_workers=FAST_PATH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _fast_path_executor
+
+
+def convert_text_document(
+    filename: str, file: Union[Path, BytesIO], input_format: InputFormat
+) -> Tuple[Optional[DLDocument], Optional[str]]:
+    # spooled uploads are passed by path, the workers read them from the same disk
+    payload = file if isinstance(file, Path) else file.getvalue()
+    if FAST_PATH_WORKERS == 0:
+        return parse_document(filename, payload, input_format)
+    return _get_fast_path_executor().submit(parse_document, filename, payload, input_format).result()
+
+
+def warm_up() -> None:
+    """Start the fast path workers and import the backends in them ahead of the first request."""
+    if FAST_PATH_WORKERS == 0:
+        return
+    executor = _get_fast_path_executor()
+    futures = [executor.submit(parse_document, "warm-up.md", b"# Warm-up\n", InputFormat.MD) for _ in range(FAST_PATH_WORKERS)]
+    for future in futures:
+        future.result()
+    logger.info(f"Warmed up {FAST_PATH_WORKERS} fast path workers")
@@ -0,0 +1,165 @@
+"""Incremental re-conversion of revised PDFs.
+
+Every page is fingerprinted from its text layer and a low-resolution rendering, and converted on its own into a
+one-page DoclingDocument kept in a page store under that fingerprint. A later revision of the document only
+converts the pages whose fingerprint is not in the store; the page documents are then spliced back together with
+`merge_documents` and chunked as a whole, so chunks still merge across page boundaries.
+"""
+import json
+import hashlib
+from io import BytesIO
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import pypdfium2 as pdfium
+from docling_core.types.doc.document import DoclingDocument as DLDocument
+
+from doc_parser.cache import TieredCache, create_cache
+from doc_parser.settings import (
+    OCR_MODE,
+    OCR_TEXT_COVERAGE,
+    PAGE_CACHE_BACKEND,
+    PAGE_CACHE_DIR,
+    PAGE_CACHE_DISK_MB,
+    PAGE_CACHE_ENABLED,
+    PAGE_CACHE_MEMORY_MB,
+    PAGE_CACHE_TTL,
+    PAGE_FINGERPRINT_SCALE,
+    logger,
+)
+from doc_parser.sharding import merge_documents
+from doc_parser.uploads import DocumentSource
+
+# (filename, page document or None, error or None, pages OCR'd) for each page PDF, as yielded by
+# DoclingDocumentConversion._iter_converted
+ConvertPages = Callable[..., Iterator[Tuple[str, Optional[DLDocument], Optional[str], Optional[int]]]]
+
+
+def page_fingerprint(page: pdfium.PdfPage, scale: float = PAGE_FINGERPRINT_SCALE) -> str:
+    """SHA-256 of the page geometry, its text layer and a grayscale rendering at `scale` (1 = 72 dpi).
+
+    Re-exporting a document renames font subsets and renumbers objects, so the raw page bytes change even when
+    the page does not; what is drawn and the text docling parses from it do not.
+    """
+    digest = hashlib.sha256(json.dumps([page.get_width(), page.get_height(), page.get_rotation()]).encode())
+
+    textpage = page.get_textpage()
+    try:
+        digest.update(textpage.get_text_bounded().encode("utf-8", "surrogatepass"))
+    finally:
+        textpage.close()
+
+    bitmap = page.render(scale=scale, grayscale=True)
+    try:
+        digest.update(bytes(bitmap.buffer))
+    finally:
+        bitmap.close()
+    return digest.hexdigest()
+
+
+def _page_pdf(pdf: pdfium.PdfDocument, index: int) -> bytes:
+    page_pdf = pdfium.PdfDocument.new()
+    try:
+        page_pdf.import_pages(pdf, pages=[index])
+        buffer = BytesIO()
+        page_pdf.save(buffer)
+        return buffer.getvalue()
+    finally:
+        page_pdf.close()
+
+
+def splice(documents: List[Tuple[int, DLDocument]], filename: str) -> DLDocument:
+    """Merge the page documents and name the result after the uploaded file, not after the page PDFs."""
+    dl_doc = merge_documents(documents)
+    dl_doc.name = Path(filename).stem
+    if dl_doc.origin is not None:
+        dl_doc.origin = dl_doc.origin.model_copy(update={"filename": filename})
+    return dl_doc
+
+
+class PageStore:
+    """Converted one-page documents, keyed by page fingerprint and the pipeline options that produced them."""
+
+    def __init__(self, cache: TieredCache):
+        self.cache = cache
+
+    @staticmethod
+    def key(fingerprint: str, **pipeline_kwargs) -> str:
+        digest = hashlib.sha256(fingerprint.encode())
+        params = {**pipeline_kwargs, "ocr": [OCR_MODE, OCR_TEXT_COVERAGE]}
+        digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[DLDocument]:
+        payload = self.cache.get(key)
+        return DLDocument.model_validate_json(payload) if payload is not None else None
+
+    def set(self, key: str, document: DLDocument) -> None:
+        self.cache.set(key, document.model_dump_json().encode())
+
+    def convert(
+        self,
+        convert_pages: ConvertPages,
+        filename: str,
+        source: DocumentSource,
+        **pipeline_kwargs,
+    ) -> Tuple[List[Tuple[int, DLDocument]], Optional[str], Optional[int], List[int]]:
+        """Convert the pages of a PDF missing from the store.
+
+        Returns the page documents with their page offsets for `merge_documents`, the first error, the pages
+        OCR'd in this conversion and the (1-based) pages taken from the store.
+        """
+        pdf = pdfium.PdfDocument(source)
+        try:
+            keys = []
+            for index in range(len(pdf)):
+                page = pdf[index]
+                try:
+                    keys.append(self.key(page_fingerprint(page), **pipeline_kwargs))
+                finally:
+                    page.close()
+
+            documents: Dict[int, DLDocument] = {}
+            for index, key in enumerate(keys):
+                if (document := self.get(key)) is not None:
+                    documents[index] = document
+            reused_pages = [index + 1 for index in sorted(documents)]
+
+            # the same page can appear twice in a document, it is converted once
+            missing: Dict[str, List[int]] = {}
+            for index, key in enumerate(keys):
+                if index not in documents:
+                    missing.setdefault(key, []).append(index)
+            page_pdfs = {f"{filename}.page-{indices[0] + 1}.pdf": (key, indices) for key, indices in missing.items()}
+            sources = [(name, BytesIO(_page_pdf(pdf, indices[0]))) for name, (_, indices) in page_pdfs.items()]
+        finally:
+            pdf.close()
+
+        ocr_pages = None
+        for name, document, error, page_ocr_pages in convert_pages(sources, **pipeline_kwargs):
+            key, indices = page_pdfs[name]
+            if error:
+                return [], f"Page {indices[0] + 1}: {error}", None, []
+            self.set(key, document)
+            documents.update((index, document) for index in indices)
+            if page_ocr_pages is not None:
+                ocr_pages = (ocr_pages or 0) + page_ocr_pages
+
+        logger.info(f"Converted {len(missing)} of the {len(keys)} pages of {filename}, {len(reused_pages)} reused")
+        return sorted(documents.items()), None, ocr_pages, reused_pages
+
+
+page_store = (
+    PageStore(
+        create_cache(
+            memory_mb=PAGE_CACHE_MEMORY_MB,
+            backend=PAGE_CACHE_BACKEND,
+            ttl=PAGE_CACHE_TTL,
+            directory=PAGE_CACHE_DIR,
+            disk_mb=PAGE_CACHE_DISK_MB,
+            namespace="pages",
+        )
+    )
+    if PAGE_CACHE_ENABLED
+    else None
+)
@@ -0,0 +1,415 @@
+"""Bulk conversion of documents stored in S3, without passing them through the API.
+
+An ingestion job takes document URIs or a prefix, downloads the documents with a shared connection-pooled client
+while the previous ones convert, converts them through DocumentConverterService like a batch and writes each
+ConversionResult as JSON under a target prefix. Each result records the ETag of its document, a result with the
+current ETag marks the document as done, so submitting the same job again after a failure or restart only converts
+what is left.
+
+Run a job without the API with `python -m doc_parser.ingestion --prefix s3://bucket/in/ --target s3://bucket/out/`.
+"""
+import os
+import sys
+import shutil
+import asyncio
+import argparse
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Deque, Dict, List, NamedTuple, Optional, Tuple
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from fastapi import HTTPException
+
+from doc_parser.preflight import estimate_documents
+from doc_parser.scheduling import Ticket
+from doc_parser.schema import ConversionResult, IngestionJobResult, S3IngestionRequest
+from doc_parser.settings import (
+    IMAGE_POLICY,
+    INGESTION_PREFETCH,
+    INGESTION_PRIORITY,
+    INGESTION_WORKERS,
+    S3_ENDPOINT_URL,
+    S3_REGION,
+    UPLOAD_MAX_FILE_MB,
+    UPLOAD_SPOOL_DIR,
+    logger,
+)
+from doc_parser.utils import FormatToExtensions
+
+SUPPORTED_EXTENSIONS = {extension for extensions in FormatToExtensions.values() for extension in extensions}
+
+# the progress of every job is written under the target prefix, next to the results
+PROGRESS_PREFIX = "_ingestion-jobs/"
+# user metadata of a result, the ETag of the document it was converted from
+SOURCE_ETAG_METADATA = "source-etag"
+# tenant of the ingestion windows for the scheduler, with SCHEDULER_POLICY=fair they share the workers with the API
+INGESTION_TENANT = "ingestion"
+
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+
+class S3Object(NamedTuple):
+    bucket: str
+    key: str
+    size: int
+    last_modified: datetime
+    etag: str
+    # key of its ConversionResult in the target bucket
+    result_key: str
+
+    @property
+    def uri(self) -> str:
+        return f"s3://{self.bucket}/{self.key}"
+
+
+def parse_s3_uri(uri: str) -> Tuple[str, str]:
+    """Split `s3://bucket/key` into bucket and key, raises ValueError on anything else."""
+    if not uri.startswith("s3://"):
+        raise ValueError(f"Not an s3:// URI: {uri}")
+    bucket, _, key = uri[len("s3://"):].partition("/")
+    if not bucket:
+        raise ValueError(f"No bucket in {uri}")
+    return bucket, key
+
+
+def _as_directory(prefix: str) -> str:
+    return prefix if not prefix or prefix.endswith("/") else f"{prefix}/"
+
+
+def _is_supported(key: str) -> bool:
+    return not key.endswith("/") and key.rsplit(".", 1)[-1].lower() in SUPPORTED_EXTENSIONS
+
+
+def get_s3_client():
+    """Shared, connection-pooled S3 client (boto3 clients are thread-safe)."""
+    global _s3_client
+    with _s3_client_lock:
+        if _s3_client is None:
+            _s3_client = boto3.client(
+                "s3",
+                endpoint_url=S3_ENDPOINT_URL,
+                region_name=S3_REGION,
+                config=Config(
+                    # the prefetched downloads of every job, plus listings and result uploads
+                    max_pool_connections=max(1, INGESTION_WORKERS) * (max(1, INGESTION_PREFETCH) + 2),
+                    retries={"mode": "standard"},
+                    # S3-compatible stores are addressed by path rather than by bucket sub-domain
+                    s3={"addressing_style": "path"} if S3_ENDPOINT_URL else None,
+                ),
+            )
+        return _s3_client
+
+
+class S3Ingestion:
+    """Runs ingestion jobs on `workers` threads and keeps their progress for polling.
+
+    Each job downloads `prefetch` documents ahead: while one window of documents is converted on the batch engine,
+    the next window is downloaded to the spool directory, so at most twice that many are on disk at once. Given the
+    ConversionExecutor of the API, windows queue behind its requests with an INGESTION_PRIORITY Ticket instead of
+    converting next to them.
+    """
+
+    def __init__(
+        self,
+        service,
+        client=None,
+        workers: int = INGESTION_WORKERS,
+        prefetch: int = INGESTION_PREFETCH,
+        executor=None,
+    ):
+        self.service = service
+        self._client = client
+        self.executor = executor
+        # the event loop of the API, the executor admits and schedules conversions on it
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.prefetch = max(1, prefetch)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="ingestion")
+        self._download_executor = ThreadPoolExecutor(
+            max_workers=max(1, workers) * self.prefetch, thread_name_prefix="s3-download"
+        )
+        self._jobs: Dict[str, IngestionJobResult] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    @property
+    def client(self):
+        return self._client or get_s3_client()
+
+    @staticmethod
+    def check(request: S3IngestionRequest) -> None:
+        """Raise ValueError on a request without sources or with malformed URIs, before anything is listed."""
+        if not request.uris and not request.prefix:
+            raise ValueError("Give the documents as uris or a prefix")
+        for uri in [*request.uris, request.target, *([request.prefix] if request.prefix else [])]:
+            parse_s3_uri(uri)
+
+    def submit(self, job_id: str, request: S3IngestionRequest, **kwargs) -> IngestionJobResult:
+        """Start a job in the background, `kwargs` are the conversion parameters."""
+        self.check(request)
+        try:
+            self._loop = asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        progress = IngestionJobResult(job_id=job_id, target=request.target)
+        with self._lock:
+            self._jobs[job_id] = progress
+        self._executor.submit(self.run, progress, request, **kwargs)
+        return self.get(job_id)
+
+    def get(self, job_id: str, target: Optional[str] = None) -> Optional[IngestionJobResult]:
+        """Progress of a job run by this process, else, given its `target`, the progress last written under it.
+
+        Jobs submitted to another replica or before a restart are only found in S3.
+        """
+        with self._lock:
+            progress = self._jobs.get(job_id)
+            if progress is not None:
+                return progress.model_copy(deep=True)
+        return self._load_progress(target, job_id) if target else None
+
+    def shutdown(self) -> None:
+        """Stop running jobs after their current window, they resume when submitted again."""
+        self._stop.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._download_executor.shutdown(wait=False, cancel_futures=True)
+
+    def run(self, progress: IngestionJobResult, request: S3IngestionRequest, **kwargs) -> IngestionJobResult:
+        """Convert the documents of `request` whose result is missing or older than them, updating `progress`."""
+        target_bucket, target_prefix = parse_s3_uri(request.target)
+        target_prefix = _as_directory(target_prefix)
+        try:
+            documents = self._list_documents(request, target_prefix, progress)
+            results = {} if request.overwrite else self._list_results(target_bucket, target_prefix)
+            # one HEAD per result, on the download threads
+            converted = list(
+                self._download_executor.map(
+                    lambda document: self._is_converted(target_bucket, document, results), documents
+                )
+            )
+            pending = [document for document, done in zip(documents, converted) if not done]
+            with self._lock:
+                progress.total = len(documents) + progress.failed
+                progress.skipped = len(documents) - len(pending)
+            # other replicas poll the job from S3 before its first window is done
+            self._save_progress(target_bucket, target_prefix, progress)
+            logger.info(
+                f"Ingestion job {progress.job_id}: {len(pending)} of {progress.total} documents to convert, "
+                f"{progress.skipped} up to date"
+            )
+
+            self._convert(pending, target_bucket, target_prefix, progress, **kwargs)
+        except Exception as e:
+            logger.exception(f"Ingestion job {progress.job_id} failed: {e}")
+            with self._lock:
+                progress.status = "FAILURE"
+                progress.error = str(e) or type(e).__name__
+        else:
+            with self._lock:
+                if progress.converted + progress.skipped + progress.failed < progress.total:
+                    # stopped by shutdown, submitting the job again resumes it
+                    logger.info(f"Ingestion job {progress.job_id} stopped before the end")
+                elif progress.failed and not progress.converted and not progress.skipped:
+                    progress.status = "FAILURE"
+                    progress.error = "All documents failed to convert"
+                else:
+                    progress.status = "SUCCESS"
+        finally:
+            self._save_progress(target_bucket, target_prefix, progress)
+        return progress
+
+    def _fail(self, progress: IngestionJobResult, uri: str, error) -> None:
+        logger.error(f"Failed to ingest {uri}: {error}")
+        with self._lock:
+            progress.failed += 1
+            progress.errors[uri] = str(error) or type(error).__name__
+
+    def _list_documents(
+        self, request: S3IngestionRequest, target_prefix: str, progress: IngestionJobResult
+    ) -> List[S3Object]:
+        documents: Dict[Tuple[str, str], S3Object] = {}
+        for uri in request.uris:
+            bucket, key = parse_s3_uri(uri)
+            if not _is_supported(key):
+                self._fail(progress, uri, f"Unsupported file format: {key}")
+                continue
+            try:
+                head = self.client.head_object(Bucket=bucket, Key=key)
+            except ClientError as e:
+                self._fail(progress, uri, e)
+                continue
+            documents[bucket, key] = S3Object(
+                bucket, key, head["ContentLength"], head["LastModified"], head["ETag"], f"{target_prefix}{key}.json"
+            )
+
+        if request.prefix:
+            bucket, prefix = parse_s3_uri(request.prefix)
+            for page in self.client.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+                for item in page.get("Contents", []):
+                    key = item["Key"]
+                    if not _is_supported(key):
+                        continue
+                    # results mirror the layout under the prefix
+                    result_key = f"{target_prefix}{key[len(prefix):].lstrip('/')}.json"
+                    document = S3Object(bucket, key, item["Size"], item["LastModified"], item["ETag"], result_key)
+                    documents.setdefault((bucket, key), document)
+        return list(documents.values())
+
+    def _list_results(self, bucket: str, prefix: str) -> Dict[str, datetime]:
+        results = {}
+        for page in self.client.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+            for item in page.get("Contents", []):
+                results[item["Key"]] = item["LastModified"]
+        return results
+
+    def _is_converted(self, bucket: str, document: S3Object, results: Dict[str, datetime]) -> bool:
+        """Whether the result of `document` was converted from its current content.
+
+        LastModified has a resolution of one second, a document written again within the second its result was
+        written would look converted, so the ETags are compared. Results that recorded none fall back to it.
+        """
+        if document.result_key not in results:
+            return False
+        try:
+            head = self.client.head_object(Bucket=bucket, Key=document.result_key)
+        except ClientError:
+            return False
+        source_etag = head.get("Metadata", {}).get(SOURCE_ETAG_METADATA)
+        if source_etag is None:
+            return results[document.result_key] >= document.last_modified
+        return source_etag == document.etag
+
+    def _download(self, document: S3Object, directory: Path) -> Path:
+        if document.size > UPLOAD_MAX_FILE_MB * 1024 * 1024:
+            raise ValueError(f"File too large: {document.key}")
+        # one sub-directory per document, docling detects the format from the file name
+        path = Path(tempfile.mkdtemp(dir=directory)) / os.path.basename(document.key)
+        self.client.download_file(document.bucket, document.key, str(path))
+        return path
+
+    def _convert(
+        self, pending: List[S3Object], target_bucket: str, target_prefix: str, progress: IngestionJobResult, **kwargs
+    ) -> None:
+        directory = Path(tempfile.mkdtemp(prefix="doc_parser_s3_", dir=UPLOAD_SPOOL_DIR))
+        queued = iter(pending)
+        downloads: Deque[Tuple[S3Object, Future]] = deque()
+
+        def prefetch() -> None:
+            while len(downloads) < self.prefetch and (document := next(queued, None)) is not None:
+                downloads.append((document, self._download_executor.submit(self._download, document, directory)))
+
+        try:
+            prefetch()
+            while downloads and not self._stop.is_set():
+                window = [downloads.popleft() for _ in range(len(downloads))]
+                # the next window downloads while this one converts
+                prefetch()
+
+                documents: List[Tuple[S3Object, Path]] = []
+                for document, future in window:
+                    try:
+                        documents.append((document, future.result()))
+                    except Exception as e:
+                        self._fail(progress, document.uri, e)
+
+                sources = [(os.path.basename(document.key), path) for document, path in documents]
+                results = self._convert_window(sources, **kwargs) if sources else []
+                for (document, path), result in zip(documents, results):
+                    shutil.rmtree(path.parent, ignore_errors=True)
+                    if result.error:
+                        self._fail(progress, document.uri, result.error)
+                        continue
+                    try:
+                        self.client.put_object(
+                            Bucket=target_bucket,
+                            Key=document.result_key,
+                            Body=result.model_dump_json(exclude_unset=True).encode(),
+                            ContentType="application/json",
+                            Metadata={SOURCE_ETAG_METADATA: document.etag},
+                        )
+                    except Exception as e:
+                        self._fail(progress, document.uri, e)
+                        continue
+                    with self._lock:
+                        progress.converted += 1
+
+                self._save_progress(target_bucket, target_prefix, progress)
+        finally:
+            for _, future in downloads:
+                future.cancel()
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def _convert_window(self, sources: List[Tuple[str, Path]], **kwargs) -> List[ConversionResult]:
+        if self.executor is None or self._loop is None:
+            return self.service.convert_documents(sources, **kwargs)
+
+        estimates = estimate_documents(sources, kwargs.get("image_policy", IMAGE_POLICY))
+        ticket = Ticket(sum(estimate.cost for estimate in estimates), INGESTION_TENANT, INGESTION_PRIORITY)
+        while True:
+            future = asyncio.run_coroutine_threadsafe(
+                self.executor.run(self.service.convert_documents, sources, ticket=ticket, **kwargs), self._loop
+            )
+            try:
+                return future.result()
+            except HTTPException as e:
+                # the admission queue is full of API requests, they go first
+                if e.status_code != 503 or self._stop.wait(self.executor.retry_after):
+                    raise
+
+    def _save_progress(self, bucket: str, prefix: str, progress: IngestionJobResult) -> None:
+        with self._lock:
+            body = progress.model_dump_json().encode()
+        try:
+            self.client.put_object(
+                Bucket=bucket,
+                Key=f"{prefix}{PROGRESS_PREFIX}{progress.job_id}.json",
+                Body=body,
+                ContentType="application/json",
+            )
+        except Exception as e:
+            logger.error(f"Failed to save the progress of ingestion job {progress.job_id}: {e}")
+
+    def _load_progress(self, target: str, job_id: str) -> Optional[IngestionJobResult]:
+        bucket, prefix = parse_s3_uri(target)
+        try:
+            key = f"{_as_directory(prefix)}{PROGRESS_PREFIX}{job_id}.json"
+            response = self.client.get_object(Bucket=bucket, Key=key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                return None
+            raise
+        return IngestionJobResult.model_validate_json(response["Body"].read())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Convert documents stored in S3 and write their results to S3")
+    parser.add_argument("uris", nargs="*", help="s3://bucket/key of the documents to convert")
+    parser.add_argument("--prefix", help="s3://bucket/prefix under which every supported document is converted")
+    parser.add_argument("--target", required=True, help="s3://bucket/prefix to write the results under")
+    parser.add_argument("--overwrite", action="store_true", help="convert documents whose result is up to date too")
+    args = parser.parse_args()
+
+    from doc_parser.jobs import new_job_id
+    from doc_parser.service import DocumentConverterService, DoclingDocumentConversion, create_result_cache
+
+    request = S3IngestionRequest(uris=args.uris, prefix=args.prefix, target=args.target, overwrite=args.overwrite)
+    try:
+        S3Ingestion.check(request)
+    except ValueError as e:
+        parser.error(str(e))
+
+    service = DocumentConverterService(doc_parser=DoclingDocumentConversion(), cache=create_result_cache())
+    ingestion = S3Ingestion(service)
+    progress = ingestion.run(IngestionJobResult(job_id=new_job_id(), target=request.target), request)
+    print(progress.model_dump_json(indent=2))
+    sys.exit(0 if progress.status == "SUCCESS" else 1)
+
+
+if __name__ == "__main__":
+    main()
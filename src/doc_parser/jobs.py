@@ -0,0 +1,369 @@
+import json
+import queue
+import socket
+import threading
+import time
+import uuid
+from io import BytesIO
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from doc_parser.schema import BatchConversionJobResult, ConversationJobResult, ConversionJob
+from doc_parser.settings import (
+    JOB_HEARTBEAT_TTL,
+    JOB_MAX_ATTEMPTS,
+    JOB_RESULT_TTL,
+    JOB_STORE,
+    JOB_WORKERS,
+    REDIS_HOST,
+    logger,
+)
+from doc_parser.uploads import iter_blocks, remove_spooled
+
+
+def new_job_id() -> str:
+    return uuid.uuid4().hex
+
+
+class JobStore(ABC):
+    """Queue of pending conversion jobs plus the status/result of every job."""
+
+    @abstractmethod
+    def submit(self, job: ConversionJob) -> ConversationJobResult:
+        pass
+
+    @abstractmethod
+    def next_job(self, timeout: float = 1.0, worker_id: str = "") -> Optional[ConversionJob]:
+        pass
+
+    def complete(self, job: ConversionJob, worker_id: str = "") -> None:
+        """Acknowledge a job taken by `worker_id` once its result is saved, until then it is requeued if they die."""
+
+    def heartbeat(self, worker_ids: List[str]) -> None:
+        """Mark the workers alive for JOB_HEARTBEAT_TTL seconds."""
+
+    def requeue_stale(self) -> int:
+        """Put the jobs of workers whose heartbeat expired back on the queue, returns how many."""
+        return 0
+
+    @abstractmethod
+    def save_result(self, result: ConversationJobResult) -> None:
+        pass
+
+    @abstractmethod
+    def get_result(self, job_id: str) -> Optional[ConversationJobResult]:
+        pass
+
+    @abstractmethod
+    def save_batch(self, batch_id: str, job_ids: List[str]) -> None:
+        pass
+
+    @abstractmethod
+    def get_batch(self, batch_id: str) -> Optional[List[str]]:
+        pass
+
+    @abstractmethod
+    def queue_depth(self) -> int:
+        pass
+
+    def get_batch_result(self, batch_id: str) -> Optional[BatchConversionJobResult]:
+        job_ids = self.get_batch(batch_id)
+        if job_ids is None:
+            return None
+
+        results = [
+            self.get_result(job_id) or ConversationJobResult(job_id=job_id, status="FAILURE", error="Job expired")
+            for job_id in job_ids
+        ]
+        if any(result.status == "IN_PROGRESS" for result in results):
+            status = "IN_PROGRESS"
+        elif results and all(result.status == "FAILURE" for result in results):
+            status = "FAILURE"
+        else:
+            status = "SUCCESS"
+
+        return BatchConversionJobResult(
+            job_id=batch_id,
+            conversion_results=results,
+            status=status,
+            error="All documents in the batch failed to convert" if status == "FAILURE" else None,
+        )
+
+
+class InMemoryJobStore(JobStore):
+    """Single-process job store, results expire after `result_ttl` seconds."""
+
+    def __init__(self, result_ttl: int = JOB_RESULT_TTL):
+        self.result_ttl = result_ttl
+        self._queue: "queue.Queue[ConversionJob]" = queue.Queue()
+        self._results: Dict[str, Tuple[float, ConversationJobResult]] = {}
+        self._batches: Dict[str, Tuple[float, List[str]]] = {}
+        self._lock = threading.Lock()
+
+    def _prune(self) -> None:
+        now = time.monotonic()
+        for store in (self._results, self._batches):
+            for key in [key for key, (expires_at, _) in store.items() if expires_at < now]:
+                store.pop(key, None)
+
+    def submit(self, job: ConversionJob) -> ConversationJobResult:
+        result = ConversationJobResult(job_id=job.job_id, status="IN_PROGRESS")
+        self.save_result(result)
+        self._queue.put(job)
+        return result
+
+    def next_job(self, timeout: float = 1.0, worker_id: str = "") -> Optional[ConversionJob]:
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def save_result(self, result: ConversationJobResult) -> None:
+        with self._lock:
+            self._prune()
+            self._results[result.job_id] = (time.monotonic() + self.result_ttl, result)
+
+    def get_result(self, job_id: str) -> Optional[ConversationJobResult]:
+        with self._lock:
+            entry = self._results.get(job_id)
+        return entry[1] if entry else None
+
+    def save_batch(self, batch_id: str, job_ids: List[str]) -> None:
+        with self._lock:
+            self._batches[batch_id] = (time.monotonic() + self.result_ttl, list(job_ids))
+
+    def get_batch(self, batch_id: str) -> Optional[List[str]]:
+        with self._lock:
+            entry = self._batches.get(batch_id)
+        return entry[1] if entry else None
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+
+class RedisJobStore(JobStore):
+    """Job store shared by API pods and worker pods through Redis.
+
+    A worker moves the job it takes onto its own processing list (BLMOVE, Redis 6.2+) and only removes it, with the
+    request and file, once the result is saved. Jobs of a worker that died, whose heartbeat expired, go back on the
+    queue; a job taken JOB_MAX_ATTEMPTS times without finishing fails instead of taking down worker after worker.
+    """
+
+    prefix = "doc_parser"
+
+    def __init__(
+        self,
+        url: str = REDIS_HOST,
+        result_ttl: int = JOB_RESULT_TTL,
+        heartbeat_ttl: int = JOB_HEARTBEAT_TTL,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+    ):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError(
+                "Redis is not installed. Please install it via `poetry install --extras redis` to use JOB_STORE=redis."
+            )
+
+        self.result_ttl = result_ttl
+        self.heartbeat_ttl = heartbeat_ttl
+        self.max_attempts = max_attempts
+        self.client = redis.Redis.from_url(url)
+        self.queue_key = f"{self.prefix}:jobs:queue"
+
+    def _key(self, kind: str, job_id: str) -> str:
+        return f"{self.prefix}:{kind}:{job_id}"
+
+    def _processing_key(self, worker_id: str) -> str:
+        return self._key("jobs:processing", worker_id)
+
+    def submit(self, job: ConversionJob) -> ConversationJobResult:
+        result = ConversationJobResult(job_id=job.job_id, status="IN_PROGRESS")
+        file_key = self._key("file", job.job_id)
+        if job.file_path is not None:
+            # workers may run on other hosts, the spooled upload goes to Redis block by block
+            try:
+                self.client.set(file_key, b"", ex=self.result_ttl)
+                for block in iter_blocks(Path(job.file_path)):
+                    self.client.append(file_key, block)
+            finally:
+                remove_spooled(job.file_path)
+        else:
+            self.client.set(file_key, job.file_bytes, ex=self.result_ttl)
+        pipe = self.client.pipeline()
+        pipe.set(self._key("job", job.job_id), result.model_dump_json(), ex=self.result_ttl)
+        pipe.set(self._key("request", job.job_id), job.model_dump_json(), ex=self.result_ttl)
+        pipe.rpush(self.queue_key, job.job_id)
+        pipe.execute()
+        return result
+
+    def next_job(self, timeout: float = 1.0, worker_id: str = "") -> Optional[ConversionJob]:
+        processing_key = self._processing_key(worker_id)
+        item = self.client.blmove(self.queue_key, processing_key, max(1, int(timeout)), "LEFT", "RIGHT")
+        if item is None:
+            return None
+
+        job_id = item.decode()
+        pipe = self.client.pipeline()
+        pipe.get(self._key("request", job_id))
+        pipe.get(self._key("file", job_id))
+        pipe.incr(self._key("attempts", job_id))
+        pipe.expire(self._key("attempts", job_id), self.result_ttl)
+        request, file_bytes, attempts, _ = pipe.execute()
+
+        error = None
+        if request is None or file_bytes is None:
+            logger.error(f"Conversion job {job_id} expired before a worker picked it up")
+            error = "Job expired"
+        elif attempts > self.max_attempts:
+            logger.error(f"Conversion job {job_id} was taken {attempts - 1} times without finishing, giving up")
+            error = f"The conversion did not finish after {attempts - 1} attempts"
+        if error is not None:
+            self.save_result(ConversationJobResult(job_id=job_id, status="FAILURE", error=error))
+            self._forget(job_id, processing_key)
+            return None
+
+        job = ConversionJob.model_validate_json(request)
+        job.file_bytes = file_bytes
+        return job
+
+    def _forget(self, job_id: str, processing_key: str) -> None:
+        pipe = self.client.pipeline()
+        pipe.lrem(processing_key, 1, job_id)
+        pipe.delete(self._key("request", job_id), self._key("file", job_id), self._key("attempts", job_id))
+        pipe.execute()
+
+    def complete(self, job: ConversionJob, worker_id: str = "") -> None:
+        self._forget(job.job_id, self._processing_key(worker_id))
+
+    def heartbeat(self, worker_ids: List[str]) -> None:
+        pipe = self.client.pipeline()
+        for worker_id in worker_ids:
+            pipe.set(self._key("workers", worker_id), 1, ex=self.heartbeat_ttl)
+        pipe.execute()
+
+    def requeue_stale(self) -> int:
+        requeued = 0
+        prefix = self._processing_key("")
+        for key in self.client.scan_iter(match=f"{prefix}*"):
+            worker_id = key.decode()[len(prefix) :]
+            if self.client.exists(self._key("workers", worker_id)):
+                continue
+            # one LMOVE per job, so concurrent recoveries never requeue a job twice; to the head, they waited longest
+            while (job_id := self.client.lmove(key, self.queue_key, "RIGHT", "LEFT")) is not None:
+                logger.warning(f"Requeued conversion job {job_id.decode()} of the stopped worker {worker_id}")
+                requeued += 1
+        return requeued
+
+    def save_result(self, result: ConversationJobResult) -> None:
+        self.client.set(self._key("job", result.job_id), result.model_dump_json(), ex=self.result_ttl)
+
+    def get_result(self, job_id: str) -> Optional[ConversationJobResult]:
+        payload = self.client.get(self._key("job", job_id))
+        return ConversationJobResult.model_validate_json(payload) if payload else None
+
+    def save_batch(self, batch_id: str, job_ids: List[str]) -> None:
+        self.client.set(self._key("batch", batch_id), json.dumps(job_ids), ex=self.result_ttl)
+
+    def get_batch(self, batch_id: str) -> Optional[List[str]]:
+        payload = self.client.get(self._key("batch", batch_id))
+        return json.loads(payload) if payload else None
+
+    def queue_depth(self) -> int:
+        return self.client.llen(self.queue_key)
+
+
+def create_job_store(kind: str = JOB_STORE) -> JobStore:
+    if kind == "redis":
+        return RedisJobStore()
+    if kind == "memory":
+        return InMemoryJobStore()
+    raise ValueError(f"Unsupported job store: {kind}")
+
+
+class ConversionWorkerPool:
+    """Threads draining the job store through a document converter."""
+
+    def __init__(self, store: JobStore, doc_parser, num_workers: int = JOB_WORKERS):
+        self.store = store
+        self.doc_parser = doc_parser
+        self.num_workers = num_workers
+        # unique per process start: a restarted container reuses its hostname and pid
+        instance = f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+        self.worker_ids = [f"{instance}-{i}" for i in range(num_workers)]
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        self._stop.clear()
+        self.store.heartbeat(self.worker_ids)
+        requeued = self.store.requeue_stale()
+        if requeued:
+            logger.warning(f"Requeued {requeued} conversion jobs of stopped workers")
+        threads = [threading.Thread(target=self._heartbeat, name="conversion-worker-heartbeat", daemon=True)]
+        for i, worker_id in enumerate(self.worker_ids):
+            threads.append(
+                threading.Thread(target=self._run, args=(worker_id,), name=f"conversion-worker-{i}", daemon=True)
+            )
+        for thread in threads:
+            thread.start()
+        self._threads.extend(threads)
+        logger.info(f"Started {self.num_workers} conversion workers")
+
+    def _heartbeat(self) -> None:
+        # conversions outlast the heartbeat, so it is refreshed here rather than between jobs; pools also pick up
+        # the jobs of workers that died since
+        while not self._stop.wait(JOB_HEARTBEAT_TTL / 3):
+            try:
+                self.store.heartbeat(self.worker_ids)
+                self.store.requeue_stale()
+            except Exception as e:
+                logger.warning(f"Conversion worker heartbeat failed: {e}")
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _run(self, worker_id: str) -> None:
+        while not self._stop.is_set():
+            try:
+                job = self.store.next_job(timeout=1.0, worker_id=worker_id)
+            except Exception as e:
+                logger.exception(f"Failed to fetch the next conversion job: {e}")
+                time.sleep(1.0)
+                continue
+            if job is not None:
+                try:
+                    self.process(job)
+                except Exception as e:
+                    # the result could not be saved, the job stays on this worker's list like an unacknowledged one
+                    logger.exception(f"Failed to save the result of conversion job {job.job_id}: {e}")
+                    continue
+                try:
+                    self.store.complete(job, worker_id)
+                except Exception as e:
+                    # the job stays on this worker's list and is converted again once the heartbeat stops
+                    logger.exception(f"Failed to acknowledge conversion job {job.job_id}: {e}")
+
+    def process(self, job: ConversionJob) -> ConversationJobResult:
+        source = Path(job.file_path) if job.file_path is not None else BytesIO(job.file_bytes)
+        try:
+            result = self.doc_parser.convert((job.filename, source), **job.options)
+            if result.error:
+                job_result = ConversationJobResult(
+                    job_id=job.job_id, result=result, error=result.error, status="FAILURE"
+                )
+            else:
+                job_result = ConversationJobResult(job_id=job.job_id, result=result, status="SUCCESS")
+        except Exception as e:
+            logger.exception(f"Conversion job {job.job_id} failed: {e}")
+            job_result = ConversationJobResult(job_id=job.job_id, error=str(e), status="FAILURE")
+        finally:
+            if job.file_path is not None:
+                remove_spooled(job.file_path)
+
+        self.store.save_result(job_result)
+        return job_result
@@ -0,0 +1,372 @@
+import os
+import json
+import math
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from doc_parser.settings import METRICS_ENABLED, METRICS_SNAPSHOT_INTERVAL, SERVER_TIMING_ENABLED, logger
+
+# Prometheus text exposition (format 0.0.4), the content type scrapers expect from /metrics
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# From format sniffing (milliseconds) up to OCR of long scans (minutes)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _render(name: str, documentation: str, type: str, samples) -> List[str]:
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {type}"]
+    for sample_name, labelnames, values, value in samples:
+        lines.append(f"{sample_name}{_format_labels(labelnames, values)} {_format_value(value)}")
+    return lines
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _label_values(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> Iterator[Tuple[str, Tuple[str, ...], LabelValues, float]]:
+        return iter(())
+
+    def render(self) -> List[str]:
+        return _render(self.name, self.documentation, self.type, self.samples())
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in values.items():
+            yield self.name, self.labelnames, key, value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: observation count of every bucket (non-cumulative, +Inf last), sum, count
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._label_values(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total[0]) for key, (counts, total) in self._values.items()}
+        bucket_labels = self.labelnames + ("le",)
+        for key, (counts, total) in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", bucket_labels, key + (_format_value(bound),), cumulative
+            yield f"{self.name}_sum", self.labelnames, key, total
+            yield f"{self.name}_count", self.labelnames, key, cumulative
+
+
+class CallbackMetric(Metric):
+    """Gauge or counter read at scrape time from state another component already keeps."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        type: str,
+        callback: Callable[[], Dict[LabelValues, float]],
+        labelnames: Tuple[str, ...] = (),
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.type = type
+        self.callback = callback
+
+    def samples(self):
+        for key, value in self.callback().items():
+            yield self.name, self.labelnames, key, value
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        # re-registering under the same name replaces the old collector, e.g. when a module is reloaded
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        snapshot = []
+        for metric in metrics:
+            try:
+                samples = [
+                    [name, labelnames, [str(label) for label in values], float(value)]
+                    for name, labelnames, values, value in metric.samples()
+                ]
+            except Exception:
+                # a broken callback must not take the whole scrape down
+                continue
+            snapshot.append(
+                {"name": metric.name, "documentation": metric.documentation, "type": metric.type, "samples": samples}
+            )
+        return snapshot
+
+    def render(self) -> str:
+        if _multiprocess_dir is not None:
+            return _render_multiprocess(self)
+        lines = []
+        for metric in self.snapshot():
+            lines.extend(_render(metric["name"], metric["documentation"], metric["type"], metric["samples"]))
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# Multi-worker serving: every gunicorn worker writes its samples to a file of this directory, and /metrics, answered
+# by any one of them, merges the files so a scrape sees the whole server
+_multiprocess_dir: Optional[Path] = None
+
+
+def enable_multiprocess(directory: str) -> None:
+    """Called in the gunicorn master before forking, the workers inherit the directory. Files of a previous run go."""
+    global _multiprocess_dir
+    _multiprocess_dir = Path(directory)
+    _multiprocess_dir.mkdir(parents=True, exist_ok=True)
+    for path in _multiprocess_dir.glob("*.json"):
+        path.unlink(missing_ok=True)
+
+
+def write_snapshot(pid: Optional[int] = None) -> None:
+    if _multiprocess_dir is None:
+        return
+    pid = pid or os.getpid()
+    tmp = _multiprocess_dir / f"{pid}.json.tmp"
+    tmp.write_text(json.dumps(registry.snapshot()))
+    # readers never see a half-written file
+    os.replace(tmp, _multiprocess_dir / f"{pid}.json")
+
+
+def start_snapshots(interval: float = METRICS_SNAPSHOT_INTERVAL) -> None:
+    """Write this worker's snapshot every `interval` seconds, on top of the one written when it answers a scrape."""
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                write_snapshot()
+            except Exception as e:
+                logger.warning(f"Could not write the metrics snapshot: {e}")
+
+    if _multiprocess_dir is not None:
+        threading.Thread(target=loop, name="metrics-snapshot", daemon=True).start()
+
+
+def mark_process_dead(pid: int) -> None:
+    """Keep the counters and histograms of an exited worker, so totals don't go backwards, but drop its gauges."""
+    if _multiprocess_dir is None:
+        return
+    path = _multiprocess_dir / f"{pid}.json"
+    try:
+        snapshot = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return
+    (_multiprocess_dir / f"{pid}.dead.json").write_text(
+        json.dumps([metric for metric in snapshot if metric["type"] != "gauge"])
+    )
+    path.unlink(missing_ok=True)
+
+
+def _render_multiprocess(registry: MetricsRegistry) -> str:
+    write_snapshot()
+    # (name) -> (documentation, type, {(sample name, label names, label values): value})
+    merged: Dict[str, Tuple[str, str, Dict[Tuple[str, Tuple[str, ...], LabelValues], float]]] = {}
+    for path in sorted(_multiprocess_dir.glob("*.json")):
+        try:
+            snapshot = json.loads(path.read_text())
+        except (OSError, ValueError):
+            # a worker that exited between the glob and the read
+            continue
+        worker = path.name.split(".")[0]
+        for metric in snapshot:
+            _, _, values = merged.setdefault(metric["name"], (metric["documentation"], metric["type"], {}))
+            for name, labelnames, label_values, value in metric["samples"]:
+                if metric["type"] == "gauge":
+                    # queue depths, cache sizes: reported per worker rather than summed
+                    key = (name, tuple(labelnames) + ("worker",), tuple(label_values) + (worker,))
+                else:
+                    key = (name, tuple(labelnames), tuple(label_values))
+                values[key] = values.get(key, 0) + value
+
+    lines = []
+    for name, (documentation, type, values) in merged.items():
+        samples = [key + (value,) for key, value in values.items()]
+        lines.extend(_render(name, documentation, type, samples))
+    return "\n".join(lines) + "\n"
+
+STAGE_SECONDS = registry.register(
+    Histogram(
+        "doc_parser_stage_seconds",
+        "Time spent per conversion stage and input format",
+        ("stage", "format"),
+    )
+)
+VLM_REQUEST_SECONDS = registry.register(
+    Histogram("doc_parser_vlm_request_seconds", "Latency of single VLM invocations by outcome", ("outcome",))
+)
+VLM_REQUESTS = registry.register(
+    Counter("doc_parser_vlm_requests_total", "VLM invocations by outcome (success, retry, error)", ("outcome",))
+)
+
+
+def register_callback(
+    name: str,
+    documentation: str,
+    callback: Callable[[], Dict[LabelValues, float]],
+    type: str = "gauge",
+    labelnames: Tuple[str, ...] = (),
+) -> None:
+    registry.register(CallbackMetric(name, documentation, type, callback, labelnames))
+
+
+# Per-request stage timings as (stage, format, seconds), collected for the Server-Timing header
+_request_timings: ContextVar[Optional[List[Tuple[str, str, float]]]] = ContextVar("request_timings", default=None)
+_request_timings_lock = threading.Lock()
+
+
+def record_stage(stage: str, seconds: float, input_format: Optional[str] = None, observe: bool = True) -> None:
+    if not METRICS_ENABLED:
+        return
+    input_format = input_format or "unknown"
+    if observe:
+        STAGE_SECONDS.observe(seconds, stage=stage, format=input_format)
+    timings = _request_timings.get()
+    if timings is not None:
+        # VLM calls of one request record from several threads at once
+        with _request_timings_lock:
+            timings.append((stage, input_format, seconds))
+
+
+@contextmanager
+def timed(stage: str, input_format: Optional[str] = None):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start, input_format)
+
+
+def timed_iter(stage: str, iterator: Iterator, input_format: Optional[str] = None) -> Iterator:
+    """Yield from `iterator`, recording the time spent producing its items (not consuming them) as one stage."""
+    seconds = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                seconds += time.perf_counter() - start
+            yield item
+    finally:
+        record_stage(stage, seconds, input_format)
+
+
+@contextmanager
+def collect_timings():
+    """Collect the stages recorded in this context into a fresh list, e.g. inside a worker process."""
+    timings: List[Tuple[str, str, float]] = []
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+
+def merge_timings(timings: List[Tuple[str, str, float]], observe: bool = False) -> None:
+    """Add timings collected elsewhere to the current request, observing them here if they were not already."""
+    for stage, input_format, seconds in timings:
+        record_stage(stage, seconds, input_format, observe=observe)
+
+
+def server_timing_header(timings: List[Tuple[str, str, float]]) -> str:
+    totals: Dict[str, float] = {}
+    for stage, _, seconds in timings:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items())
+
+
+async def server_timing(request, call_next):
+    """Middleware adding a Server-Timing header with the stage breakdown of the request, in milliseconds.
+
+    Streaming responses only report the stages finished before the first byte was sent.
+    """
+    if not SERVER_TIMING_ENABLED:
+        return await call_next(request)
+
+    timings: List[Tuple[str, str, float]] = []
+    token = _request_timings.set(timings)
+    try:
+        response = await call_next(request)
+    finally:
+        _request_timings.reset(token)
+    with _request_timings_lock:
+        header = server_timing_header(timings)
+    if header:
+        response.headers["Server-Timing"] = header
+    return response
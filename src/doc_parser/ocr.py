@@ -0,0 +1,89 @@
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from PIL import Image, ImageDraw
+from docling_core.types.doc import BoundingBox
+
+from docling.datamodel.base_models import Page
+from docling.datamodel.document import ConversionResult as DLConversionResult
+from docling.datamodel.pipeline_options import EasyOcrOptions
+from docling.models.base_ocr_model import BaseOcrModel
+from docling.models.easyocr_model import EasyOcrModel
+from docling.pipeline.standard_pdf_pipeline import StandardPdfPipeline
+
+from doc_parser.settings import OCR_TEXT_COVERAGE
+
+# Pages that went through OCR, per conversion in progress (keyed by id of docling's ConversionResult)
+_ocr_pages: Dict[int, int] = {}
+_ocr_pages_lock = threading.Lock()
+
+
+def pop_ocr_pages(conv_res: DLConversionResult) -> Optional[int]:
+    """Pages of a finished conversion that were OCR'd, None if its pipeline has no adaptive OCR (e.g. DOCX)."""
+    with _ocr_pages_lock:
+        return _ocr_pages.pop(id(conv_res), None)
+
+
+class AdaptiveEasyOcrOptions(EasyOcrOptions):
+    # a page or bitmap region this much covered by text-layer cells already has its text, it is not OCR'd.
+    # None OCRs every bitmap region like EasyOcrModel, the pages are still counted
+    text_coverage_threshold: Optional[float] = OCR_TEXT_COVERAGE
+
+
+def text_layer_mask(page: Page) -> np.ndarray:
+    """Binary mask, one pixel per point, of the page area covered by the cells of its text layer."""
+    image = Image.new("1", (round(page.size.width), round(page.size.height)))
+    draw = ImageDraw.Draw(image)
+    for cell in page.cells:
+        l, t, r, b = cell.bbox.to_top_left_origin(page_height=page.size.height).as_tuple()
+        draw.rectangle([(round(l), round(t)), (round(r), round(b))], fill=1)
+    return np.array(image)
+
+
+class AdaptiveEasyOcrModel(EasyOcrModel):
+    """EasyOCR on the bitmap regions docling picks, minus those the PDF's own text layer already covers.
+
+    Born-digital pages with a background or decorative image and scans with an embedded text layer are
+    then not OCR'd at all, while the bitmaps without text (figures, scans) still are.
+    """
+
+    options: AdaptiveEasyOcrOptions
+
+    def __init__(self, enabled: bool, options: AdaptiveEasyOcrOptions):
+        super().__init__(enabled=enabled, options=options)
+        # get_ocr_rects has no access to the conversion, pipelines run one conversion per thread at a time
+        self._local = threading.local()
+
+    @staticmethod
+    def _covered(mask: np.ndarray, rect: BoundingBox, threshold: float) -> bool:
+        region = mask[round(rect.t) : round(rect.b) + 1, round(rect.l) : round(rect.r) + 1]
+        return region.size > 0 and region.mean() >= threshold
+
+    def get_ocr_rects(self, page: Page) -> List[BoundingBox]:
+        ocr_rects = super().get_ocr_rects(page)
+        threshold = self.options.text_coverage_threshold
+        if ocr_rects and page.cells and threshold is not None:
+            mask = text_layer_mask(page)
+            ocr_rects = [rect for rect in ocr_rects if not self._covered(mask, rect, threshold)]
+
+        if any(rect.area() > 0 for rect in ocr_rects):
+            with _ocr_pages_lock:
+                _ocr_pages[self._local.conversion] = _ocr_pages.get(self._local.conversion, 0) + 1
+        return ocr_rects
+
+    def __call__(self, conv_res: DLConversionResult, page_batch: Iterable[Page]) -> Iterable[Page]:
+        if self.enabled:
+            self._local.conversion = id(conv_res)
+            with _ocr_pages_lock:
+                _ocr_pages.setdefault(id(conv_res), 0)
+        yield from super().__call__(conv_res, page_batch)
+
+
+class AdaptiveOcrPdfPipeline(StandardPdfPipeline):
+    """StandardPdfPipeline running AdaptiveEasyOcrModel when given AdaptiveEasyOcrOptions."""
+
+    def get_ocr_model(self) -> Optional[BaseOcrModel]:
+        if isinstance(self.pipeline_options.ocr_options, AdaptiveEasyOcrOptions):
+            return AdaptiveEasyOcrModel(enabled=self.pipeline_options.do_ocr, options=self.pipeline_options.ocr_options)
+        return super().get_ocr_model()
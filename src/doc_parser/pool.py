@@ -0,0 +1,119 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from weakref import WeakKeyDictionary
+
+from docling.document_converter import DocumentConverter
+
+from doc_parser.settings import (
+    CONVERTER_POOL_ENTRY_MEMORY_MB,
+    CONVERTER_POOL_MAX_MEMORY_MB,
+    logger,
+)
+
+# (extract_tables, image_resolution_scale, ocr_langs, generate_picture_images, generate_page_images)
+PipelineKey = Tuple[bool, int, Tuple[str, ...], bool, bool]
+
+
+def pipeline_key(
+    extract_tables: bool,
+    image_resolution_scale: int,
+    orc_langs: Optional[List[str]],
+    generate_picture_images: bool,
+    generate_page_images: bool,
+) -> PipelineKey:
+    """Normalise the pipeline options so equivalent requests share one converter."""
+    return (
+        bool(extract_tables),
+        int(image_resolution_scale),
+        tuple(sorted(set(orc_langs or []))),
+        bool(generate_picture_images),
+        bool(generate_page_images),
+    )
+
+
+class ConverterPool:
+    """Process-wide LRU registry of warm DocumentConverter instances.
+
+    Models are loaded lazily by docling the first time a pipeline runs, so a converter
+    is only cheap to reuse if we keep the same instance around. The pool is bounded by
+    a memory budget expressed as `max_memory_mb / entry_memory_mb` converters. Pinned converters are never
+    evicted, so requests with unusual options (e.g. OCR languages) don't push out the warm default.
+    """
+
+    def __init__(
+        self,
+        max_memory_mb: int = CONVERTER_POOL_MAX_MEMORY_MB,
+        entry_memory_mb: int = CONVERTER_POOL_ENTRY_MEMORY_MB,
+    ):
+        self.capacity = max(1, max_memory_mb // max(1, entry_memory_mb))
+        self.entry_memory_mb = entry_memory_mb
+        self._converters: "OrderedDict[PipelineKey, DocumentConverter]" = OrderedDict()
+        self._pinned: Set[PipelineKey] = set()
+        # one per converter, evicted converters keep theirs until the conversions still using them are done
+        self._converter_locks: "WeakKeyDictionary[DocumentConverter, threading.Lock]" = WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: PipelineKey, factory: Callable[[], DocumentConverter]) -> DocumentConverter:
+        with self._lock:
+            converter = self._converters.get(key)
+            if converter is not None:
+                self._converters.move_to_end(key)
+                self.hits += 1
+                return converter
+
+            self.misses += 1
+            converter = factory()
+            self._converters[key] = converter
+            while len(self._converters) > self.capacity:
+                # least recently used first
+                evicted_key = next((key for key in self._converters if key not in self._pinned), None)
+                if evicted_key is None:
+                    break
+                del self._converters[evicted_key]
+                self.evictions += 1
+                logger.info(f"Evicted document converter {evicted_key} from the pool.")
+            return converter
+
+    def pin(self, key: PipelineKey) -> None:
+        """Keep the converter of `key` in the pool whatever else is built."""
+        with self._lock:
+            self._pinned.add(key)
+
+    def lock(self, converter: DocumentConverter) -> threading.Lock:
+        """Lock to hold while `converter` converts.
+
+        docling builds pipelines into an unlocked cache and the layout, table and OCR models of a converter aren't
+        safe to share between threads, so the conversions of a batch that use the same converter take turns.
+        """
+        with self._lock:
+            return self._converter_locks.setdefault(converter, threading.Lock())
+
+    def __reduce__(self):
+        # worker processes resolve to their own process-wide pool instead of copying converters
+        return (_process_converter_pool, ())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._converters.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._converters),
+                "capacity": self.capacity,
+                "memory_mb": len(self._converters) * self.entry_memory_mb,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+converter_pool = ConverterPool()
+
+
+def _process_converter_pool() -> ConverterPool:
+    return converter_pool
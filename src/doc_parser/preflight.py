@@ -0,0 +1,137 @@
+"""Preflight: a cheap estimate of what converting a document will cost, read from its raw bytes.
+
+PDFs are opened with pdfium without rendering anything: the page count comes from the document, text-layer and
+image counts from up to PREFLIGHT_SAMPLE_PAGES evenly spaced pages. Office files are counted from their zip
+directory, text formats from their markup. The estimate orders the conversion queue (see scheduling) and is served
+by /documents/estimate so clients can route or split large documents themselves.
+"""
+import re
+import zipfile
+from io import BytesIO
+from typing import List, Optional, Tuple
+
+import pypdfium2 as pdfium
+import pypdfium2.raw as pdfium_c
+
+from doc_parser.schema import DocumentEstimate
+from doc_parser.settings import IMAGE_POLICY, OCR_MODE, PREFLIGHT_SAMPLE_PAGES, logger
+from doc_parser.uploads import DocumentSource, detached, read_head, source_bytes
+from doc_parser.utils import ImagePolicy, InputFormat, guess_format
+
+# Rough CPU seconds of each unit of work, only their ratios matter for scheduling
+DOCUMENT_SECONDS = 0.05
+PAGE_SECONDS = {
+    InputFormat.PDF: 0.6,
+    InputFormat.IMAGE: 0.6,
+    InputFormat.PPTX: 0.05,
+    InputFormat.DOCX: 0.02,
+}
+OCR_PAGE_SECONDS = 1.5
+# VLM calls of a document run concurrently, so an image costs less than a call takes
+VLM_IMAGE_SECONDS = 0.5
+
+# characters a page needs on its text layer not to be considered scanned
+TEXT_LAYER_MIN_CHARS = 16
+
+TEXT_IMAGE_PATTERNS = {
+    InputFormat.MD: re.compile(rb"!\["),
+    InputFormat.HTML: re.compile(rb"<img\b", re.IGNORECASE),
+    InputFormat.ASCIIDOC: re.compile(rb"^image::", re.MULTILINE),
+}
+
+
+def _sample(num_pages: int, max_samples: int = PREFLIGHT_SAMPLE_PAGES) -> List[int]:
+    if num_pages <= max_samples:
+        return list(range(num_pages))
+    return sorted({round(i * (num_pages - 1) / (max_samples - 1)) for i in range(max_samples)})
+
+
+def _pdf_counts(source: DocumentSource) -> Tuple[int, int, int, int]:
+    """(pages, images, pages without a text layer, pages with images), extrapolated from the sampled pages."""
+    pdf = pdfium.PdfDocument(detached(source))
+    try:
+        num_pages = len(pdf)
+        sampled = _sample(num_pages)
+        images = scanned = illustrated = 0
+        for index in sampled:
+            page = pdf[index]
+            try:
+                textpage = page.get_textpage()
+                try:
+                    scanned += textpage.count_chars() < TEXT_LAYER_MIN_CHARS
+                finally:
+                    textpage.close()
+                page_images = sum(1 for _ in page.get_objects(filter=[pdfium_c.FPDF_PAGEOBJ_IMAGE]))
+                images += page_images
+                illustrated += page_images > 0
+            finally:
+                page.close()
+    finally:
+        pdf.close()
+
+    if not sampled:
+        return 0, 0, 0, 0
+    scale = num_pages / len(sampled)
+    return num_pages, round(images * scale), round(scanned * scale), round(illustrated * scale)
+
+
+def _office_counts(source: DocumentSource, input_format: InputFormat) -> Tuple[int, int]:
+    """(pages or slides, images) from the zip directory, and for DOCX the page count Word saved in docProps/app.xml."""
+    with zipfile.ZipFile(detached(source)) as archive:
+        names = archive.namelist()
+        if input_format == InputFormat.PPTX:
+            pages = sum(1 for name in names if re.fullmatch(r"ppt/slides/slide\d+\.xml", name))
+            images = sum(1 for name in names if name.startswith("ppt/media/"))
+        else:
+            pages = 1
+            if "docProps/app.xml" in names:
+                match = re.search(rb"<Pages>(\d+)</Pages>", archive.read("docProps/app.xml"))
+                pages = int(match.group(1)) if match else 1
+            images = sum(1 for name in names if name.startswith("word/media/"))
+    return max(1, pages), images
+
+
+def estimate_document(
+    filename: str, source: DocumentSource, image_policy: ImagePolicy = IMAGE_POLICY
+) -> DocumentEstimate:
+    size = source.getbuffer().nbytes if isinstance(source, BytesIO) else source.stat().st_size
+    input_format: Optional[InputFormat] = guess_format(read_head(source), filename)
+    pages, images, ocr_pages, text_layer = 1, 0, 0, True
+
+    try:
+        if input_format == InputFormat.PDF:
+            pages, images, scanned, illustrated = _pdf_counts(source)
+            text_layer = scanned < pages
+            # adaptive OCR skips the bitmaps the text layer covers, bitmap mode OCRs every page with a picture
+            ocr_pages = {"off": 0, "bitmap": max(scanned, illustrated)}.get(OCR_MODE, scanned)
+        elif input_format in (InputFormat.DOCX, InputFormat.PPTX):
+            pages, images = _office_counts(source, input_format)
+        elif input_format == InputFormat.IMAGE:
+            images, text_layer = 1, False
+            ocr_pages = 0 if OCR_MODE == "off" else 1
+        elif input_format in TEXT_IMAGE_PATTERNS:
+            images = len(TEXT_IMAGE_PATTERNS[input_format].findall(source_bytes(source)))
+    except Exception as e:
+        # a broken file fails early in the conversion too, estimate it as a single page
+        logger.warning(f"Preflight of {filename} failed: {e}")
+
+    cost = DOCUMENT_SECONDS + pages * PAGE_SECONDS.get(input_format, 0.0) + ocr_pages * OCR_PAGE_SECONDS
+    if image_policy == ImagePolicy.VLM:
+        cost += images * VLM_IMAGE_SECONDS
+
+    return DocumentEstimate(
+        filename=filename,
+        input_format=input_format.value if input_format else None,
+        size_bytes=size,
+        pages=pages,
+        images=images,
+        text_layer=text_layer,
+        ocr_pages=ocr_pages,
+        cost=round(cost, 3),
+    )
+
+
+def estimate_documents(
+    documents: List[Tuple[str, DocumentSource]], image_policy: ImagePolicy = IMAGE_POLICY
+) -> List[DocumentEstimate]:
+    return [estimate_document(filename, source, image_policy) for filename, source in documents]
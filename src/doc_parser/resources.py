@@ -0,0 +1,63 @@
+import os
+from typing import Optional
+
+CGROUP_V2_CPU_MAX = "/sys/fs/cgroup/cpu.max"
+CGROUP_V1_CPU_QUOTA = "/sys/fs/cgroup/cpu/cpu.cfs_quota_us"
+CGROUP_V1_CPU_PERIOD = "/sys/fs/cgroup/cpu/cpu.cfs_period_us"
+CGROUP_V2_MEMORY_MAX = "/sys/fs/cgroup/memory.max"
+CGROUP_V1_MEMORY_LIMIT = "/sys/fs/cgroup/memory/memory.limit_in_bytes"
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_quota() -> Optional[float]:
+    """CPU limit of the container in CPUs (e.g. 1.5 for a k8s limit of 1500m), None when unlimited."""
+    cpu_max = _read(CGROUP_V2_CPU_MAX)
+    if cpu_max:
+        quota, _, period = cpu_max.partition(" ")
+        if quota != "max" and period:
+            return int(quota) / int(period)
+        return None
+
+    quota, period = _read(CGROUP_V1_CPU_QUOTA), _read(CGROUP_V1_CPU_PERIOD)
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period)
+    return None
+
+
+def available_cpus() -> int:
+    """CPUs this process can actually use: the cgroup quota if there is one, else the CPU affinity mask."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # not available on macOS
+        cpus = os.cpu_count() or 1
+
+    quota = cgroup_cpu_quota()
+    if quota is not None:
+        # round down, a fractional CPU doesn't fit another busy thread
+        cpus = min(cpus, int(quota))
+    return max(1, cpus)
+
+
+def physical_memory() -> Optional[int]:
+    """Physical memory of the host in bytes, None when it can't be read."""
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def available_memory() -> Optional[int]:
+    """Memory this process can use in bytes: the cgroup limit if there is one, else the physical memory."""
+    physical = physical_memory()
+    limit = _read(CGROUP_V2_MEMORY_MAX) or _read(CGROUP_V1_MEMORY_LIMIT)
+    if limit and limit.isdigit():
+        # cgroup v1 reports no limit as a huge page-aligned number
+        return min(int(limit), physical) if physical else int(limit)
+    return physical
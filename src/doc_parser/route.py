@@ -1,16 +1,170 @@
-from io import BytesIO
-from typing import List
-from fastapi import APIRouter, File, HTTPException, UploadFile, Query
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
 
-from doc_parser.schema import ConversionResult
-from doc_parser.service import DocumentConverterService, DoclingDocumentConversion
-from doc_parser.utils import is_file_format_supported
+from fastapi import APIRouter, Depends, File, Header, HTTPException, UploadFile, Query, Response
+from pydantic import TypeAdapter
+from starlette.concurrency import run_in_threadpool
+
+from doc_parser.executor import ConversionExecutor
+from doc_parser.ingestion import S3Ingestion
+from doc_parser.jobs import create_job_store, new_job_id
+from doc_parser.metrics import PROMETHEUS_CONTENT_TYPE, register_callback, registry, timed
+from doc_parser.preflight import estimate_documents
+from doc_parser.schema import (
+    BatchConversionJobResult,
+    ConversationJobResult,
+    ConversionJob,
+    ConversionQueueStats,
+    ConversionResult,
+    ConverterPoolStats,
+    DocumentEstimate,
+    IngestionJobResult,
+    S3IngestionRequest,
+)
+from doc_parser.scheduling import DEFAULT_PRIORITY, DEFAULT_TENANT, Ticket
+from doc_parser.serialization import ResponseFormat, check_response_format, encoded_response
+from doc_parser.service import DocumentConverterService, DoclingDocumentConversion, create_result_cache
+from doc_parser.settings import (
+    CHUNK_MAX_TOKENS,
+    CONVERTER_POOL_WARM_UP,
+    FAST_PATH_WORKERS,
+    IMAGE_MAX_PER_DOCUMENT,
+    IMAGE_MIN_AREA,
+    IMAGE_POLICY,
+    OCR_ALLOWED_LANGS,
+    OCR_LANGS,
+    SCHEDULER_PRIORITY_WEIGHTS,
+)
+from doc_parser.streaming import StreamFormat, streaming_response
+from doc_parser.uploads import DocumentSource, UploadSpool
+from doc_parser.utils import ImagePolicy, image_text_memo
 
 router = APIRouter()
 
 # Could be docling or another converter as long as it implements DocumentConversionBase
 converter = DoclingDocumentConversion()
-doc_parser_service = DocumentConverterService(doc_parser=converter)
+doc_parser_service = DocumentConverterService(doc_parser=converter, cache=create_result_cache())
+# Conversions are CPU-bound, run them off the event loop behind a bounded admission queue
+conversion_executor = ConversionExecutor(initializer=converter.warm_up if CONVERTER_POOL_WARM_UP else None)
+# Markdown, HTML and AsciiDoc take docling's fast path in milliseconds, they don't queue behind PDF conversions
+text_conversion_executor = ConversionExecutor(kind="thread", max_workers=FAST_PATH_WORKERS or 1)
+# Conversion jobs are drained by ConversionWorkerPool, in-process or in separate worker pods
+job_store = create_job_store()
+# S3 ingestion jobs read their documents from S3 and write the results back, in background threads
+ingestion = S3Ingestion(doc_parser_service, executor=conversion_executor)
+
+conversion_result_adapter = TypeAdapter(ConversionResult)
+conversion_results_adapter = TypeAdapter(List[ConversionResult])
+
+IMAGE_POLICY_DESCRIPTION = "Drop pictures (none), keep their captions (caption) or describe them with the VLM (vlm)"
+TENANT_DESCRIPTION = "Tenant the conversion is scheduled for, with SCHEDULER_POLICY=fair"
+PRIORITY_DESCRIPTION = "Priority class of the conversion, see SCHEDULER_PRIORITY_WEIGHTS"
+
+
+async def _ticket(
+    doc_sources: List[Tuple[str, DocumentSource]],
+    image_policy: ImagePolicy,
+    tenant: Optional[str],
+    priority: Optional[str],
+) -> Ticket:
+    """Preflight the uploads for the scheduler, a batch costs as much as all its documents."""
+    if priority is not None and priority not in SCHEDULER_PRIORITY_WEIGHTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown priority {priority}, expected one of {', '.join(SCHEDULER_PRIORITY_WEIGHTS)}",
+        )
+    with timed("preflight"):
+        estimates = await run_in_threadpool(estimate_documents, doc_sources, image_policy)
+    return Ticket(sum(estimate.cost for estimate in estimates), tenant or DEFAULT_TENANT, priority or DEFAULT_PRIORITY)
+
+
+class ConversionOptions:
+    """Query parameters shared by the conversion endpoints, `kwargs` are those of the conversion."""
+
+    def __init__(
+        self,
+        extract_tables_as_images: bool = False,
+        image_resolution_scale: int = Query(1, ge=1, le=4),
+        max_tokens: int = Query(256, ge=1, le=8196),
+        temperature: float = Query(1.0, ge=0, le=1),
+        top_p: float = Query(0.95, ge=0.5, le=1),
+        chunk_max_tokens: int = Query(
+            CHUNK_MAX_TOKENS, ge=1, le=8196, description="Budget of merged chunks, in CHUNK_SIZING units"
+        ),
+        image_policy: ImagePolicy = Query(IMAGE_POLICY, description=IMAGE_POLICY_DESCRIPTION),
+        max_images: int = Query(IMAGE_MAX_PER_DOCUMENT, ge=0, description="VLM calls per document, 0 for no limit"),
+        min_image_area: int = Query(
+            IMAGE_MIN_AREA, ge=0, description="Pictures below this many pixels keep only their caption"
+        ),
+        ocr_langs: List[str] = Query(OCR_LANGS, description="EasyOCR languages of the pages that need OCR"),
+    ):
+        unknown = sorted(set(ocr_langs) - set(OCR_ALLOWED_LANGS))
+        if unknown:
+            expected = ", ".join(OCR_ALLOWED_LANGS)
+            raise HTTPException(
+                status_code=422, detail=f"Unsupported OCR languages {', '.join(unknown)}, expected some of {expected}"
+            )
+        self.image_policy = image_policy
+        self.kwargs: Dict[str, Any] = dict(
+            extract_tables=extract_tables_as_images,
+            image_resolution_scale=image_resolution_scale,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            chunk_max_tokens=chunk_max_tokens,
+            image_policy=image_policy,
+            max_images=max_images,
+            min_image_area=min_image_area,
+            orc_langs=ocr_langs,
+        )
+
+
+# Scrape-time gauges and counters over state the executor, job store and caches already keep
+register_callback(
+    "doc_parser_conversion_queue_depth",
+    "Synchronous conversions waiting for a worker",
+    lambda: {(): conversion_executor.queue_depth},
+)
+register_callback(
+    "doc_parser_conversions_running",
+    "Synchronous conversions currently running",
+    lambda: {(): conversion_executor.running},
+)
+register_callback(
+    "doc_parser_conversions_rejected_total",
+    "Synchronous conversions rejected because the queue was full",
+    lambda: {(): conversion_executor.rejected},
+    type="counter",
+)
+register_callback(
+    "doc_parser_batch_workers_abandoned",
+    "Batch workers still held by conversions that timed out",
+    lambda: {(): doc_parser_service.batch_engine.executor.abandoned},
+)
+register_callback(
+    "doc_parser_job_queue_depth",
+    "Asynchronous conversion jobs waiting for a worker",
+    lambda: {(): job_store.queue_depth()},
+)
+register_callback(
+    "doc_parser_converter_pool_requests_total",
+    "Converter pool lookups by result",
+    lambda: {(result,): converter.converter_pool.stats()[f"{result}s"] for result in ("hit", "miss")},
+    type="counter",
+    labelnames=("result",),
+)
+register_callback(
+    "doc_parser_cache_requests_total",
+    "Result and image text cache lookups by result",
+    lambda: {
+        (name, result): cache.stats()[f"{result}s"]
+        for name, cache in (("results", doc_parser_service.cache), ("images", image_text_memo.cache))
+        if cache is not None
+        for result in ("hit", "miss")
+    },
+    type="counter",
+    labelnames=("cache", "result"),
+)
 
 
 # Document direct conversion endpoints
@@ -22,24 +176,55 @@ doc_parser_service = DocumentConverterService(doc_parser=converter)
 )
 async def convert_single_document(
     document: UploadFile = File(...),
-    extract_tables_as_images: bool = False,
-    image_resolution_scale: int = Query(1, ge=1, le=4),
-    max_tokens: int = Query(256, ge=1, le=8196),
-    temperature: float = Query(1, ge=0, le=1),
-    top_p: float = Query(0.95, ge=0.5, le=1),
+    options: ConversionOptions = Depends(),
+    stream: Optional[StreamFormat] = Query(None, description="Stream the result as NDJSON lines or SSE events"),
+    stream_chunks: bool = Query(False, description="When streaming, emit every ParserChunk as its own event"),
+    shard_pages: Optional[int] = Query(None, ge=1, description="Convert PDFs in parallel shards of this many pages"),
+    incremental: bool = Query(
+        False, description="Only convert the PDF pages that changed since an earlier revision was converted"
+    ),
+    response_format: ResponseFormat = Query(
+        "json", description="json, columnar (chunk fields as parallel arrays) or msgpack, ignored when streaming"
+    ),
+    accept_encoding: Optional[str] = Header(None, include_in_schema=False),
+    x_tenant_id: Optional[str] = Header(None, description=TENANT_DESCRIPTION),
+    x_priority: Optional[str] = Header(None, description=PRIORITY_DESCRIPTION),
 ):
-    file_bytes = await document.read()
-    if not is_file_format_supported(file_bytes, document.filename):
-        raise HTTPException(status_code=400, detail=f"Unsupported file format: {document.filename}")
-
-    return doc_parser_service.convert_document(
-        (document.filename, BytesIO(file_bytes)),
-        extract_tables=extract_tables_as_images,
-        image_resolution_scale=image_resolution_scale,
-        max_tokens=max_tokens,
-        temperature=temperature,
-        top_p=top_p,
-    )
+    check_response_format(response_format)
+    spool = UploadSpool()
+    try:
+        doc_source = await spool.add(document)
+        executor = text_conversion_executor if converter.fast_path_format(*doc_source) else conversion_executor
+        ticket = await _ticket([doc_source], options.image_policy, x_tenant_id, x_priority)
+
+        if stream:
+            return streaming_response(
+                executor.iterate(
+                    doc_parser_service.iter_document_chunks if stream_chunks else doc_parser_service.iter_documents,
+                    [doc_source],
+                    ticket=ticket,
+                    **options.kwargs,
+                ),
+                stream,
+                stream_chunks,
+                cleanup=spool.cleanup,
+            )
+
+        result = await executor.run(
+            doc_parser_service.convert_document,
+            doc_source,
+            ticket=ticket,
+            **options.kwargs,
+            shard_pages=shard_pages,
+            incremental=incremental,
+        )
+    except BaseException:
+        spool.cleanup()
+        raise
+
+    spool.cleanup()
+    headers = {"X-Cache": result._cache_status} if result._cache_status else None
+    return await encoded_response(conversion_result_adapter, result, response_format, accept_encoding, headers)
 
 
 @router.post(
@@ -50,24 +235,288 @@ async def convert_single_document(
 )
 async def convert_multiple_documents(
     documents: List[UploadFile] = File(...),
-    extract_tables_as_images: bool = False,
-    image_resolution_scale: int = Query(1, ge=1, le=4),
-    max_tokens: int = Query(256, ge=1, le=8196),
-    temperature: float = Query(1.0, ge=0, le=1),
-    top_p: float = Query(0.95, ge=0.5, le=1),
+    options: ConversionOptions = Depends(),
+    stream: Optional[StreamFormat] = Query(None, description="Stream each result as NDJSON lines or SSE events"),
+    stream_chunks: bool = Query(False, description="When streaming, emit every ParserChunk as its own event"),
+    ordered: bool = Query(
+        True, description="When streaming, emit results in upload order rather than as each finishes"
+    ),
+    document_timeout: Optional[float] = Query(
+        None,
+        gt=0,
+        description="Seconds after which a document is reported as failed, BATCH_DOCUMENT_TIMEOUT by default",
+    ),
+    response_format: ResponseFormat = Query(
+        "json", description="json, columnar (chunk fields as parallel arrays) or msgpack, ignored when streaming"
+    ),
+    accept_encoding: Optional[str] = Header(None, include_in_schema=False),
+    x_tenant_id: Optional[str] = Header(None, description=TENANT_DESCRIPTION),
+    x_priority: Optional[str] = Header(None, description=PRIORITY_DESCRIPTION),
+):
+    check_response_format(response_format)
+    spool = UploadSpool()
+    try:
+        if len(documents) > spool.max_files:
+            raise HTTPException(status_code=413, detail=f"Too many files, the limit is {spool.max_files}")
+        doc_sources = [await spool.add(document) for document in documents]
+        ticket = await _ticket(doc_sources, options.image_policy, x_tenant_id, x_priority)
+
+        if stream:
+            return streaming_response(
+                conversion_executor.iterate(
+                    doc_parser_service.iter_document_chunks if stream_chunks else doc_parser_service.iter_documents,
+                    doc_sources,
+                    ticket=ticket,
+                    ordered=ordered,
+                    timeout=document_timeout,
+                    **options.kwargs,
+                ),
+                stream,
+                stream_chunks,
+                cleanup=spool.cleanup,
+            )
+
+        results = await conversion_executor.run(
+            doc_parser_service.convert_documents,
+            doc_sources,
+            ticket=ticket,
+            timeout=document_timeout,
+            **options.kwargs,
+        )
+    except BaseException:
+        spool.cleanup()
+        raise
+
+    spool.cleanup()
+    hits = sum(result._cache_status == "HIT" for result in results)
+    headers = {
+        "X-Cache": "HIT" if hits == len(results) else ("MISS" if hits == 0 else "PARTIAL"),
+        "X-Cache-Hits": str(hits),
+    }
+    return await encoded_response(conversion_results_adapter, results, response_format, accept_encoding, headers)
+
+
+@router.post(
+    '/documents/estimate',
+    response_model=List[DocumentEstimate],
+    description="Estimate the conversion cost of documents from their pages, images and text layer, without converting",
+)
+async def estimate_conversion_cost(
+    documents: List[UploadFile] = File(...),
+    image_policy: ImagePolicy = Query(IMAGE_POLICY, description=IMAGE_POLICY_DESCRIPTION),
+):
+    spool = UploadSpool()
+    try:
+        if len(documents) > spool.max_files:
+            raise HTTPException(status_code=413, detail=f"Too many files, the limit is {spool.max_files}")
+        doc_sources = [await spool.add(document) for document in documents]
+        return await run_in_threadpool(estimate_documents, doc_sources, image_policy)
+    finally:
+        spool.cleanup()
+
+
+# Asynchronous conversion job endpoints
+def _job_file(source: DocumentSource) -> Dict[str, Any]:
+    """The document of a job: a spooled upload, which the job takes over and removes once done (the last job of a
+    batch removes the spool), or the bytes of a small upload Starlette kept in memory."""
+    if isinstance(source, Path):
+        return {"file_path": str(source)}
+    return {"file_bytes": source.getvalue()}
+
+
+@router.post(
+    '/conversion-jobs',
+    response_model=ConversationJobResult,
+    response_model_exclude_none=True,
+    status_code=202,
+    description="Submit a single document for asynchronous conversion",
+)
+async def submit_conversion_job(
+    document: UploadFile = File(...),
+    options: ConversionOptions = Depends(),
+    shard_pages: Optional[int] = Query(None, ge=1, description="Convert PDFs in parallel shards of this many pages"),
+    incremental: bool = Query(
+        False, description="Only convert the PDF pages that changed since an earlier revision was converted"
+    ),
 ):
-    doc_streams = []
-    for document in documents:
-        file_bytes = await document.read()
-        if not is_file_format_supported(file_bytes, document.filename):
-            raise HTTPException(status_code=400, detail=f"Unsupported file format: {document.filename}")
-        doc_streams.append((document.filename, BytesIO(file_bytes)))
-
-    return doc_parser_service.convert_documents(
-        doc_streams,
-        extract_tables=extract_tables_as_images,
-        image_resolution_scale=image_resolution_scale,
-        max_tokens=max_tokens,
-        temperature=temperature,
-        top_p=top_p,
+    spool = UploadSpool()
+    try:
+        _, source = await spool.add(document)
+    except BaseException:
+        spool.cleanup()
+        raise
+
+    job = ConversionJob(
+        job_id=new_job_id(),
+        filename=document.filename,
+        **_job_file(source),
+        options=dict(
+            **options.kwargs,
+            shard_pages=shard_pages,
+            incremental=incremental,
+        ),
     )
+    try:
+        return await run_in_threadpool(job_store.submit, job)
+    except BaseException:
+        spool.cleanup()
+        raise
+
+
+@router.get(
+    '/conversion-jobs/{job_id}',
+    response_model=ConversationJobResult,
+    response_model_exclude_none=True,
+    description="Poll the status of an asynchronous conversion job",
+)
+async def get_conversion_job(job_id: str):
+    result = await run_in_threadpool(job_store.get_result, job_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"Conversion job not found: {job_id}")
+    return result.model_copy(update={"result": None})
+
+
+@router.get(
+    '/conversion-jobs/{job_id}/result',
+    response_model=ConversionResult,
+    response_model_exclude_unset=True,
+    description="Fetch the result of a finished asynchronous conversion job",
+)
+async def get_conversion_job_result(job_id: str):
+    result = await run_in_threadpool(job_store.get_result, job_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"Conversion job not found: {job_id}")
+    if result.status == "IN_PROGRESS":
+        raise HTTPException(status_code=409, detail=f"Conversion job is still in progress: {job_id}")
+    if result.status == "FAILURE":
+        raise HTTPException(status_code=500, detail=result.error)
+    return result.result
+
+
+@router.post(
+    '/batch-conversion-jobs',
+    response_model=BatchConversionJobResult,
+    response_model_exclude_none=True,
+    status_code=202,
+    description="Submit multiple documents for asynchronous conversion",
+)
+async def submit_batch_conversion_job(
+    documents: List[UploadFile] = File(...),
+    options: ConversionOptions = Depends(),
+):
+    jobs = []
+    spool = UploadSpool()
+    try:
+        if len(documents) > spool.max_files:
+            raise HTTPException(status_code=413, detail=f"Too many files, the limit is {spool.max_files}")
+        doc_sources = [await spool.add(document) for document in documents]
+    except BaseException:
+        spool.cleanup()
+        raise
+
+    for document, (_, source) in zip(documents, doc_sources):
+        jobs.append(
+            ConversionJob(
+                job_id=new_job_id(),
+                filename=document.filename,
+                **_job_file(source),
+                options=dict(
+                    **options.kwargs,
+                ),
+            )
+        )
+
+    def submit_all() -> List[ConversationJobResult]:
+        job_store.save_batch(batch_id, [job.job_id for job in jobs])
+        return [job_store.submit(job) for job in jobs]
+
+    batch_id = new_job_id()
+    try:
+        conversion_results = await run_in_threadpool(submit_all)
+    except BaseException:
+        spool.cleanup()
+        raise
+    return BatchConversionJobResult(job_id=batch_id, conversion_results=conversion_results, status="IN_PROGRESS")
+
+
+@router.get(
+    '/batch-conversion-jobs/{job_id}',
+    response_model=BatchConversionJobResult,
+    response_model_exclude_none=True,
+    description="Poll the status and results of an asynchronous batch conversion job",
+)
+async def get_batch_conversion_job(job_id: str):
+    result = await run_in_threadpool(job_store.get_batch_result, job_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"Batch conversion job not found: {job_id}")
+    return result
+
+
+# S3 ingestion job endpoints
+@router.post(
+    '/ingestion-jobs',
+    response_model=IngestionJobResult,
+    response_model_exclude_none=True,
+    status_code=202,
+    description="Convert documents stored in S3 and write their results to S3, skipping documents already converted",
+)
+async def submit_ingestion_job(
+    request: S3IngestionRequest,
+    options: ConversionOptions = Depends(),
+):
+    try:
+        return ingestion.submit(
+            new_job_id(),
+            request,
+            **options.kwargs,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get(
+    '/ingestion-jobs/{job_id}',
+    response_model=IngestionJobResult,
+    response_model_exclude_none=True,
+    description="Poll the progress of an S3 ingestion job",
+)
+async def get_ingestion_job(
+    job_id: str,
+    target: Optional[str] = Query(
+        None, description="The s3:// target of the job, to read its progress from S3 when another replica runs it"
+    ),
+):
+    try:
+        result = await run_in_threadpool(ingestion.get, job_id, target)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"Ingestion job not found: {job_id}")
+    return result
+
+
+@router.get(
+    '/documents/queue',
+    response_model=ConversionQueueStats,
+    description="Depth and wait time of the synchronous conversion queue, for backlog-based autoscaling",
+)
+async def conversion_queue_stats():
+    return conversion_executor.stats()
+
+
+@router.get(
+    '/converters/stats',
+    response_model=ConverterPoolStats,
+    description="Hit/miss/eviction counters of the warm document converter pool",
+)
+async def converter_pool_stats():
+    return converter.converter_pool.stats()
+
+
+@router.get(
+    '/metrics',
+    include_in_schema=False,
+    description="Prometheus metrics: stage latencies per input format, VLM calls, queue depths and cache hit rates",
+)
+async def metrics():
+    return Response(registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
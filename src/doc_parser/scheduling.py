@@ -0,0 +1,131 @@
+"""Order in which waiting conversions get a worker, by their preflight cost estimate.
+
+- `fifo`: arrival order
+- `sjf`: shortest job first, the cheapest waiting conversion starts next
+- `fair`: start-time fair queuing across tenants, each tenant is charged the cost of what it ran divided by the
+  weight of its priority class, and the tenant charged least goes next; within a tenant the cheapest goes first
+
+In `sjf` the priority weight divides the cost as well. Whatever the policy, a conversion that has waited
+`max_wait` seconds goes before every conversion that arrived after it, so large documents are delayed, not starved.
+"""
+import time
+import asyncio
+import itertools
+import threading
+from typing import Dict, List, NamedTuple, Optional
+
+from doc_parser.settings import SCHEDULER_MAX_WAIT, SCHEDULER_POLICY, SCHEDULER_PRIORITY_WEIGHTS
+
+SCHEDULER_POLICIES = ("fifo", "sjf", "fair")
+
+DEFAULT_TENANT = "default"
+DEFAULT_PRIORITY = "normal"
+
+
+class Ticket(NamedTuple):
+    """What the scheduler knows of a conversion: its estimated cost, who submitted it and how urgent it is."""
+
+    cost: float = 0.0
+    tenant: str = DEFAULT_TENANT
+    priority: str = DEFAULT_PRIORITY
+
+
+class _Waiter(NamedTuple):
+    ticket: Ticket
+    sequence: int
+    enqueued_at: float
+    future: asyncio.Future
+
+
+class Scheduler:
+    """Hands the `slots` of an executor to waiting conversions in the order of `policy`."""
+
+    def __init__(
+        self,
+        slots: int,
+        policy: str = SCHEDULER_POLICY,
+        max_wait: float = SCHEDULER_MAX_WAIT,
+        weights: Optional[Dict[str, float]] = None,
+    ):
+        if policy not in SCHEDULER_POLICIES:
+            raise ValueError(f"Unsupported scheduler policy: {policy}")
+        self.policy = policy
+        self.max_wait = max_wait
+        self.weights = weights if weights is not None else SCHEDULER_PRIORITY_WEIGHTS
+        self._free = slots
+        self._waiting: List[_Waiter] = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        # fair queuing: virtual time of the last conversion started and the finish tag of each tenant
+        self._virtual_time = 0.0
+        self._finish_tags: Dict[str, float] = {}
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiting)
+
+    def _weighted_cost(self, ticket: Ticket) -> float:
+        return ticket.cost / self.weights.get(ticket.priority, 1.0)
+
+    def _start_tag(self, ticket: Ticket) -> float:
+        # a tenant that was idle starts at the current virtual time, it can't save up a share for later
+        return max(self._finish_tags.get(ticket.tenant, 0.0), self._virtual_time)
+
+    def _charge(self, ticket: Ticket) -> None:
+        if self.policy != "fair":
+            return
+        start = self._start_tag(ticket)
+        self._finish_tags[ticket.tenant] = start + self._weighted_cost(ticket)
+        self._virtual_time = start
+        if len(self._finish_tags) > 1024:
+            # tenants at or behind the virtual time are the same as tenants never seen
+            self._finish_tags = {tenant: tag for tenant, tag in self._finish_tags.items() if tag > self._virtual_time}
+
+    def _next(self) -> _Waiter:
+        now = time.monotonic()
+        starving = [waiter for waiter in self._waiting if now - waiter.enqueued_at >= self.max_wait]
+        if starving or self.policy == "fifo":
+            return min(starving or self._waiting, key=lambda waiter: waiter.sequence)
+        if self.policy == "sjf":
+            return min(self._waiting, key=lambda waiter: (self._weighted_cost(waiter.ticket), waiter.sequence))
+        return min(
+            self._waiting,
+            key=lambda waiter: (self._start_tag(waiter.ticket), waiter.ticket.cost, waiter.sequence),
+        )
+
+    async def acquire(self, ticket: Ticket) -> None:
+        """Wait for a slot, every acquire must be followed by one `release`."""
+        with self._lock:
+            if self._free > 0:
+                self._free -= 1
+                self._charge(ticket)
+                return
+            waiter = _Waiter(ticket, next(self._sequence), time.monotonic(), asyncio.get_running_loop().create_future())
+            self._waiting.append(waiter)
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiting:
+                    self._waiting.remove(waiter)
+                    raise
+            # the slot was handed over just as the request went away, pass it on
+            self.release()
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            if not self._waiting:
+                self._free += 1
+                return
+            waiter = self._next()
+            self._waiting.remove(waiter)
+            self._charge(waiter.ticket)
+        # the slot now belongs to the waiter, a cancelled waiter passes it on in acquire
+        waiter.future.get_loop().call_soon_threadsafe(_grant, waiter.future)
+
+
+def _grant(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 from typing import List, Literal, Optional, Dict, Any
 
 
@@ -24,8 +24,16 @@ class ImageData(BaseModel):
 
 class ConversionResult(BaseModel):
     filename: str = Field(None, description="The filename of the document")
-    chunk_dicts: List[ParserChunk] = Field(default_factory=ParserChunk, description="The list of chunks in the document")
+    chunk_dicts: List[ParserChunk] = Field(default_factory=list, description="The list of chunks in the document")
     error: Optional[str] = Field(None, description="The error that occurred during the conversion")
+    ocr_pages: Optional[int] = Field(None, description="The number of pages that went through OCR, for PDF documents")
+    reused_pages: Optional[List[int]] = Field(
+        None, description="The pages taken unchanged from an earlier revision, for incremental conversions"
+    )
+    # HIT/MISS from the result cache, reported as a response header rather than in the body
+    _cache_status: Optional[str] = PrivateAttr(None)
+    # pictures the VLM failed to describe, which keep only their caption: the result is not cached
+    _vlm_failures: int = PrivateAttr(0)
 
 
 class BatchConversionResult(BaseModel):
@@ -50,3 +58,65 @@ class BatchConversionJobResult(BaseModel):
         None, description="The status of the entire conversion jobs in the batch"
     )
     error: Optional[str] = Field(None, description="If the entire batch failed, this will be the error message")
+
+
+class ConverterPoolStats(BaseModel):
+    size: int = Field(..., description="The number of warm converters in the pool")
+    capacity: int = Field(..., description="The maximum number of converters allowed by the memory budget")
+    memory_mb: int = Field(..., description="The estimated memory held by the pool in MB")
+    hits: int = Field(..., description="The number of requests served by a warm converter")
+    misses: int = Field(..., description="The number of requests that had to build a new converter")
+    evictions: int = Field(..., description="The number of converters evicted to stay within the memory budget")
+
+
+class ConversionJob(BaseModel):
+    job_id: str = Field(..., description="The id of the conversion job")
+    filename: str = Field(..., description="The filename of the document")
+    file_bytes: bytes = Field(b"", description="The raw document content", exclude=True)
+    file_path: Optional[str] = Field(None, description="The spooled upload, removed once the job is done", exclude=True)
+    options: Dict[str, Any] = Field(default_factory=dict, description="The conversion parameters")
+
+
+class ConversionQueueStats(BaseModel):
+    kind: str = Field(..., description="The executor kind, thread or process")
+    policy: str = Field(..., description="The order waiting conversions start in: fifo, sjf or fair")
+    max_workers: int = Field(..., description="The number of conversions that can run at once")
+    max_queue: int = Field(..., description="The number of conversions that can wait for a worker")
+    queue_depth: int = Field(..., description="The number of conversions waiting for a worker")
+    running: int = Field(..., description="The number of conversions currently running")
+    completed: int = Field(..., description="The number of conversions finished since startup")
+    rejected: int = Field(..., description="The number of conversions rejected because the queue was full")
+    last_wait_seconds: float = Field(..., description="The queue wait time of the last conversion")
+    avg_wait_seconds: float = Field(..., description="The average queue wait time since startup")
+
+
+class S3IngestionRequest(BaseModel):
+    uris: List[str] = Field(default_factory=list, description="s3://bucket/key URIs of the documents to convert")
+    prefix: Optional[str] = Field(None, description="s3://bucket/prefix under which every supported document is converted")
+    target: str = Field(..., description="s3://bucket/prefix the ConversionResult JSON of each document is written under")
+    overwrite: bool = Field(False, description="Convert documents again even when their result is newer than them")
+
+
+class IngestionJobResult(BaseModel):
+    job_id: str = Field(..., description="The id of the ingestion job")
+    target: str = Field(..., description="The prefix the results are written under")
+    status: Literal["IN_PROGRESS", "SUCCESS", "FAILURE"] = Field("IN_PROGRESS", description="The status of the job")
+    total: int = Field(0, description="The number of documents found")
+    converted: int = Field(0, description="The number of documents converted and written so far")
+    skipped: int = Field(0, description="The number of documents whose result was already up to date")
+    failed: int = Field(0, description="The number of documents that failed to download or convert")
+    errors: Dict[str, str] = Field(default_factory=dict, description="The error of each failed document, by URI")
+    error: Optional[str] = Field(None, description="If the whole job failed, e.g. listing the prefix, the error message")
+
+
+class DocumentEstimate(BaseModel):
+    filename: str = Field(..., description="The filename of the document")
+    input_format: Optional[str] = Field(None, description="The detected input format, None if unsupported")
+    size_bytes: int = Field(..., description="The size of the document in bytes")
+    pages: int = Field(..., description="The number of pages, slides or, for text formats, 1")
+    images: int = Field(..., description="The estimated number of embedded images")
+    text_layer: bool = Field(..., description="Whether the text can be read without OCR")
+    ocr_pages: int = Field(..., description="The estimated number of pages that go through OCR")
+    cost: float = Field(
+        ..., description="The estimated conversion time in seconds on one worker, meant for ordering and routing work"
+    )
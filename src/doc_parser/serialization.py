@@ -0,0 +1,136 @@
+"""Response bodies of the conversion endpoints: JSON, columnar JSON or msgpack, compressed as the client accepts.
+
+Results are dumped straight from the models by pydantic-core, without FastAPI's response_model round trip
+(dump to dict, validate again, serialise the dict with the json module).
+"""
+import gzip
+from functools import lru_cache
+from typing import Any, Dict, List, Literal, Optional, Tuple, Union
+
+import pydantic_core
+from fastapi import HTTPException, Response
+from pydantic import TypeAdapter
+from starlette.concurrency import run_in_threadpool
+
+from doc_parser.metrics import timed
+from doc_parser.schema import ConversionResult
+from doc_parser.settings import RESPONSE_COMPRESSION_MIN_BYTES, RESPONSE_GZIP_LEVEL, RESPONSE_ZSTD_LEVEL
+
+# json: the ConversionResult as is, columnar: chunk fields as parallel arrays, msgpack: the json shape in msgpack
+ResponseFormat = Literal["json", "columnar", "msgpack"]
+
+RESPONSE_MEDIA_TYPES = {
+    "json": "application/json",
+    "columnar": "application/vnd.doc-parser.columnar+json",
+    "msgpack": "application/msgpack",
+}
+
+# ParserChunkMetadata fields carried by the columnar format, bbox is always null
+CHUNK_COLUMNS = ("page_number", "chunk_type", "file_type", "filename", "headings")
+
+
+def to_columns(result: ConversionResult) -> Dict[str, Any]:
+    """The result with its chunks as one array per field instead of one object per chunk."""
+    columns: Dict[str, Any] = result.model_dump(mode="json", exclude_unset=True, exclude={"chunk_dicts"})
+    chunks = result.chunk_dicts
+    metadata = [chunk.metadata for chunk in chunks]
+    columns["chunks"] = {
+        "text": [chunk.text for chunk in chunks],
+        **{name: [getattr(item, name) for item in metadata] for name in CHUNK_COLUMNS},
+    }
+    return columns
+
+
+def _msgpack():
+    try:
+        import msgpack
+    except ImportError:
+        raise HTTPException(status_code=406, detail="msgpack output needs the msgpack package on the server")
+    return msgpack
+
+
+def check_response_format(response_format: ResponseFormat) -> None:
+    """Refuse a format the server can't encode before converting anything."""
+    if response_format == "msgpack":
+        _msgpack()
+
+
+def encode(
+    adapter: TypeAdapter, content: Union[ConversionResult, List[ConversionResult]], response_format: ResponseFormat
+) -> bytes:
+    if response_format == "columnar":
+        columns = [to_columns(result) for result in content] if isinstance(content, list) else to_columns(content)
+        return pydantic_core.to_json(columns)
+    if response_format == "msgpack":
+        return _msgpack().packb(adapter.dump_python(content, mode="json", exclude_unset=True))
+    return adapter.dump_json(content, exclude_unset=True)
+
+
+@lru_cache(maxsize=1)
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """zstd when the client accepts it and zstandard is installed, else gzip if accepted, else None."""
+    accepted = set()
+    for coding in (accept_encoding or "").split(","):
+        name, *params = [part.strip() for part in coding.split(";")]
+        quality = next((param[2:] for param in params if param.startswith("q=")), "1")
+        try:
+            # "gzip;q=0" explicitly refuses the coding
+            if float(quality) > 0:
+                accepted.add(name.lower())
+        except ValueError:
+            continue
+
+    if "zstd" in accepted and _zstandard() is not None:
+        return "zstd"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        # compressors are not thread-safe, and cheap to create
+        return _zstandard().ZstdCompressor(level=RESPONSE_ZSTD_LEVEL).compress(body)
+    # mtime=0 keeps the output deterministic, the same result always compresses to the same bytes
+    return gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL, mtime=0)
+
+
+def _encode_body(
+    adapter: TypeAdapter,
+    content: Union[ConversionResult, List[ConversionResult]],
+    response_format: ResponseFormat,
+    accept_encoding: Optional[str],
+) -> Tuple[bytes, Optional[str]]:
+    # serialise here rather than through response_model so the time shows up as its own stage
+    with timed("serialize"):
+        body = encode(adapter, content, response_format)
+
+    encoding = negotiate_encoding(accept_encoding) if len(body) >= RESPONSE_COMPRESSION_MIN_BYTES else None
+    if encoding:
+        with timed("compress"):
+            body = compress(body, encoding)
+    return body, encoding
+
+
+async def encoded_response(
+    adapter: TypeAdapter,
+    content: Union[ConversionResult, List[ConversionResult]],
+    response_format: ResponseFormat = "json",
+    accept_encoding: Optional[str] = None,
+    headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    # dumping and compressing a large batch takes long enough to stall every other request on the event loop
+    body, encoding = await run_in_threadpool(_encode_body, adapter, content, response_format, accept_encoding)
+
+    headers = {**(headers or {}), "Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type=RESPONSE_MEDIA_TYPES[response_format], headers=headers)
@@ -1,14 +1,19 @@
 import re
+import json
+import base64
 
-from io import BytesIO
+from functools import lru_cache
+from itertools import groupby
+from pathlib import Path
 from abc import ABC, abstractmethod
-from typing import List, Tuple, Optional, Any
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Tuple, Optional, Any, Union
 
 from fastapi import HTTPException
 
 from docling.datamodel.base_models import InputFormat, DocumentStream
-from docling.datamodel.pipeline_options import PdfPipelineOptions, EasyOcrOptions
-from docling.pipeline.standard_pdf_pipeline import StandardPdfPipeline
+from docling.datamodel.document import ConversionResult as DLConversionResult
+from docling.datamodel.settings import settings as docling_settings
+from docling.datamodel.pipeline_options import PdfPipelineOptions
 from docling.backend.docling_parse_v2_backend import DoclingParseV2DocumentBackend
 from docling.datamodel.base_models import InputFormat
 from docling.document_converter import (
@@ -36,33 +41,93 @@ from docling_core.transforms.chunker.hierarchical_chunker import (
 
 from doc_parser.schema import ConversionResult, ParserChunk
 
-from doc_parser.utils import image_to_text
+from doc_parser.batch import BatchEngine, holding
+from doc_parser.cache import TieredCache, create_cache
+from doc_parser.fastpath import FAST_PATH_BACKENDS, convert_text_document
+from doc_parser.incremental import page_store, splice
+from doc_parser.metrics import record_stage, timed, timed_iter
+from doc_parser.ocr import AdaptiveEasyOcrOptions, AdaptiveOcrPdfPipeline, pop_ocr_pages
+from doc_parser.sizing import ChunkSizer, get_chunk_sizer
+from doc_parser.sharding import convert_shards, is_pdf, merge_documents, split_pdf
+from doc_parser.pool import ConverterPool, converter_pool, pipeline_key
+from doc_parser.uploads import DocumentSource, read_head, sha256_source
+from doc_parser.utils import ImagePolicy, MimeTypeToFormat, collect_vlm_failures, guess_format, image_text_memo
 from doc_parser.settings import (
     IMAGE_RESOLUTION_SCALE, 
+    IMAGE_MAX_PER_DOCUMENT,
+    IMAGE_MIN_AREA,
+    IMAGE_POLICY,
+    CHUNK_MAX_TOKENS,
+    CHUNK_SIZING,
+    CHUNK_TOKENIZER,
+    FAST_PATH_ENABLED,
     MAX_TOKENS,
+    METRICS_ENABLED,
+    OCR_LANGS,
+    OCR_MODE,
+    OCR_TEXT_COVERAGE,
+    RESULT_CACHE_BACKEND,
+    RESULT_CACHE_DIR,
+    RESULT_CACHE_DISK_MB,
+    RESULT_CACHE_ENABLED,
+    RESULT_CACHE_MEMORY_MB,
+    RESULT_CACHE_TTL,
     TEMPERATURE, 
     TOP_P, 
     logger
 )
 
+# docling only records its per-model (layout, ocr, table_structure, ...) timings when profiling is on
+docling_settings.debug.profile_pipeline_timings = METRICS_ENABLED
+
+# Heading patterns of the chunking hot loops, compiled once
+LEADING_HEADING_MARKER_PATTERN = re.compile(r"^#+ ")
+HEADING_MARKER_PATTERN = re.compile(r"#+ ")
+SUBSECTION_NUMBER_PATTERN = re.compile(r"\d+\.\d+ ")
+SECTION_NUMBER_PATTERN = re.compile(r"\d+\.? ")
+
+
+@lru_cache(maxsize=1024)
+def _strip_heading_marker(heading: str) -> str:
+    # every chunk under a heading asks for the same one
+    return LEADING_HEADING_MARKER_PATTERN.sub("", heading)
+
 
 class DocumentConversionBase(ABC):
     @abstractmethod
-    def convert(self, document: Tuple[str, BytesIO], **kwargs) -> ConversionResult:
+    def convert(self, document: Tuple[str, DocumentSource], **kwargs) -> ConversionResult:
         pass
 
     @abstractmethod
-    def convert_batch(self, documents: List[Tuple[str, BytesIO]], **kwargs) -> List[ConversionResult]:
+    def convert_batch(self, documents: List[Tuple[str, DocumentSource]], **kwargs) -> List[ConversionResult]:
         pass
 
+    def convert_batch_iter(self, documents: List[Tuple[str, DocumentSource]], **kwargs) -> Iterator[ConversionResult]:
+        """Yield each result as soon as its document is converted, converters may override this to stream."""
+        yield from self.convert_batch(documents, **kwargs)
+
+    def convert_batch_iter_chunks(
+        self, documents: List[Tuple[str, DocumentSource]], **kwargs
+    ) -> Iterator[Union[ParserChunk, ConversionResult]]:
+        """Yield the ParserChunks of each document followed by its ConversionResult, whose chunks are not to be used.
+
+        Converters may override this to emit chunks while the document is still being chunked.
+        """
+        for result in self.convert_batch_iter(documents, **kwargs):
+            yield from result.chunk_dicts
+            yield result
+
 
 class DoclingDocumentConversion(DocumentConversionBase):
+    def __init__(self, pool: Optional[ConverterPool] = None):
+        self.converter_pool = pool or converter_pool
+
     def _setup_pipeline_options(
         self, 
         extract_tables: bool = False,
         generate_page_images: bool = False,
         generate_picture_images: bool = True,
-        orc_langs: Optional[List[str]] = ["fr", "de", "es", "en"],
+        orc_langs: Optional[List[str]] = OCR_LANGS,
         image_resolution_scale: int = IMAGE_RESOLUTION_SCALE,
     ) -> PdfPipelineOptions:
         pipeline_options = PdfPipelineOptions()
@@ -70,245 +135,820 @@ class DoclingDocumentConversion(DocumentConversionBase):
         pipeline_options.generate_page_images = generate_page_images
         pipeline_options.generate_table_images = extract_tables
         pipeline_options.generate_picture_images = generate_picture_images
-        pipeline_options.ocr_options = EasyOcrOptions(lang=orc_langs)
+        pipeline_options.do_ocr = OCR_MODE != "off"
+        # bitmap mode runs the same model without the text-layer check, so it counts ocr_pages too
+        pipeline_options.ocr_options = AdaptiveEasyOcrOptions(
+            lang=orc_langs, text_coverage_threshold=OCR_TEXT_COVERAGE if OCR_MODE == "adaptive" else None
+        )
 
         return pipeline_options
 
+    def _get_converter(
+        self,
+        extract_tables: bool = False,
+        generate_page_images: bool = False,
+        generate_picture_images: bool = True,
+        orc_langs: Optional[List[str]] = OCR_LANGS,
+        image_resolution_scale: int = IMAGE_RESOLUTION_SCALE,
+    ) -> DocumentConverter:
+        key = pipeline_key(extract_tables, image_resolution_scale, orc_langs, generate_picture_images, generate_page_images)
+
+        def build_converter() -> DocumentConverter:
+            pipeline_options = self._setup_pipeline_options(
+                extract_tables, generate_page_images, generate_picture_images, list(key[2]), image_resolution_scale
+            )
+            return DocumentConverter(
+                # whitelist formats, non-matching files are ignored.
+                # csv/xlsx is converted into list-of-tables html
+                # ppt/pptx is converted into pdf
+                allowed_formats=[
+                    InputFormat.PDF,
+                    InputFormat.IMAGE,
+                    InputFormat.DOCX,
+                    InputFormat.HTML,
+                    InputFormat.PPTX,
+                    InputFormat.MD,
+                    InputFormat.ASCIIDOC,
+                ],
+                format_options={
+                    InputFormat.PDF: PdfFormatOption(
+                        pipeline_cls=AdaptiveOcrPdfPipeline,
+                        backend=DoclingParseV2DocumentBackend,
+                        pipeline_options=pipeline_options,
+                    ),
+                },
+            )
+
+        return self.converter_pool.get(key, build_converter)
+
+    def warm_up(self) -> None:
+        """Build the default converter and load its PDF pipeline models ahead of the first request."""
+        # converters built for other options, e.g. OCR languages, don't evict it
+        self.converter_pool.pin(pipeline_key(False, IMAGE_RESOLUTION_SCALE, OCR_LANGS, True, False))
+        doc_converter = self._get_converter()
+        with self.converter_pool.lock(doc_converter):
+            doc_converter.initialize_pipeline(InputFormat.PDF)
+        logger.info(f"Warmed up default document converter: {self.converter_pool.stats()}")
+
     @staticmethod
-    def _process_document_image(dl_doc: DLDocument, item: PictureItem, max_tokens: int = MAX_TOKENS, temperature: float = TEMPERATURE, top_p: float = TOP_P) -> Optional[str]:
-        text = None
+    def _document_image_bytes(item: PictureItem) -> bytes:
         if not item.image:
-            raise ValueError("AWS Credentials are missed. Please check the infrastructure.")
-        
-        # use VLM for converting
-        base64_image = str(item.image.uri).replace("data:image/png;base64,", "").strip()
+            raise ValueError(f"Picture {item.self_ref} has no image, was the document converted with picture images?")
 
-        image_text = image_to_text(
-            base64_image,
-            max_tokens=max_tokens,
-            temperature=temperature,
-            top_p=top_p,
-        )
+        # docling keeps pictures as PNG data URIs, decode the payload once and hand the PNG on as is
+        uri = str(item.image.uri)
+        return base64.b64decode(uri[uri.index(",") + 1 :])
+
+    @staticmethod
+    def _select_pictures(
+        items: List[PictureItem], max_images: int = IMAGE_MAX_PER_DOCUMENT, min_area: int = IMAGE_MIN_AREA
+    ) -> List[PictureItem]:
+        """Pictures worth a VLM call: with an image of at least `min_area` pixels, the first `max_images` of them."""
+        selected = [
+            item
+            for item in items
+            if item.image and (not min_area or item.image.size.width * item.image.size.height >= min_area)
+        ]
+        return selected[:max_images] if max_images else selected
 
+    @staticmethod
+    def _clean_image_text(image_text: str) -> str:
         # remove useless text
         image_text = image_text.replace(
             "Extract all text in the given image in markdown.",
             "",
         ).strip()
 
-        # just add when there is text
+        # just keep it when there is text
         if (
             image_text
             and "no text" not in image_text.lower()
             and "not contain any" not in image_text.lower()
         ):
+            return image_text
+        return ""
+
+    @staticmethod
+    def _image_text_to_chunk_text(dl_doc: DLDocument, item: PictureItem, image_text: str) -> Optional[str]:
+        text = None
+
+        # just add when there is text
+        if image_text:
             text = item.caption_text(dl_doc) + f"```{image_text}```"
 
         return text
 
+    @staticmethod
+    def _process_document_image(dl_doc: DLDocument, item: PictureItem, max_tokens: int = MAX_TOKENS, temperature: float = TEMPERATURE, top_p: float = TOP_P) -> Optional[str]:
+        return DoclingDocumentConversion._process_document_images(dl_doc, [item], max_tokens, temperature, top_p)[0]
+
+    @staticmethod
+    def _process_document_images(dl_doc: DLDocument, items: List[PictureItem], max_tokens: int = MAX_TOKENS, temperature: float = TEMPERATURE, top_p: float = TOP_P) -> List[Optional[str]]:
+        """Describe pictures with the VLM, concurrently and memoised per image content."""
+        images = [DoclingDocumentConversion._document_image_bytes(item) for item in items]
+
+        image_texts = image_text_memo.images_to_text(
+            images,
+            DoclingDocumentConversion._clean_image_text,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            top_p=top_p,
+        )
+
+        return [
+            DoclingDocumentConversion._image_text_to_chunk_text(dl_doc, item, image_text)
+            for item, image_text in zip(items, image_texts)
+        ]
+
+    @staticmethod
+    def _record_docling_timings(conv_res: DLConversionResult) -> None:
+        input_format = conv_res.input.format.value if conv_res.input.format else None
+        for stage, item in conv_res.timings.items():
+            record_stage("docling" if stage == "pipeline_total" else f"docling_{stage}", sum(item.times), input_format)
+
+    @staticmethod
+    def _docling_source(filename: str, file: DocumentSource):
+        # spooled uploads are handed over as paths so docling reads them lazily from disk
+        return file if isinstance(file, Path) else DocumentStream(name=filename, stream=file)
+
+    @staticmethod
+    def fast_path_format(filename: str, file: DocumentSource) -> Optional[InputFormat]:
+        """The format of a text-native document that can skip DocumentConverter, None for the others."""
+        if not FAST_PATH_ENABLED:
+            return None
+        detected = guess_format(read_head(file), filename)
+        # utils keeps its own copy of the InputFormat enum
+        input_format = InputFormat(detected.value) if detected else None
+        return input_format if input_format in FAST_PATH_BACKENDS else None
+
+    @staticmethod
+    def _parse_text_document(
+        filename: str, file: DocumentSource, input_format: InputFormat
+    ) -> Tuple[Optional[DLDocument], Optional[str]]:
+        with timed("docling", input_format.value):
+            dl_doc, error = convert_text_document(filename, file, input_format)
+        if error:
+            logger.error(f"Failed to convert {filename}: {error}")
+        return dl_doc, error
+
+    def _convert_to_document(
+        self,
+        document: Tuple[str, DocumentSource],
+        extract_tables: bool = False,
+        generate_page_images: bool = False,
+        generate_picture_images: bool = True,
+        orc_langs: Optional[List[str]] = OCR_LANGS,
+        image_resolution_scale: int = IMAGE_RESOLUTION_SCALE,
+    ) -> Tuple[Optional[DLDocument], Optional[str], Optional[int]]:
+        """Returns the document or the error, and how many of its pages were OCR'd (None for non-PDF formats)."""
+        filename, file = document
+        if input_format := self.fast_path_format(filename, file):
+            return (*self._parse_text_document(filename, file, input_format), None)
+
+        doc_converter = self._get_converter(extract_tables, generate_page_images, generate_picture_images, orc_langs, image_resolution_scale)
+        with holding(self.converter_pool.lock(doc_converter)):
+            conv_res = doc_converter.convert(self._docling_source(filename, file), raises_on_error=False)
+        self._record_docling_timings(conv_res)
+        ocr_pages = pop_ocr_pages(conv_res)
+
+        if conv_res.errors:
+            logger.error(f"Failed to convert {filename}: {conv_res.errors[0].error_message}")
+            return None, conv_res.errors[0].error_message, ocr_pages
+
+        return conv_res.document, None, ocr_pages
+
+    def iter_document_chunks(
+        self,
+        dl_doc: DLDocument,
+        max_tokens: int = MAX_TOKENS,
+        temperature: float = TEMPERATURE,
+        top_p: float = TOP_P,
+        chunk_max_tokens: int = CHUNK_MAX_TOKENS,
+        image_policy: ImagePolicy = IMAGE_POLICY,
+        max_images: int = IMAGE_MAX_PER_DOCUMENT,
+        min_image_area: int = IMAGE_MIN_AREA,
+    ) -> Iterator[ParserChunk]:
+        """Chunk, merge and yield ParserChunks lazily, only the current merge window is held in memory."""
+        origin_format = MimeTypeToFormat.get(dl_doc.origin.mimetype) if dl_doc.origin else None
+        input_format = origin_format.value if origin_format else None
+        chunker = DoclingChunker()
+        chunks = chunker.iter_chunks(
+            dl_doc,
+            indent=4,
+            image_policy=image_policy,
+            max_images=max_images,
+            min_image_area=min_image_area,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            top_p=top_p,
+        )
+        parser_chunks = self.iter_post_processed_chunks(chunker.chunker, chunks, indent=4, max_tokens=chunk_max_tokens)
+
+        return timed_iter("chunking", parser_chunks, input_format)
+
+    def _chunk_document(
+        self,
+        filename: str,
+        dl_doc: DLDocument,
+        max_tokens: int = MAX_TOKENS,
+        temperature: float = TEMPERATURE,
+        top_p: float = TOP_P,
+        chunk_max_tokens: int = CHUNK_MAX_TOKENS,
+        image_policy: ImagePolicy = IMAGE_POLICY,
+        max_images: int = IMAGE_MAX_PER_DOCUMENT,
+        min_image_area: int = IMAGE_MIN_AREA,
+    ) -> ConversionResult:
+        chunk_dicts = list(
+            self.iter_document_chunks(
+                dl_doc,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                top_p=top_p,
+                chunk_max_tokens=chunk_max_tokens,
+                image_policy=image_policy,
+                max_images=max_images,
+                min_image_area=min_image_area,
+            )
+        )
+
+        return ConversionResult(filename=filename, chunk_dicts=chunk_dicts)
+
     def convert(
         self,
-        document: Tuple[str, BytesIO],
-        extract_tables: bool = False, 
+        document: Tuple[str, DocumentSource],
+        extract_tables: bool = False,
         generate_page_images: bool = False,
         generate_picture_images: bool = True,
-        orc_langs: Optional[List[str]] = ["fr", "de", "es", "en"],
+        orc_langs: Optional[List[str]] = OCR_LANGS,
         image_resolution_scale: int = IMAGE_RESOLUTION_SCALE,
         max_tokens: int = MAX_TOKENS,
         temperature: float = TEMPERATURE,
         top_p: float = TOP_P,
+        chunk_max_tokens: int = CHUNK_MAX_TOKENS,
+        image_policy: ImagePolicy = IMAGE_POLICY,
+        max_images: int = IMAGE_MAX_PER_DOCUMENT,
+        min_image_area: int = IMAGE_MIN_AREA,
+        shard_pages: Optional[int] = None,
+        incremental: bool = False,
     ) -> ConversionResult:
         filename, file = document
-        pipeline_options = self._setup_pipeline_options(extract_tables, generate_page_images, generate_picture_images, orc_langs, image_resolution_scale)
-        doc_converter = DocumentConverter(
-            # whitelist formats, non-matching files are ignored.
-            # csv/xlsx is converted into list-of-tables html
-            # ppt/pptx is converted into pdf
-            allowed_formats=[
-                InputFormat.PDF,
-                InputFormat.IMAGE,
-                InputFormat.DOCX,
-                InputFormat.HTML,
-                InputFormat.PPTX,
-                InputFormat.MD,
-                InputFormat.ASCIIDOC,
-            ],
-            format_options={
-                InputFormat.PDF: PdfFormatOption(
-                    pipeline_cls=StandardPdfPipeline,
-                    backend=DoclingParseV2DocumentBackend,
-                    pipeline_options=pipeline_options,
-                ),
-            },
+        pipeline_kwargs = dict(
+            extract_tables=extract_tables,
+            generate_page_images=generate_page_images,
+            # pictures are only cropped and encoded when the VLM is going to read them
+            generate_picture_images=generate_picture_images and ImagePolicy(image_policy) == ImagePolicy.VLM,
+            orc_langs=orc_langs,
+            image_resolution_scale=image_resolution_scale,
         )
 
-        conv_res = doc_converter.convert(DocumentStream(name=filename, stream=file), raises_on_error=False)
-
-        if conv_res.errors:
-            logger.error(f"Failed to convert {filename}: {conv_res.errors[0].error_message}")
-            return ConversionResult(filename=filename, error=conv_res.errors[0].error_message)
+        reused_pages = None
+        shards = split_pdf(file, shard_pages) if shard_pages and is_pdf(file) and not incremental else []
+        if incremental and page_store is not None and is_pdf(file):
+            # unchanged pages of an earlier revision come from the page store, the others are converted one by one
+            page_docs, error, ocr_pages, reused_pages = page_store.convert(
+                self._iter_converted, filename, file, **pipeline_kwargs
+            )
+            dl_doc = splice(page_docs, filename) if not error else None
+        elif len(shards) > 1:
+            # convert page ranges in parallel and merge them so headings carry across shard boundaries
+            # shard workers are separate processes, so only the wall time of the whole fan-out is recorded here
+            with timed("docling", InputFormat.PDF.value):
+                shard_docs, error, ocr_pages = convert_shards(self._convert_to_document, filename, shards, **pipeline_kwargs)
+            dl_doc = merge_documents(shard_docs) if not error else None
+        else:
+            dl_doc, error, ocr_pages = self._convert_to_document(document, **pipeline_kwargs)
 
-        chunker = DoclingChunker()
-        chunks = chunker.hierarchical_chunk(conv_res.document, indent=4, max_tokens=max_tokens, temperature=temperature, top_p=top_p)
+        if error:
+            return ConversionResult(filename=filename, error=error)
 
-        chunk_dicts = self.post_process_chunks(chunker.chunker, chunks, indent=4)
-        
-        return ConversionResult(filename=filename, chunk_dicts=chunk_dicts)
+        result = self._chunk_document(
+            filename,
+            dl_doc,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            chunk_max_tokens=chunk_max_tokens,
+            image_policy=image_policy,
+            max_images=max_images,
+            min_image_area=min_image_area,
+        )
+        if ocr_pages is not None:
+            result.ocr_pages = ocr_pages
+        if reused_pages is not None:
+            result.reused_pages = reused_pages
+        return result
 
     def convert_batch(
         self,
-        documents: List[Tuple[str, BytesIO]],
-        extract_tables: bool = False, 
+        documents: List[Tuple[str, DocumentSource]],
+        extract_tables: bool = False,
         generate_page_images: bool = False,
         generate_picture_images: bool = True,
-        orc_langs: Optional[List[str]] = ["fr", "de", "es", "en"],
+        orc_langs: Optional[List[str]] = OCR_LANGS,
         image_resolution_scale: int = IMAGE_RESOLUTION_SCALE,
         max_tokens: int = MAX_TOKENS,
         temperature: float = TEMPERATURE,
         top_p: float = TOP_P,
+        chunk_max_tokens: int = CHUNK_MAX_TOKENS,
+        image_policy: ImagePolicy = IMAGE_POLICY,
+        max_images: int = IMAGE_MAX_PER_DOCUMENT,
+        min_image_area: int = IMAGE_MIN_AREA,
     ) -> List[ConversionResult]:
-        pipeline_options = self._setup_pipeline_options(extract_tables, generate_page_images, generate_picture_images, orc_langs, image_resolution_scale)
-        doc_converter = DocumentConverter(
-            # whitelist formats, non-matching files are ignored.
-            # csv/xlsx is converted into list-of-tables html
-            # ppt/pptx is converted into pdf
-            allowed_formats=[
-                InputFormat.PDF,
-                InputFormat.IMAGE,
-                InputFormat.DOCX,
-                InputFormat.HTML,
-                InputFormat.PPTX,
-                InputFormat.MD,
-                InputFormat.ASCIIDOC,
-            ],
-            format_options={
-                InputFormat.PDF: PdfFormatOption(
-                    pipeline_cls=StandardPdfPipeline,
-                    backend=DoclingParseV2DocumentBackend,
-                    pipeline_options=pipeline_options,
-                ),
-            },
+        return list(
+            self.convert_batch_iter(
+                documents,
+                extract_tables=extract_tables,
+                generate_page_images=generate_page_images,
+                generate_picture_images=generate_picture_images,
+                orc_langs=orc_langs,
+                image_resolution_scale=image_resolution_scale,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                top_p=top_p,
+                chunk_max_tokens=chunk_max_tokens,
+                image_policy=image_policy,
+                max_images=max_images,
+                min_image_area=min_image_area,
+            )
         )
 
-        conv_results = doc_converter.convert_all(
-            [DocumentStream(name=filename, stream=file) for filename, file in documents],
-            raises_on_error=False,
+    def _iter_converted(
+        self,
+        documents: List[Tuple[str, DocumentSource]],
+        extract_tables: bool = False,
+        generate_page_images: bool = False,
+        generate_picture_images: bool = True,
+        orc_langs: Optional[List[str]] = OCR_LANGS,
+        image_resolution_scale: int = IMAGE_RESOLUTION_SCALE,
+    ) -> Iterator[Tuple[str, Optional[DLDocument], Optional[str], Optional[int]]]:
+        # text-native documents take the fast path, the runs of other documents in between go through convert_all
+        for input_format, run in groupby(documents, key=lambda document: self.fast_path_format(*document)):
+            if input_format is not None:
+                for filename, file in run:
+                    yield (filename, *self._parse_text_document(filename, file, input_format), None)
+                continue
+
+            doc_converter = self._get_converter(
+                extract_tables, generate_page_images, generate_picture_images, orc_langs, image_resolution_scale
+            )
+            # convert_all is lazy, every document is chunked and released before the next one is converted
+            conv_results = doc_converter.convert_all(
+                [self._docling_source(filename, file) for filename, file in run],
+                raises_on_error=False,
+            )
+            lock = self.converter_pool.lock(doc_converter)
+
+            while True:
+                # the converter is only held while a document converts, not while the caller chunks it
+                with holding(lock):
+                    conv_res = next(conv_results, None)
+                if conv_res is None:
+                    break
+                self._record_docling_timings(conv_res)
+                ocr_pages = pop_ocr_pages(conv_res)
+                if conv_res.errors:
+                    logger.error(f"Failed to convert {conv_res.input.name}: {conv_res.errors[0].error_message}")
+                    yield conv_res.input.name, None, conv_res.errors[0].error_message, ocr_pages
+                    continue
+
+                yield conv_res.input.name, conv_res.document, None, ocr_pages
+
+    def convert_batch_iter(
+        self,
+        documents: List[Tuple[str, DocumentSource]],
+        extract_tables: bool = False,
+        generate_page_images: bool = False,
+        generate_picture_images: bool = True,
+        orc_langs: Optional[List[str]] = OCR_LANGS,
+        image_resolution_scale: int = IMAGE_RESOLUTION_SCALE,
+        max_tokens: int = MAX_TOKENS,
+        temperature: float = TEMPERATURE,
+        top_p: float = TOP_P,
+        chunk_max_tokens: int = CHUNK_MAX_TOKENS,
+        image_policy: ImagePolicy = IMAGE_POLICY,
+        max_images: int = IMAGE_MAX_PER_DOCUMENT,
+        min_image_area: int = IMAGE_MIN_AREA,
+    ) -> Iterator[ConversionResult]:
+        generate_picture_images = generate_picture_images and ImagePolicy(image_policy) == ImagePolicy.VLM
+        converted = self._iter_converted(
+            documents, extract_tables, generate_page_images, generate_picture_images, orc_langs, image_resolution_scale
         )
+        for filename, dl_doc, error, ocr_pages in converted:
+            if error:
+                yield ConversionResult(filename=filename, error=error)
+                continue
+
+            result = self._chunk_document(
+                filename,
+                dl_doc,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                top_p=top_p,
+                chunk_max_tokens=chunk_max_tokens,
+                image_policy=image_policy,
+                max_images=max_images,
+                min_image_area=min_image_area,
+            )
+            if ocr_pages is not None:
+                result.ocr_pages = ocr_pages
+            yield result
 
-        results = []
-        for conv_res in conv_results:
-            if conv_res.errors:
-                logger.error(f"Failed to convert {conv_res.input.name}: {conv_res.errors[0].error_message}")
-                results.append(ConversionResult(filename=conv_res.input.name, error=conv_res.errors[0].error_message))
+    def convert_batch_iter_chunks(
+        self,
+        documents: List[Tuple[str, DocumentSource]],
+        extract_tables: bool = False,
+        generate_page_images: bool = False,
+        generate_picture_images: bool = True,
+        orc_langs: Optional[List[str]] = OCR_LANGS,
+        image_resolution_scale: int = IMAGE_RESOLUTION_SCALE,
+        max_tokens: int = MAX_TOKENS,
+        temperature: float = TEMPERATURE,
+        top_p: float = TOP_P,
+        chunk_max_tokens: int = CHUNK_MAX_TOKENS,
+        image_policy: ImagePolicy = IMAGE_POLICY,
+        max_images: int = IMAGE_MAX_PER_DOCUMENT,
+        min_image_area: int = IMAGE_MIN_AREA,
+    ) -> Iterator[Union[ParserChunk, ConversionResult]]:
+        generate_picture_images = generate_picture_images and ImagePolicy(image_policy) == ImagePolicy.VLM
+        converted = self._iter_converted(
+            documents, extract_tables, generate_page_images, generate_picture_images, orc_langs, image_resolution_scale
+        )
+        for filename, dl_doc, error, ocr_pages in converted:
+            if error:
+                yield ConversionResult(filename=filename, error=error)
                 continue
 
-            chunker = DoclingChunker()
-            chunks = chunker.hierarchical_chunk(conv_res.document, indent=4, max_tokens=max_tokens, temperature=temperature, top_p=top_p)
-            
-            chunk_dicts = self.post_process_chunks(chunker.chunker, chunks, indent=4)
+            yield from self.iter_document_chunks(
+                dl_doc,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                top_p=top_p,
+                chunk_max_tokens=chunk_max_tokens,
+                image_policy=image_policy,
+                max_images=max_images,
+                min_image_area=min_image_area,
+            )
+            end = ConversionResult(filename=filename)
+            if ocr_pages is not None:
+                end.ocr_pages = ocr_pages
+            yield end
+
+    def post_process_chunks(
+        self,
+        chunker: HierarchicalChunker,
+        chunks: Iterable[DocChunk],
+        indent: int = 4,
+        min_length: int = 32,
+        max_tokens: int = CHUNK_MAX_TOKENS,
+        sizer: Optional[ChunkSizer] = None,
+    ) -> List[ParserChunk]:
+        return list(
+            self.iter_post_processed_chunks(
+                chunker, chunks, indent=indent, min_length=min_length, max_tokens=max_tokens, sizer=sizer
+            )
+        )
 
-            results.append(ConversionResult(filename=conv_res.input.name, chunk_dicts=chunk_dicts))
+    def iter_post_processed_chunks(
+        self,
+        chunker: HierarchicalChunker,
+        chunks: Iterable[DocChunk],
+        indent: int = 4,
+        min_length: int = 32,
+        max_tokens: int = CHUNK_MAX_TOKENS,
+        sizer: Optional[ChunkSizer] = None,
+    ) -> Iterator[ParserChunk]:
+        """Merge consecutive chunks and yield each ParserChunk as soon as its merge window closes.
 
-        return results
-    
-    def post_process_chunks(self, chunker: HierarchicalChunker, chunks: List[DocChunk], indent: int = 4, min_length: int = 32) -> List[ParserChunk]:
-        chunks_dicts: list[dict] = []
-        current_item = {}
+        Text is merged while the accumulated chunk measures less than `max_tokens` with `sizer` (CHUNK_SIZING by
+        default); its length is tracked as it grows rather than re-measured.
+        """
+        sizer = sizer or get_chunk_sizer()
+        delim = chunker.delim
+        note_prefix = " " * indent
+        # metadata of the chunk being accumulated and its text parts, joined once when it is flushed
+        metadata: Optional[dict] = None
+        parts: List[str] = []
+        current_length = 0
         for chunk in chunks:
-            if not current_item:
-                heading_text = (
-                    chunker.delim.join(chunk.meta.headings)
-                    if chunk.meta.headings and re.sub(r"^#+ ", "", chunk.meta.headings[0]) not in chunk.text
-                    else ""
-                )
-                current_item = {
-                    "text": f"{heading_text}\n\n{chunk.text}".strip(),
-                    "metadata": {
-                        "page_number": chunk.meta.doc_items[0].prov[0].page_no
-                        if chunk.meta.doc_items[0].prov
-                        else 1,
-                        "chunk_type": chunk.meta.doc_items[0].label.value,
-                        "bbox": None,  # current we don't consider bbox
-                        "file_type": chunk.meta.origin.mimetype,
-                        "filename": chunk.meta.origin.filename,
-                        "headings": chunk.meta.headings,
-                    },
-                }
-                continue
+            doc_item = chunk.meta.doc_items[0]
+            label = doc_item.label.value
+            headings = chunk.meta.headings
 
-            if (
-                (  # add footnote to table
-                    current_item["metadata"]["chunk_type"] == "table"
-                    and chunk.meta.doc_items[0].label.value == "footnote"
-                )
-                or (  # add notes (list item) with higher level to table
-                    current_item["metadata"]["chunk_type"] == "table"
-                    and chunk.meta.doc_items[0].label.value == "list_item"
-                    and chunk.text.startswith(" " * indent)
-                )
-                or (  # add caption to table
-                    current_item["metadata"]["chunk_type"] == "caption"
-                    and chunk.meta.doc_items[0].label.value == "table"
-                )
-                or (  # add text with same heading and page_number with current text length < INPUT_LEN_LIMIT // 4
-                    current_item["metadata"]["chunk_type"] != "table"
-                    and chunk.meta.doc_items[0].label.value not in ["caption", "table"]
-                    and chunk.meta.headings
-                    and current_item["metadata"]["headings"]
-                    and chunk.meta.headings[0] == current_item["metadata"]["headings"][0]
-                    and len(current_item["text"].split(" ")) < MAX_TOKENS
-                    and chunk.meta.doc_items[0].prov
-                    and current_item["metadata"]["page_number"] == chunk.meta.doc_items[0].prov[0].page_no
-                )
-            ):
-                if (  # change chunk_type if caption is above table chunk
-                    current_item["metadata"]["chunk_type"] == "caption"
-                    and chunk.meta.doc_items[0].label.value == "table"
+            if metadata is not None:
+                chunk_type = metadata["chunk_type"]
+                if (
+                    (  # add footnote to table
+                        chunk_type == "table"
+                        and label == "footnote"
+                    )
+                    or (  # add notes (list item) with higher level to table
+                        chunk_type == "table"
+                        and label == "list_item"
+                        and chunk.text.startswith(note_prefix)
+                    )
+                    or (  # add caption to table
+                        chunk_type == "caption"
+                        and label == "table"
+                    )
+                    or (  # add text with same heading and page_number with current text length < chunk budget
+                        chunk_type != "table"
+                        and label not in ("caption", "table")
+                        and headings
+                        and metadata["headings"]
+                        and headings[0] == metadata["headings"][0]
+                        and current_length < max_tokens
+                        and doc_item.prov
+                        and metadata["page_number"] == doc_item.prov[0].page_no
+                    )
                 ):
-                    current_item["metadata"]["chunk_type"] = "table"
-                current_item["text"] = f"{current_item['text']}\n{chunk.text}"
-                continue
+                    if chunk_type == "caption" and label == "table":  # change chunk_type if caption is above table chunk
+                        metadata["chunk_type"] = "table"
+                    parts.append(chunk.text)
+                    current_length = sizer.extend(current_length, f"\n{chunk.text}")
+                    continue
 
-            # just add chunks with length > min_length
-            if len(current_item["text"]) > min_length:
-                current_item["text"] = (
-                    f"{current_item['text'].strip()}\n\nPage Number: {current_item['metadata']['page_number']}"
-                )
-                chunks_dicts.append(current_item)
-
-            current_item = {
-                "text": f"{chunker.delim.join(chunk.meta.headings) if chunk.meta.headings and re.sub(r'^#+ ','',chunk.meta.headings[0]) not in chunk.text else ''}\n\n{chunk.text}",  # noqa: E501
-                "metadata": {
-                    "page_number": chunk.meta.doc_items[0].prov[0].page_no if chunk.meta.doc_items[0].prov else 1,
-                    "chunk_type": chunk.meta.doc_items[0].label.value,
-                    "bbox": None,
-                    "file_type": chunk.meta.origin.mimetype,
-                    "filename": chunk.meta.origin.filename,
-                    "headings": chunk.meta.headings,
-                },
+                # just add chunks with length > min_length
+                parser_chunk = self._flush_chunk(metadata, parts, min_length)
+                if parser_chunk is not None:
+                    yield parser_chunk
+
+            heading_text = delim.join(headings) if headings and _strip_heading_marker(headings[0]) not in chunk.text else ""
+            # the first chunk of a document is stripped, the ones after a flush are not
+            text = f"{heading_text}\n\n{chunk.text}"
+            parts = [text.strip() if metadata is None else text]
+            metadata = {
+                "page_number": doc_item.prov[0].page_no if doc_item.prov else 1,
+                "chunk_type": label,
+                "bbox": None,  # current we don't consider bbox
+                "file_type": chunk.meta.origin.mimetype,
+                "filename": chunk.meta.origin.filename,
+                "headings": headings,
             }
+            current_length = sizer.count(parts[0])
 
-        if len(current_item["text"]) > min_length:
-            current_item["text"] = (
-                f"{current_item['text'].strip()}\n\nPage Number: {current_item['metadata']['page_number']}"
-            )
-            chunks_dicts.append(current_item)
-        return [ParserChunk(**chunk) for chunk in chunks_dicts]
+        # documents without any chunk leave nothing to flush
+        if metadata is not None:
+            parser_chunk = self._flush_chunk(metadata, parts, min_length)
+            if parser_chunk is not None:
+                yield parser_chunk
+
+    @staticmethod
+    def _flush_chunk(metadata: dict, parts: List[str], min_length: int) -> Optional[ParserChunk]:
+        text = "\n".join(parts)
+        if len(text) <= min_length:
+            return None
+        return ParserChunk(text=f"{text.strip()}\n\nPage Number: {metadata['page_number']}", metadata=metadata)
 
 
 class DocumentConverterService:
-    def __init__(self, doc_parser: DocumentConversionBase):
+    def __init__(
+        self,
+        doc_parser: DocumentConversionBase,
+        cache: Optional[TieredCache] = None,
+        batch_engine: Optional[BatchEngine] = None,
+    ):
         self.doc_parser = doc_parser
+        self.cache = cache
+        self.batch_engine = batch_engine or BatchEngine()
+
+    @staticmethod
+    def cache_key(document: Tuple[str, DocumentSource], **kwargs) -> str:
+        """SHA-256 of the uploaded bytes plus every parameter that changes the output."""
+        digest = sha256_source(document[1])
+        params = {
+            **kwargs,
+            "chunker_version": DoclingChunker.version,
+            "chunk_sizing": [CHUNK_SIZING, CHUNK_TOKENIZER],
+            "ocr": [OCR_MODE, OCR_TEXT_COVERAGE],
+        }
+        digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    def _get_cached(self, key: str, filename: str) -> Optional[ConversionResult]:
+        if self.cache is None:
+            return None
+        payload = self.cache.get(key)
+        if payload is None:
+            return None
+
+        # the key is content-addressed, so the same bytes may have been uploaded under another name
+        result = ConversionResult.model_validate_json(payload)
+        result.filename = filename
+        for chunk in result.chunk_dicts:
+            chunk.metadata.filename = filename
+        result._cache_status = "HIT"
+        return result
 
-    def convert_document(self, document: Tuple[str, BytesIO], **kwargs) -> ConversionResult:
-        result = self.doc_parser.convert(document, **kwargs)
+    def _set_cached(self, key: str, result: ConversionResult) -> ConversionResult:
+        if self.cache is not None and not result.error:
+            if result._vlm_failures:
+                # converted again next time, once the VLM is back the pictures get their text
+                logger.warning(f"Not caching {result.filename}, the VLM failed on {result._vlm_failures} pictures")
+            else:
+                self.cache.set(key, result.model_dump_json(exclude_unset=True).encode())
+        result._cache_status = "MISS"
+        return result
+
+    def _convert(self, document: Tuple[str, DocumentSource], **kwargs) -> ConversionResult:
+        with collect_vlm_failures() as failures:
+            result = self.doc_parser.convert(document, **kwargs)
+        result._vlm_failures = len(failures)
+        return result
+
+    def convert_document(self, document: Tuple[str, DocumentSource], **kwargs) -> ConversionResult:
+        key = self.cache_key(document, **kwargs) if self.cache is not None else None
+        if key is not None and (cached := self._get_cached(key, document[0])) is not None:
+            return cached
+
+        result = self._convert(document, **kwargs)
         if result.error:
             logger.error(f"Failed to convert {document[0]}: {result.error}")
             raise HTTPException(status_code=500, detail=result.error)
-        return result
+        return self._set_cached(key, result)
+
+    def _iter_results(
+        self,
+        documents: List[Tuple[str, DocumentSource]],
+        ordered: bool,
+        timeout: Optional[float],
+        **kwargs,
+    ) -> Iterator[Tuple[int, ConversionResult]]:
+        """Yield (index in `documents`, result), converting the documents not in the cache on the batch engine."""
+        keys: List[Optional[str]] = []
+        misses: List[int] = []
+        hits: Dict[int, ConversionResult] = {}
+        for i, document in enumerate(documents):
+            key = self.cache_key(document, **kwargs) if self.cache is not None else None
+            cached = self._get_cached(key, document[0]) if key is not None else None
+            keys.append(key)
+            if cached is not None:
+                hits[i] = cached
+            else:
+                misses.append(i)
+
+        if not ordered:
+            # cache hits are done already, emit them before anything is converted
+            yield from hits.items()
+            hits = {}
+
+        def convert(document: Tuple[str, DocumentSource]) -> ConversionResult:
+            return self._convert(document, **kwargs)
+
+        converted = self.batch_engine.iter_results(convert, [documents[i] for i in misses], ordered=ordered, timeout=timeout)
+        next_index = 0
+        for j, result in converted:
+            i = misses[j]
+            result = self._set_cached(keys[i], result)
+            if not ordered:
+                yield i, result
+                continue
+
+            # misses come back in order, release the hits that precede each of them
+            while next_index < i:
+                yield next_index, hits.pop(next_index)
+                next_index += 1
+            yield i, result
+            next_index = i + 1
+        yield from sorted(hits.items())
+
+    def convert_documents(
+        self,
+        documents: List[Tuple[str, DocumentSource]],
+        *,
+        timeout: Optional[float] = None,
+        **kwargs,
+    ) -> List[ConversionResult]:
+        """Convert every document, a document that fails or times out gets a result with `error` set."""
+        results: List[Optional[ConversionResult]] = [None] * len(documents)
+        for i, result in self._iter_results(documents, ordered=False, timeout=timeout, **kwargs):
+            results[i] = result
+        return results
+
+    def iter_documents(
+        self,
+        documents: List[Tuple[str, DocumentSource]],
+        *,
+        ordered: bool = True,
+        timeout: Optional[float] = None,
+        **kwargs,
+    ) -> Iterator[ConversionResult]:
+        """Like `convert_documents`, but yields the results in input order or, unless `ordered`, as they finish."""
+        for _, result in self._iter_results(documents, ordered=ordered, timeout=timeout, **kwargs):
+            yield result
+
+    def iter_document_chunks(
+        self,
+        documents: List[Tuple[str, DocumentSource]],
+        *,
+        ordered: bool = True,
+        timeout: Optional[float] = None,
+        **kwargs,
+    ) -> Iterator[Union[ParserChunk, ConversionResult]]:
+        """Like `iter_documents`, but yields the ParserChunks of each document followed by its ConversionResult, which
+        then only marks the end of the document.
+
+        A single document is chunked in the calling thread and every chunk is yielded as soon as it is merged. Batches,
+        and single documents with a timeout, which the calling thread couldn't enforce, are converted on the batch
+        engine, each document's chunks are yielded once it is done.
+        """
+        if len(documents) != 1 or timeout or self.batch_engine.timeout:
+            for result in self.iter_documents(documents, ordered=ordered, timeout=timeout, **kwargs):
+                yield from result.chunk_dicts
+                yield result
+            return
+
+        key = self.cache_key(documents[0], **kwargs) if self.cache is not None else None
+        cached = self._get_cached(key, documents[0][0]) if key is not None else None
+        if cached is not None:
+            yield from cached.chunk_dicts
+            yield cached
+            return
+
+        # the chunks are kept as they go out, the cache needs the complete result
+        chunks: List[ParserChunk] = []
+        with collect_vlm_failures() as failures:
+            for item in self.doc_parser.convert_batch_iter_chunks(documents, **kwargs):
+                if isinstance(item, ParserChunk):
+                    chunks.append(item)
+                    yield item
+                    continue
+
+                result = item if item.error else item.model_copy(update={"chunk_dicts": chunks})
+                result._vlm_failures = len(failures)
+                yield self._set_cached(key, result)
+
+
+def create_result_cache() -> Optional[TieredCache]:
+    if not RESULT_CACHE_ENABLED:
+        return None
+    return create_cache(
+        memory_mb=RESULT_CACHE_MEMORY_MB,
+        backend=RESULT_CACHE_BACKEND,
+        ttl=RESULT_CACHE_TTL,
+        directory=RESULT_CACHE_DIR,
+        disk_mb=RESULT_CACHE_DISK_MB,
+        namespace="results",
+    )
+
+
+class ItemKind(NamedTuple):
+    doc_item: bool
+    text: bool
+    list_item: bool
+    section_header: bool
+    table: bool
+    picture: bool
 
-    def convert_documents(self, documents: List[Tuple[str, BytesIO]], **kwargs) -> List[ConversionResult]:
-        return self.doc_parser.convert_batch(documents, **kwargs)
+
+@lru_cache(maxsize=None)
+def _item_kind(item_type: type) -> ItemKind:
+    # isinstance against pydantic models goes through their metaclass, so classify each item class once
+    return ItemKind(
+        doc_item=issubclass(item_type, DocItem),
+        text=issubclass(item_type, TextItem),
+        list_item=issubclass(item_type, ListItem),
+        section_header=issubclass(item_type, SectionHeaderItem),
+        table=issubclass(item_type, TableItem),
+        picture=issubclass(item_type, PictureItem),
+    )
+
+
+class HeadingStack:
+    """Heading in scope per level.
+
+    The ordered list of headings is built when a heading changes, not per chunk, and is shared by every chunk
+    under it.
+    """
+
+    __slots__ = ("_by_level", "_headings")
+
+    def __init__(self):
+        self._by_level: Dict[LevelNumber, str] = {}
+        self._headings: Optional[List[str]] = None
+
+    def __bool__(self) -> bool:
+        return bool(self._by_level)
+
+    @property
+    def max_level(self) -> LevelNumber:
+        return max(self._by_level)
+
+    @property
+    def top(self) -> str:
+        return self._by_level[min(self._by_level)]
+
+    @property
+    def headings(self) -> Optional[List[str]]:
+        if self._headings is None and self._by_level:
+            self._headings = [self._by_level[k] for k in sorted(self._by_level)]
+        return self._headings
+
+    def push(self, level: LevelNumber, heading: str) -> None:
+        self._by_level[level] = heading
+        # remove headings of higher level as they just went out of scope
+        for k in [k for k in self._by_level if k > level]:
+            del self._by_level[k]
+        self._headings = None
 
 
 class DoclingChunker:
@@ -327,115 +967,144 @@ class DoclingChunker:
         Args:
             dl_doc (DLDocument): document to chunk
         Returns:
-            List[DocChunk]: iterator over extracted chunks
+            List[DocChunk]: list of extracted chunks
         """
-        results: list[DocChunk] = []
-        heading_by_level: dict[LevelNumber, str] = {}
+        return list(self.iter_chunks(dl_doc, indent=indent, **kwargs))
+
+    def iter_chunks(
+        self,
+        dl_doc: DLDocument,
+        indent=4,  # for display of heading level
+        image_policy: ImagePolicy = IMAGE_POLICY,
+        max_images: int = IMAGE_MAX_PER_DOCUMENT,
+        min_image_area: int = IMAGE_MIN_AREA,
+        **kwargs: Any,
+    ) -> Iterator[DocChunk]:
+        r"""Chunk the provided document lazily, in document order.
+
+        A list closed by a footnote or by an item below the deepest heading is appended to the previous
+        chunk, so each chunk is held back until the next one is known.
+        Args:
+            dl_doc (DLDocument): document to chunk
+            image_policy (ImagePolicy): drop pictures, keep their captions or describe them with the VLM
+            max_images (int): VLM budget of the document, 0 for no limit
+            min_image_area (int): pictures smaller than this many pixels keep only their caption
+        Returns:
+            Iterator[DocChunk]: iterator over extracted chunks
+        """
+        previous: Optional[DocChunk] = None
+        headings = HeadingStack()
         list_items: list[TextItem] = []
+        delim = self.chunker.delim
+        merge_list_items = self.chunker.merge_list_items
+        origin = dl_doc.origin
+
+        # walk the tree once, the (item, level) references are cheap next to docling's traversal
+        items = list(dl_doc.iterate_items())
+
+        # send the selected pictures to the VLM up front, concurrently, and stitch the texts back in document order
+        image_policy = ImagePolicy(image_policy)
+        picture_texts = {}
+        if image_policy == ImagePolicy.VLM:
+            pictures = DoclingDocumentConversion._select_pictures(
+                [item for item, _ in items if _item_kind(type(item)).picture], max_images, min_image_area
+            )
+            picture_texts = dict(
+                zip(
+                    [picture.self_ref for picture in pictures],
+                    DoclingDocumentConversion._process_document_images(dl_doc, pictures, **kwargs),
+                )
+            )
+
+        for item, level in items:
+            kind = _item_kind(type(item))
+            if not kind.doc_item:
+                continue
 
-        for item, level in dl_doc.iterate_items():
             captions = None
             chunk_indent = " " * indent * (level - 1) if level > 1 else ""
 
-            if isinstance(item, DocItem):
-                # first handle any merging needed
-                if self.chunker.merge_list_items:
-                    if isinstance(item, ListItem) or (  # TODO remove when all captured as ListItem:
-                        isinstance(item, TextItem) and item.label == DocItemLabel.LIST_ITEM
-                    ):
-                        item.text = f"{chunk_indent}{item.text}"
-                        list_items.append(item)
-                        continue
-                    elif list_items:  # need to yield
-                        # not add chunk if level higher than current
-                        if item.label == DocItemLabel.FOOTNOTE or (
-                            results and heading_by_level and level > max(heading_by_level)
-                        ):
-                            results[
-                                -1
-                            ].text = f"{results[-1].text}\n{self.chunker.delim.join([i.text for i in list_items])}"
-                        else:
-                            results.append(
-                                DocChunk(
-                                    text=self.chunker.delim.join([i.text for i in list_items]),
-                                    meta=DocMeta(
-                                        doc_items=list_items,
-                                        headings=[heading_by_level[k] for k in sorted(heading_by_level)] or None,
-                                        origin=dl_doc.origin,
-                                    ),
-                                ),
-                            )
-                        list_items = []  # reset
-
-                if isinstance(item, SectionHeaderItem) or (
-                    isinstance(item, TextItem) and item.label in [DocItemLabel.SECTION_HEADER, DocItemLabel.TITLE]
+            # first handle any merging needed
+            if merge_list_items:
+                if kind.list_item or (  # TODO remove when all captured as ListItem:
+                    kind.text and item.label == DocItemLabel.LIST_ITEM
                 ):
-                    level = (
-                        item.level
-                        if isinstance(item, SectionHeaderItem)
-                        else (0 if item.label == DocItemLabel.TITLE else 1)
-                    )
-                    # check header hierarchy due to docling detection (6->6.1->heading text)
-                    # if match, increase the level to maximum
-                    if re.match(r"\d+\.\d+ ", item.text):
-                        level = 2
-                    elif (
-                        heading_by_level
-                        and re.sub(r"#+ ", "", heading_by_level[min(heading_by_level)])[0].isdigit()
-                        and not re.match(r"\d+\.? ", item.text)
-                    ):
-                        level = min(max(heading_by_level) + 1, 3)
-                    marker = "#" * level if level > 1 else "#"
-                    heading_by_level[level] = f"{marker} {item.text}"
-
-                    # remove headings of higher level as they just went out of scope
-                    keys_to_del = [k for k in heading_by_level if k > level]
-                    for k in keys_to_del:
-                        heading_by_level.pop(k, None)
+                    item.text = f"{chunk_indent}{item.text}"
+                    list_items.append(item)
                     continue
+                elif list_items:  # need to yield
+                    list_text = delim.join([i.text for i in list_items])
+                    # not add chunk if level higher than current
+                    if previous is not None and (
+                        item.label == DocItemLabel.FOOTNOTE or (headings and level > headings.max_level)
+                    ):
+                        previous.text = f"{previous.text}\n{list_text}"
+                    else:
+                        if previous is not None:
+                            yield previous
+                        previous = DocChunk.model_construct(
+                            text=list_text,
+                            meta=DocMeta.model_construct(doc_items=list_items, headings=headings.headings, origin=origin),
+                        )
+                    list_items = []  # reset
 
-                # skip page number text
-                if isinstance(item, TextItem) and item.prov and item.text == str(item.prov[0].page_no):
+            if kind.section_header or (
+                kind.text and item.label in (DocItemLabel.SECTION_HEADER, DocItemLabel.TITLE)
+            ):
+                level = (
+                    item.level
+                    if kind.section_header
+                    else (0 if item.label == DocItemLabel.TITLE else 1)
+                )
+                # check header hierarchy due to docling detection (6->6.1->heading text)
+                # if match, increase the level to maximum
+                if SUBSECTION_NUMBER_PATTERN.match(item.text):
+                    level = 2
+                elif (
+                    headings
+                    and HEADING_MARKER_PATTERN.sub("", headings.top)[0].isdigit()
+                    and not SECTION_NUMBER_PATTERN.match(item.text)
+                ):
+                    level = min(headings.max_level + 1, 3)
+                marker = "#" * level if level > 1 else "#"
+                headings.push(level, f"{marker} {item.text}")
+                continue
+
+            # skip page number text
+            if kind.text and item.prov and item.text == str(item.prov[0].page_no):
+                continue
+
+            if kind.text or ((not merge_list_items) and kind.list_item):
+                text = item.text
+            elif kind.table:
+                md_table = item.export_to_markdown()
+                text = item.caption_text(dl_doc) + "\n" + md_table + "\n"
+                captions = [c.text for c in [r.resolve(dl_doc) for r in item.captions]] or None
+            elif kind.picture:
+                if image_policy == ImagePolicy.NONE:
+                    continue
+                # pictures left out of the VLM budget fall back to their caption
+                text = picture_texts[item.self_ref] if item.self_ref in picture_texts else item.caption_text(dl_doc)
+                if not text:
                     continue
+            else:
+                text = item.text
 
-                if isinstance(item, TextItem) or ((not self.chunker.merge_list_items) and isinstance(item, ListItem)):
-                    text = item.text
-                elif isinstance(item, TableItem):
-                    md_table = item.export_to_markdown()
-                    text = item.caption_text(dl_doc) + "\n" + md_table + "\n"
-                    captions = [c.text for c in [r.resolve(dl_doc) for r in item.captions]] or None
-                elif isinstance(item, PictureItem):
-                    text = DoclingDocumentConversion._process_document_image(
-                        dl_doc,
-                        item,
-                        **kwargs
-                    )
-                    if not text:
-                        continue
-                else:
-                    text = item.text
-
-                c = DocChunk(
-                    text=f"{chunk_indent}{text}".strip(),
-                    meta=DocMeta(
-                        doc_items=[item],
-                        headings=[heading_by_level[k] for k in sorted(heading_by_level)] or None,
-                        captions=captions,
-                        origin=dl_doc.origin,
-                    ),
-                )
-                results.append(c)
-
-        if self.chunker.merge_list_items and list_items:  # need to yield
-            results.append(
-                DocChunk(
-                    text=self.chunker.delim.join([i.text for i in list_items]).strip(),
-                    meta=DocMeta(
-                        doc_items=list_items,
-                        headings=[heading_by_level[k] for k in sorted(heading_by_level)] or None,
-                        origin=dl_doc.origin,
-                    ),
+            if previous is not None:
+                yield previous
+            # the fields are built right here from document items, there is nothing for pydantic to validate
+            previous = DocChunk.model_construct(
+                text=f"{chunk_indent}{text}".strip(),
+                meta=DocMeta.model_construct(
+                    doc_items=[item], headings=headings.headings, captions=captions, origin=origin
                 ),
             )
 
-        return results
+        if previous is not None:
+            yield previous
+
+        if merge_list_items and list_items:  # need to yield
+            yield DocChunk.model_construct(
+                text=delim.join([i.text for i in list_items]).strip(),
+                meta=DocMeta.model_construct(doc_items=list_items, headings=headings.headings, origin=origin),
+            )
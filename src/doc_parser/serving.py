@@ -0,0 +1,68 @@
+"""Multi-worker serving: a gunicorn master loads docling and the models once, then forks the workers.
+
+Model weights are allocated before the fork, so the workers share their pages copy-on-write instead of each
+loading its own copy. See gunicorn.conf.py for the wiring.
+"""
+import gc
+import os
+import sys
+from typing import Tuple
+
+from doc_parser.resources import available_cpus
+from doc_parser.settings import (
+    CONVERTER_POOL_WARM_UP,
+    JOB_STORE,
+    SERVE_THREADS_PER_WORKER,
+    SERVE_WORKERS,
+    logger,
+)
+
+# Thread pools of the numeric libraries behind torch, EasyOCR and the table model
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+
+def serving_plan(
+    workers: int = SERVE_WORKERS, threads: int = SERVE_THREADS_PER_WORKER, job_store: str = JOB_STORE
+) -> Tuple[int, int]:
+    """Worker processes and torch/OpenMP threads per worker, derived from the container's CPU quota.
+
+    Conversion jobs are only shared between workers through Redis: with the memory job store a job is unknown to
+    every worker but the one it was submitted to, so there is a single worker, given the whole quota.
+    """
+    cpus = available_cpus()
+    if job_store != "redis":
+        if workers > 1:
+            raise RuntimeError(
+                f"SERVE_WORKERS={workers} with JOB_STORE={job_store}: every worker would keep its own jobs, "
+                f"so polling through another worker would not find them. Use JOB_STORE=redis or a single worker."
+            )
+        workers = 1
+    workers = workers or cpus
+    threads = threads or max(1, cpus // workers)
+    return workers, threads
+
+
+def limit_threads(threads: int) -> None:
+    """Cap the intra-op threads of this process, so workers don't oversubscribe the CPU quota together."""
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+    # torch reads the variables when it is imported, it may already be
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(threads)
+
+
+def preload() -> None:
+    """Import docling and load the default pipeline models in the gunicorn master, before the workers are forked.
+
+    Runs from gunicorn's `when_ready`, once the socket is bound, but nothing answers `/health/live` until the workers
+    are forked, so the pod needs a startupProbe covering this load. Nothing runs inference here: forking a process
+    whose OpenMP pool is already running can deadlock the children. Each worker still converts the startup sample
+    document on its own.
+    """
+    from doc_parser.route import converter
+
+    if CONVERTER_POOL_WARM_UP:
+        converter.warm_up()
+    # keep the garbage collector from writing to the preloaded objects, which would copy their pages in every worker
+    gc.freeze()
+    logger.info(f"Preloaded models before forking, {gc.get_freeze_count()} objects frozen")
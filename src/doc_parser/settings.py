@@ -1,3 +1,4 @@
+import os
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -7,3 +8,148 @@ IMAGE_RESOLUTION_SCALE = 1
 MAX_TOKENS = 256
 TEMPERATURE = 0.3
 TOP_P = 0.95
+OCR_LANGS = ["fr", "de", "es", "en"]
+# EasyOCR languages requests may ask for: every distinct set builds and keeps another converter with its own models
+OCR_ALLOWED_LANGS = [lang for lang in os.getenv("OCR_ALLOWED_LANGS", ",".join(OCR_LANGS)).split(",") if lang]
+
+# OCR of PDF pages: adaptive skips bitmap regions (up to whole scanned pages) whose text layer already covers
+# OCR_TEXT_COVERAGE of their area, bitmap is docling's default of OCR'ing every bitmap region, off disables OCR
+OCR_MODE = os.getenv("OCR_MODE", "adaptive")  # adaptive | bitmap | off
+OCR_TEXT_COVERAGE = float(os.getenv("OCR_TEXT_COVERAGE", 0.1))
+
+# Chunk merging budget, measured in space-separated words or in tokens of CHUNK_TOKENIZER
+# (a tokenizer.json path or a Hugging Face model id, needs `pip install tokenizers`)
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", MAX_TOKENS))
+CHUNK_SIZING = os.getenv("CHUNK_SIZING", "words")  # words | tokenizer
+CHUNK_TOKENIZER = os.getenv("CHUNK_TOKENIZER", "")
+
+# Converter pool: each warm DocumentConverter keeps its layout/table/OCR models in memory
+CONVERTER_POOL_MAX_MEMORY_MB = int(os.getenv("CONVERTER_POOL_MAX_MEMORY_MB", 3072))
+CONVERTER_POOL_ENTRY_MEMORY_MB = int(os.getenv("CONVERTER_POOL_ENTRY_MEMORY_MB", 1024))
+CONVERTER_POOL_WARM_UP = os.getenv("CONVERTER_POOL_WARM_UP", "true").lower() == "true"
+
+# Asynchronous conversion jobs
+JOB_STORE = os.getenv("JOB_STORE", "memory")  # memory | redis
+REDIS_HOST = os.getenv("REDIS_HOST", "redis://localhost:6379/0")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 1))
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", 24 * 60 * 60))
+# A worker that hasn't refreshed its heartbeat for JOB_HEARTBEAT_TTL seconds is considered dead and its job requeued,
+# a job taken JOB_MAX_ATTEMPTS times without finishing fails
+JOB_HEARTBEAT_TTL = int(os.getenv("JOB_HEARTBEAT_TTL", 30))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+
+# Conversion executor: keeps CPU-bound conversions off the event loop
+CONVERSION_EXECUTOR = os.getenv("CONVERSION_EXECUTOR", "thread")  # thread | process
+CONVERSION_WORKERS = int(os.getenv("CONVERSION_WORKERS", 1))
+CONVERSION_MAX_QUEUE = int(os.getenv("CONVERSION_MAX_QUEUE", 8))
+CONVERSION_RETRY_AFTER = int(os.getenv("CONVERSION_RETRY_AFTER", 30))
+
+# Scheduling of waiting conversions by the preflight cost estimate: fifo, sjf (cheapest first) or fair (weighted fair
+# share across X-Tenant-Id, cheapest first within a tenant). The X-Priority class divides the cost by its weight, and a
+# conversion that waited SCHEDULER_MAX_WAIT seconds goes before any that arrived after it. Keep it well above the
+# conversion time of the largest documents: once the backlog is longer than that every waiter is served in FIFO order
+SCHEDULER_POLICY = os.getenv("SCHEDULER_POLICY", "sjf")  # fifo | sjf | fair
+SCHEDULER_MAX_WAIT = float(os.getenv("SCHEDULER_MAX_WAIT", 30 * 60))
+SCHEDULER_PRIORITY_WEIGHTS = {
+    name.strip(): float(weight)
+    for name, weight in (
+        item.split("=") for item in os.getenv("SCHEDULER_PRIORITY_WEIGHTS", "high=4,normal=1,low=0.25").split(",")
+    )
+}
+PREFLIGHT_SAMPLE_PAGES = int(os.getenv("PREFLIGHT_SAMPLE_PAGES", 8))
+
+# VLM (Bedrock) picture OCR
+VLM_MODEL_ID = os.getenv("VLM_MODEL_ID", "us.meta.llama3-2-11b-instruct-v1:0")
+VLM_REGION = os.getenv("VLM_REGION", "us-east-1")
+VLM_MAX_CONCURRENCY = int(os.getenv("VLM_MAX_CONCURRENCY", 8))
+VLM_TIMEOUT = int(os.getenv("VLM_TIMEOUT", 60))
+VLM_MAX_RETRIES = int(os.getenv("VLM_MAX_RETRIES", 3))
+VLM_BACKOFF_BASE = float(os.getenv("VLM_BACKOFF_BASE", 0.5))
+
+# Conversion result cache, keyed by the SHA-256 of the upload and the conversion parameters
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+RESULT_CACHE_MEMORY_MB = int(os.getenv("RESULT_CACHE_MEMORY_MB", 256))
+RESULT_CACHE_BACKEND = os.getenv("RESULT_CACHE_BACKEND", "none")  # none | disk | redis
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", "/tmp/doc_parser/results")
+RESULT_CACHE_DISK_MB = int(os.getenv("RESULT_CACHE_DISK_MB", 2048))
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", 7 * 24 * 60 * 60))
+
+# Pictures: dropped (none), kept as their caption (caption) or described by the VLM (vlm). With vlm, only pictures
+# of at least IMAGE_MIN_AREA pixels are sent, at most IMAGE_MAX_PER_DOCUMENT per document (0: no limit), the others
+# keep their caption
+IMAGE_POLICY = os.getenv("IMAGE_POLICY", "vlm")  # none | caption | vlm
+IMAGE_MAX_PER_DOCUMENT = int(os.getenv("IMAGE_MAX_PER_DOCUMENT", 0))
+IMAGE_MIN_AREA = int(os.getenv("IMAGE_MIN_AREA", 0))
+
+# Per-image VLM text cache, keyed by the decoded image bytes, model id and sampling parameters
+IMAGE_CACHE_ENABLED = os.getenv("IMAGE_CACHE_ENABLED", "true").lower() == "true"
+IMAGE_CACHE_MEMORY_MB = int(os.getenv("IMAGE_CACHE_MEMORY_MB", 32))
+IMAGE_CACHE_BACKEND = os.getenv("IMAGE_CACHE_BACKEND", "disk")  # none | disk | redis
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "/tmp/doc_parser/images")
+IMAGE_CACHE_DISK_MB = int(os.getenv("IMAGE_CACHE_DISK_MB", 256))
+IMAGE_CACHE_TTL = int(os.getenv("IMAGE_CACHE_TTL", 30 * 24 * 60 * 60))
+
+# Fast path: Markdown, HTML and AsciiDoc are parsed by their docling backend directly, without a DocumentConverter,
+# in FAST_PATH_WORKERS spawned processes that never import torch (0: in the calling thread)
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "true").lower() == "true"
+FAST_PATH_WORKERS = int(os.getenv("FAST_PATH_WORKERS", 2))
+
+# Page-range sharding of large PDFs across worker processes, each loading its own models. PDF_SHARD_WORKERS
+# 0: one per CPU of the quota, as many as fit at PDF_SHARD_WORKER_MEMORY_MB next to the converter pool
+PDF_SHARD_WORKERS = int(os.getenv("PDF_SHARD_WORKERS", 0))
+PDF_SHARD_WORKER_MEMORY_MB = int(os.getenv("PDF_SHARD_WORKER_MEMORY_MB", 1536))
+
+# Incremental conversion: converted PDF pages, keyed by a fingerprint of their text layer and of a rendering at
+# PAGE_FINGERPRINT_SCALE (1: 72 dpi), so revisions of a document only convert the pages that changed
+PAGE_CACHE_ENABLED = os.getenv("PAGE_CACHE_ENABLED", "true").lower() == "true"
+PAGE_CACHE_MEMORY_MB = int(os.getenv("PAGE_CACHE_MEMORY_MB", 64))
+PAGE_CACHE_BACKEND = os.getenv("PAGE_CACHE_BACKEND", "disk")  # none | disk | redis
+PAGE_CACHE_DIR = os.getenv("PAGE_CACHE_DIR", "/tmp/doc_parser/pages")
+PAGE_CACHE_DISK_MB = int(os.getenv("PAGE_CACHE_DISK_MB", 2048))
+PAGE_CACHE_TTL = int(os.getenv("PAGE_CACHE_TTL", 30 * 24 * 60 * 60))
+PAGE_FINGERPRINT_SCALE = float(os.getenv("PAGE_FINGERPRINT_SCALE", 0.5))
+
+# Upload spooling and request limits
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR") or None
+UPLOAD_READ_CHUNK_BYTES = int(os.getenv("UPLOAD_READ_CHUNK_BYTES", 1024 * 1024))
+UPLOAD_SNIFF_BYTES = int(os.getenv("UPLOAD_SNIFF_BYTES", 8 * 1024))
+UPLOAD_MAX_FILE_MB = int(os.getenv("UPLOAD_MAX_FILE_MB", 512))
+UPLOAD_MAX_TOTAL_MB = int(os.getenv("UPLOAD_MAX_TOTAL_MB", 1024))
+UPLOAD_MAX_FILES = int(os.getenv("UPLOAD_MAX_FILES", 50))
+
+# S3 ingestion jobs: documents are read from S3 and their results written back without passing through the API.
+# S3_ENDPOINT_URL points the client at an S3-compatible store instead (MinIO, moto_server), INGESTION_PREFETCH
+# documents are downloaded while the previous ones convert
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", 1))
+INGESTION_PREFETCH = int(os.getenv("INGESTION_PREFETCH", 4))
+# windows of documents are scheduled with the requests of the API under this priority class
+INGESTION_PRIORITY = os.getenv("INGESTION_PRIORITY", "low")
+
+# Response bodies of at least RESPONSE_COMPRESSION_MIN_BYTES are compressed as negotiated with Accept-Encoding:
+# zstd when the zstandard package is installed, else gzip
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", 1024))
+RESPONSE_GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", 5))
+RESPONSE_ZSTD_LEVEL = int(os.getenv("RESPONSE_ZSTD_LEVEL", 3))
+
+# Stage timings: Prometheus /metrics and the per-request Server-Timing header
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "true").lower() == "true"
+# With several gunicorn workers each writes its metrics to METRICS_MULTIPROCESS_DIR every METRICS_SNAPSHOT_INTERVAL
+# seconds and /metrics merges them
+METRICS_MULTIPROCESS_DIR = os.getenv("METRICS_MULTIPROCESS_DIR", "/tmp/doc_parser/metrics")
+METRICS_SNAPSHOT_INTERVAL = float(os.getenv("METRICS_SNAPSHOT_INTERVAL", 5))
+
+# Batch engine: documents of a batch are converted and chunked concurrently, each with its own deadline
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", 0))  # 0: the container's CPU quota
+BATCH_DOCUMENT_TIMEOUT = float(os.getenv("BATCH_DOCUMENT_TIMEOUT", 0)) or None  # seconds, 0: no limit
+
+# Startup: /health/ready only reports ready once the default pipeline is loaded and a sample document converted
+STARTUP_SAMPLE_CONVERSION = os.getenv("STARTUP_SAMPLE_CONVERSION", "true").lower() == "true"
+STARTUP_RETRY_AFTER = int(os.getenv("STARTUP_RETRY_AFTER", 5))
+
+# Multi-worker serving (gunicorn.conf.py): workers are forked from a master that preloaded the models
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", 0))  # 0: one per CPU of the quota with JOB_STORE=redis, else 1
+SERVE_THREADS_PER_WORKER = int(os.getenv("SERVE_THREADS_PER_WORKER", 0))  # 0: the CPU quota split across workers
+SERVE_TIMEOUT = int(os.getenv("SERVE_TIMEOUT", 600))
@@ -0,0 +1,150 @@
+import re
+import multiprocessing
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pypdfium2 as pdfium
+from docling_core.types.doc.document import DoclingDocument as DLDocument
+
+from doc_parser.resources import available_cpus, available_memory
+from doc_parser.settings import CONVERTER_POOL_MAX_MEMORY_MB, PDF_SHARD_WORKER_MEMORY_MB, PDF_SHARD_WORKERS, logger
+from doc_parser.uploads import DocumentSource, detached, read_head
+
+ITEM_LISTS = ("groups", "texts", "pictures", "tables", "key_value_items")
+REF_PATTERN = re.compile(r"^#/(groups|texts|pictures|tables|key_value_items)/(\d+)$")
+# fields holding item references: RefItem by alias and by name, and the item's own reference. Text that happens to
+# read like a reference stays as it is
+REF_KEYS = ("$ref", "cref", "self_ref")
+
+_shard_executor: Optional[ProcessPoolExecutor] = None
+
+
+def is_pdf(source: DocumentSource) -> bool:
+    return read_head(source, 5) == b"%PDF-"
+
+
+def split_pdf(source: DocumentSource, shard_pages: int) -> List[Tuple[int, bytes]]:
+    """Split a PDF into shards of `shard_pages` pages, returned as (page offset, shard bytes)."""
+    # pdfium moves an in-memory stream, a single shard falls back to converting the source itself
+    pdf = pdfium.PdfDocument(detached(source))
+    try:
+        num_pages = len(pdf)
+        shards = []
+        for start in range(0, num_pages, shard_pages):
+            shard = pdfium.PdfDocument.new()
+            shard.import_pages(pdf, pages=list(range(start, min(start + shard_pages, num_pages))))
+            buffer = BytesIO()
+            shard.save(buffer)
+            shard.close()
+            shards.append((start, buffer.getvalue()))
+        return shards
+    finally:
+        pdf.close()
+
+
+def _rebase(node: Any, ref_offsets: Dict[str, int], page_offset: int) -> Any:
+    if isinstance(node, dict):
+        rebased = {}
+        for key, value in node.items():
+            if key == "page_no" and isinstance(value, int):
+                rebased[key] = value + page_offset
+            elif key in REF_KEYS and isinstance(value, str) and (match := REF_PATTERN.match(value)):
+                rebased[key] = f"#/{match[1]}/{int(match[2]) + ref_offsets[match[1]]}"
+            else:
+                rebased[key] = _rebase(value, ref_offsets, page_offset)
+        return rebased
+    if isinstance(node, list):
+        return [_rebase(value, ref_offsets, page_offset) for value in node]
+    return node
+
+
+def merge_documents(documents: List[Tuple[int, DLDocument]]) -> DLDocument:
+    """Concatenate shard documents in page order into one DoclingDocument.
+
+    Item references (`#/texts/3`, ...) are shifted by the number of items already merged and page
+    numbers by the shard's page offset, so the result looks like a single unsharded conversion.
+    """
+    merged: Optional[Dict[str, Any]] = None
+    for page_offset, document in documents:
+        data = document.model_dump(mode="json", by_alias=True)
+        if merged is None:
+            merged = {
+                **data,
+                **{kind: [] for kind in ITEM_LISTS},
+                "body": {**data["body"], "children": []},
+                "furniture": {**data["furniture"], "children": []},
+                "pages": {},
+            }
+
+        ref_offsets = {kind: len(merged[kind]) for kind in ITEM_LISTS}
+        pages = {str(int(page_no) + page_offset): page for page_no, page in data.pop("pages", {}).items()}
+        data = _rebase(data, ref_offsets, page_offset)
+        for kind in ITEM_LISTS:
+            merged[kind].extend(data.get(kind, []))
+        merged["body"]["children"].extend(data["body"]["children"])
+        merged["furniture"]["children"].extend(data["furniture"]["children"])
+        merged["pages"].update(_rebase(pages, ref_offsets, page_offset))
+
+    return DLDocument.model_validate(merged)
+
+
+def shard_workers() -> int:
+    """PDF_SHARD_WORKERS, else one per CPU of the quota as long as their models fit in memory next to the
+    converter pool."""
+    if PDF_SHARD_WORKERS > 0:
+        return PDF_SHARD_WORKERS
+    workers = available_cpus()
+    memory = available_memory()
+    if memory is not None:
+        spare_mb = memory // (1024 * 1024) - CONVERTER_POOL_MAX_MEMORY_MB
+        workers = min(workers, spare_mb // PDF_SHARD_WORKER_MEMORY_MB)
+    return max(1, workers)
+
+
+def _get_shard_executor() -> ProcessPoolExecutor:
+    global _shard_executor
+    if _shard_executor is None:
+        workers = shard_workers()
+        logger.info(f"Starting {workers} PDF shard workers")
+        # spawn rather than fork, the parent already runs torch and pdfium threads
+        _shard_executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _shard_executor
+
+
+def shutdown(wait: bool = True) -> None:
+    """Stop the shard workers, the pool is started again by the next sharded conversion."""
+    global _shard_executor
+    if _shard_executor is not None:
+        _shard_executor.shutdown(wait=wait, cancel_futures=True)
+        _shard_executor = None
+
+
+def convert_shards(
+    convert_fn: Callable[..., Tuple[Optional[DLDocument], Optional[str], Optional[int]]],
+    filename: str,
+    shards: List[Tuple[int, bytes]],
+    **kwargs,
+) -> Tuple[List[Tuple[int, DLDocument]], Optional[str], Optional[int]]:
+    """Run `convert_fn` on every shard in the process pool, returns the shard documents or the first error,
+    and the pages OCR'd over all shards."""
+    executor = _get_shard_executor()
+    futures = [executor.submit(convert_fn, (filename, BytesIO(shard_bytes)), **kwargs) for _, shard_bytes in shards]
+
+    documents = []
+    ocr_pages = None
+    for (page_offset, _), future in zip(shards, futures):
+        dl_doc, error, shard_ocr_pages = future.result()
+        if error:
+            for pending in futures:
+                pending.cancel()
+            return [], f"Pages from {page_offset + 1}: {error}", None
+        documents.append((page_offset, dl_doc))
+        if shard_ocr_pages is not None:
+            ocr_pages = (ocr_pages or 0) + shard_ocr_pages
+
+    logger.info(f"Converted {filename} in {len(shards)} shards")
+    return documents, None, ocr_pages
@@ -0,0 +1,78 @@
+import os
+from abc import ABC, abstractmethod
+from functools import lru_cache
+
+from doc_parser.settings import CHUNK_SIZING, CHUNK_TOKENIZER, logger
+
+
+class ChunkSizer(ABC):
+    """Measures chunk text against the chunk token budget.
+
+    Accumulated chunks only ever grow by appending, so callers keep a running length and `extend` it with the
+    appended text instead of re-measuring the whole text every time.
+    """
+
+    name: str
+
+    @abstractmethod
+    def count(self, text: str) -> int:
+        pass
+
+    def extend(self, length: int, text: str) -> int:
+        """Length of a text measuring `length` once `text` is appended to it."""
+        return length + self.count(text)
+
+
+class WordChunkSizer(ChunkSizer):
+    """Space-separated words, i.e. `len(text.split(" "))`, without building the list."""
+
+    name = "words"
+
+    def count(self, text: str) -> int:
+        return text.count(" ") + 1
+
+    def extend(self, length: int, text: str) -> int:
+        # the last word of the accumulated text and the first word of `text` are not separated by a space
+        return length + text.count(" ")
+
+
+class TokenizerChunkSizer(ChunkSizer):
+    """Tokens of a Hugging Face `tokenizers` tokenizer, e.g. the one of the embedding model."""
+
+    name = "tokenizer"
+
+    def __init__(self, tokenizer: str):
+        self.tokenizer_name = tokenizer
+        self.tokenizer = self._load(tokenizer)
+
+    @staticmethod
+    def _load(tokenizer: str):
+        try:
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError("CHUNK_SIZING=tokenizer requires the tokenizers package: pip install tokenizers") from e
+
+        if os.path.isfile(tokenizer):
+            return Tokenizer.from_file(tokenizer)
+
+        # a model id is resolved through the Hugging Face cache, set HF_HUB_OFFLINE=1 to never hit the network
+        from huggingface_hub import hf_hub_download
+
+        return Tokenizer.from_file(hf_hub_download(tokenizer, "tokenizer.json"))
+
+    def count(self, text: str) -> int:
+        return len(self.tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+@lru_cache(maxsize=None)
+def get_chunk_sizer(sizing: str = CHUNK_SIZING, tokenizer: str = CHUNK_TOKENIZER) -> ChunkSizer:
+    """Sizers are built once per process, loading a tokenizer is far slower than using it."""
+    if sizing == "words":
+        return WordChunkSizer()
+    if sizing == "tokenizer":
+        if not tokenizer:
+            raise ValueError("CHUNK_SIZING=tokenizer requires CHUNK_TOKENIZER, a tokenizer.json path or model id")
+        sizer = TokenizerChunkSizer(tokenizer)
+        logger.info(f"Loaded chunk tokenizer {tokenizer}")
+        return sizer
+    raise ValueError(f"Unsupported chunk sizing: {sizing}")
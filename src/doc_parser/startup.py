@@ -0,0 +1,141 @@
+"""Startup phases and the health endpoints.
+
+Importing docling/torch, loading the layout/table/OCR models and a first conversion take long enough that a pod
+must not receive traffic before they are done. They run in the background while `/health/live` already answers,
+and `/health/ready` only reports ready once every phase finished.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from io import BytesIO
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from doc_parser.metrics import register_callback
+from doc_parser.settings import STARTUP_RETRY_AFTER, logger
+
+SAMPLE_DOCUMENT_NAME = "warm-up.pdf"
+SAMPLE_DOCUMENT_LINES = (
+    (18, "1. Warm-up"),
+    (11, "This one-page document is converted once at startup so that the first request"),
+    (11, "does not pay for loading the layout, table structure and OCR models."),
+)
+
+
+def sample_pdf() -> bytes:
+    """A one-page PDF with a heading and a paragraph, built in memory so no asset has to be shipped."""
+    content = "\n".join(
+        f"BT /F1 {size} Tf 72 {720 - 24 * i} Td ({text}) Tj ET" for i, (size, text) in enumerate(SAMPLE_DOCUMENT_LINES)
+    ).encode("latin-1")
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 4 0 R >> >> "
+        b"/Contents 5 0 R >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content),
+    ]
+
+    pdf = BytesIO()
+    pdf.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(pdf.tell())
+        pdf.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+    xref = pdf.tell()
+    pdf.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        pdf.write(b"%010d 00000 n \n" % offset)
+    pdf.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return pdf.getvalue()
+
+
+def convert_sample_document(converter: Any) -> None:
+    """Run the sample through `DoclingDocumentConversion.convert`, without VLM calls."""
+    from doc_parser.utils import ImagePolicy
+
+    result = converter.convert((SAMPLE_DOCUMENT_NAME, BytesIO(sample_pdf())), image_policy=ImagePolicy.NONE)
+    if result.error:
+        raise RuntimeError(f"Sample conversion failed: {result.error}")
+    logger.info(f"Converted the sample document into {len(result.chunk_dicts)} chunks")
+
+
+class StartupState:
+    """Duration of every startup phase and whether the service is ready to take traffic."""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.phases: Dict[str, float] = {}
+        self.ready = False
+        self.error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        yield
+        seconds = time.perf_counter() - start
+        with self._lock:
+            self.phases[name] = seconds
+        logger.info(f"Startup phase {name} took {seconds:.2f}s")
+
+    def _run(self, steps: Callable[["StartupState"], None]) -> None:
+        try:
+            steps(self)
+        except Exception as e:
+            logger.exception(f"Startup failed: {e}")
+            self.error = str(e) or type(e).__name__
+            return
+        self.ready = True
+        logger.info(f"Ready after {time.time() - self.started_at:.2f}s")
+
+    def start(self, steps: Callable[["StartupState"], None]) -> None:
+        """Run `steps` on a background thread, marking the service ready when it returns."""
+        self._thread = threading.Thread(target=self._run, args=(steps,), name="startup", daemon=True)
+        self._thread.start()
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            phases = dict(self.phases)
+        return {
+            "status": "ready" if self.ready else ("failed" if self.error else "starting"),
+            "uptime_seconds": time.time() - self.started_at,
+            "phases": phases,
+            "error": self.error,
+        }
+
+
+startup = StartupState()
+
+register_callback(
+    "doc_parser_startup_phase_seconds",
+    "Duration of the startup phases (import, pipeline, sample)",
+    lambda: {(name,): seconds for name, seconds in startup.report()["phases"].items()},
+    labelnames=("phase",),
+)
+register_callback("doc_parser_ready", "1 once startup finished and the service takes traffic", lambda: {(): int(startup.ready)})
+
+
+health_router = APIRouter()
+
+
+@health_router.get("/health/live", include_in_schema=False)
+async def live():
+    # answers as soon as the event loop runs, heavy imports happen in the startup thread
+    return {"status": "alive"}
+
+
+@health_router.get("/health/ready", include_in_schema=False)
+async def ready():
+    return JSONResponse(status_code=200 if startup.ready else 503, content=startup.report())
+
+
+async def startup_gate(request, call_next):
+    """Middleware answering 503 with Retry-After until startup finished, except for the health endpoints."""
+    if startup.ready or request.url.path.startswith("/health/"):
+        return await call_next(request)
+    detail = "The service is starting up" if not startup.error else f"The service failed to start: {startup.error}"
+    return JSONResponse(status_code=503, content={"detail": detail}, headers={"Retry-After": str(STARTUP_RETRY_AFTER)})
@@ -0,0 +1,56 @@
+from typing import AsyncIterator, Callable, Literal, Optional, Union
+
+from fastapi.responses import StreamingResponse
+
+from doc_parser.schema import ConversionResult, ParserChunk
+
+StreamFormat = Literal["ndjson", "sse"]
+
+STREAM_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+
+def _encode(event: str, payload: str, stream: StreamFormat) -> str:
+    if stream == "sse":
+        return f"event: {event}\ndata: {payload}\n\n"
+    return f"{payload}\n"
+
+
+async def _stream_results(
+    results: AsyncIterator[Union[ParserChunk, ConversionResult]],
+    stream: StreamFormat,
+    stream_chunks: bool,
+    cleanup: Optional[Callable[[], None]] = None,
+) -> AsyncIterator[str]:
+    try:
+        async for item in results:
+            if isinstance(item, ParserChunk):
+                yield _encode("chunk", item.model_dump_json(), stream)
+            elif stream_chunks:
+                # one line per ParserChunk, then the ConversionResult without chunks marks the end of the document
+                yield _encode("result", item.model_dump_json(exclude_unset=True, exclude={"chunk_dicts"}), stream)
+            else:
+                yield _encode("result", item.model_dump_json(exclude_unset=True), stream)
+    finally:
+        # unlike a BackgroundTask, also runs when the client disconnects mid-stream
+        if cleanup is not None:
+            cleanup()
+
+
+def streaming_response(
+    results: AsyncIterator[Union[ParserChunk, ConversionResult]],
+    stream: StreamFormat,
+    stream_chunks: bool = False,
+    cleanup: Optional[Callable[[], None]] = None,
+) -> StreamingResponse:
+    """Emit every ConversionResult (or its chunks) as soon as it is produced, as NDJSON lines or SSE events.
+
+    With `stream_chunks`, `results` is expected to yield each document's ParserChunks ahead of its ConversionResult,
+    see `DocumentConverterService.iter_document_chunks`. `cleanup` runs once the stream ends, however it ends.
+    """
+    return StreamingResponse(
+        _stream_results(results, stream, stream_chunks, cleanup),
+        media_type=STREAM_MEDIA_TYPES[stream],
+    )
@@ -0,0 +1,151 @@
+import os
+import shutil
+import hashlib
+import tempfile
+import time
+from io import BytesIO
+from pathlib import Path
+from typing import BinaryIO, Iterator, List, Optional, Tuple, Union
+
+from fastapi import HTTPException, Request, UploadFile
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+
+from doc_parser.settings import (
+    UPLOAD_MAX_FILE_MB,
+    UPLOAD_MAX_FILES,
+    UPLOAD_MAX_TOTAL_MB,
+    UPLOAD_READ_CHUNK_BYTES,
+    UPLOAD_SNIFF_BYTES,
+    UPLOAD_SPOOL_DIR,
+)
+from doc_parser.metrics import record_stage
+from doc_parser.utils import FormatToExtensions, guess_format
+
+# A document is converted either from memory or, for uploads, from its spooled file
+DocumentSource = Union[BytesIO, Path]
+
+
+def read_head(source: DocumentSource, size: int = UPLOAD_SNIFF_BYTES) -> bytes:
+    if isinstance(source, BytesIO):
+        return bytes(source.getbuffer()[:size])
+    with open(source, "rb") as f:
+        return f.read(size)
+
+
+def iter_blocks(source: DocumentSource, block_size: int = UPLOAD_READ_CHUNK_BYTES) -> Iterator[bytes]:
+    if isinstance(source, BytesIO):
+        yield source.getbuffer()
+        return
+    with open(source, "rb") as f:
+        while block := f.read(block_size):
+            yield block
+
+
+def sha256_source(source: DocumentSource) -> "hashlib._Hash":
+    digest = hashlib.sha256()
+    for block in iter_blocks(source):
+        digest.update(block)
+    return digest
+
+
+def source_bytes(source: DocumentSource) -> bytes:
+    return source.getvalue() if isinstance(source, BytesIO) else source.read_bytes()
+
+
+def detached(source: DocumentSource) -> DocumentSource:
+    """The source for a reader that moves the stream position (pdfium, zipfile). An in-memory document gets a stream
+    of its own over the same bytes, the caller's stays at the position docling sniffs the format from."""
+    return BytesIO(source.getvalue()) if isinstance(source, BytesIO) else source
+
+
+def remove_spooled(path: Union[str, Path]) -> None:
+    """Delete an upload handed over to a job, and its request's spool directory once the last one is gone."""
+    path = Path(path)
+    shutil.rmtree(path.parent, ignore_errors=True)
+    try:
+        path.parent.parent.rmdir()
+    except OSError:
+        # other uploads of the batch are still waiting for their job
+        pass
+
+
+class UploadSpool:
+    """Takes the uploads of one request over from Starlette, enforcing size and count limits.
+
+    Starlette already spools each upload, in memory up to 1 MiB and past that to an anonymous temp file that is closed
+    with the request. Small uploads are converted from that memory. Larger ones are copied once to a private temp
+    directory, keeping their original name so docling detects the format from the path and reads it lazily, and so
+    they outlive the request for streaming responses and jobs.
+    """
+
+    def __init__(
+        self,
+        max_file_bytes: int = UPLOAD_MAX_FILE_MB * 1024 * 1024,
+        max_total_bytes: int = UPLOAD_MAX_TOTAL_MB * 1024 * 1024,
+        max_files: int = UPLOAD_MAX_FILES,
+    ):
+        self.max_file_bytes = max_file_bytes
+        self.max_total_bytes = max_total_bytes
+        self.max_files = max_files
+        self.total_bytes = 0
+        self.documents: List[Tuple[str, DocumentSource]] = []
+        # created with the first upload that has to be copied
+        self.directory: Optional[Path] = None
+
+    @staticmethod
+    def _copy(file: BinaryIO, path: Path) -> None:
+        file.seek(0)
+        with open(path, "wb") as f:
+            shutil.copyfileobj(file, f, UPLOAD_READ_CHUNK_BYTES)
+
+    async def add(self, document: UploadFile) -> Tuple[str, DocumentSource]:
+        if len(self.documents) >= self.max_files:
+            raise HTTPException(status_code=413, detail=f"Too many files, the limit is {self.max_files}")
+
+        started_at = time.perf_counter()
+        head = await document.read(UPLOAD_SNIFF_BYTES)
+        sniff_started_at = time.perf_counter()
+        input_format = guess_format(head, document.filename)
+        record_stage("sniff", time.perf_counter() - sniff_started_at, input_format.value if input_format else None)
+        if input_format not in FormatToExtensions:
+            raise HTTPException(status_code=400, detail=f"Unsupported file format: {document.filename}")
+
+        size = document.size
+        if size is None:
+            size = await run_in_threadpool(document.file.seek, 0, os.SEEK_END)
+        self.total_bytes += size
+        if size > self.max_file_bytes:
+            raise HTTPException(status_code=413, detail=f"File too large: {document.filename}")
+        if self.total_bytes > self.max_total_bytes:
+            raise HTTPException(status_code=413, detail="Request too large")
+
+        source: DocumentSource
+        if not getattr(document.file, "_rolled", True):
+            # still in Starlette's memory buffer, reading it doesn't block (Starlette checks `_rolled` the same way)
+            document.file.seek(0)
+            source = BytesIO(document.file.read())
+        else:
+            # one sub-directory per file, so duplicate filenames in a batch don't collide
+            if self.directory is None:
+                self.directory = Path(tempfile.mkdtemp(prefix="doc_parser_", dir=UPLOAD_SPOOL_DIR))
+            filename = os.path.basename(document.filename or "") or "document"
+            source = self.directory / str(len(self.documents)) / filename
+            source.parent.mkdir()
+            await run_in_threadpool(self._copy, document.file, source)
+        record_stage("upload", time.perf_counter() - started_at, input_format.value)
+
+        self.documents.append((document.filename, source))
+        return document.filename, source
+
+    def cleanup(self) -> None:
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+async def limit_request_size(request: Request, call_next):
+    """Reject oversized uploads from Content-Length before the multipart body is parsed."""
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > UPLOAD_MAX_TOTAL_MB * 1024 * 1024:
+        return JSONResponse(status_code=413, content={"detail": "Request too large"})
+    return await call_next(request)
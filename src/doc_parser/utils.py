@@ -1,12 +1,38 @@
 import re
 import json
+import time
+import base64
+import random
+import hashlib
+import threading
+import contextvars
 from enum import Enum
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 import filetype
-from typing import Dict, List
+from typing import Callable, Dict, Iterator, List, Optional
 
 import boto3
-
-from doc_parser.settings import logger
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError, ConnectionError as BotoConnectionError
+
+from doc_parser.cache import SingleFlight, TieredCache, create_cache
+from doc_parser.metrics import VLM_REQUEST_SECONDS, VLM_REQUESTS, timed
+from doc_parser.settings import (
+    IMAGE_CACHE_BACKEND,
+    IMAGE_CACHE_DIR,
+    IMAGE_CACHE_DISK_MB,
+    IMAGE_CACHE_ENABLED,
+    IMAGE_CACHE_MEMORY_MB,
+    IMAGE_CACHE_TTL,
+    VLM_BACKOFF_BASE,
+    VLM_MAX_CONCURRENCY,
+    VLM_MAX_RETRIES,
+    VLM_MODEL_ID,
+    VLM_REGION,
+    VLM_TIMEOUT,
+    logger,
+)
 
 
 class InputFormat(str, Enum):
@@ -19,6 +45,12 @@ class InputFormat(str, Enum):
     MD = "md"
 
 
+class ImagePolicy(str, Enum):
+    NONE = "none"
+    CAPTION = "caption"
+    VLM = "vlm"
+
+
 class OutputFormat(str, Enum):
     MARKDOWN = "md"
     JSON = "json"
@@ -61,17 +93,34 @@ FormatToMimeType: Dict[InputFormat, List[str]] = {
 MimeTypeToFormat = {mime: fmt for fmt, mimes in FormatToMimeType.items() for mime in mimes}
 
 
-def detect_html_xhtml(content):
-    content_str = content.decode("ascii", errors="ignore").lower()
-    # Remove XML comments
-    content_str = re.sub(r"<!--(.*?)-->", "", content_str, flags=re.DOTALL)
+# Format sniffing only ever looks at this many leading bytes, whatever the upload size
+FORMAT_SNIFF_BYTES = 8 * 1024
+
+XML_DECLARATION_PATTERN = re.compile(r"<\?xml")
+HTML_START_PATTERN = re.compile(r"<!doctype\s+html|<html|<head|<body")
+XML_COMMENT_PATTERN = re.compile(r"<!--(.*?)-->", flags=re.DOTALL)
+
+
+def _skip_leading_comments(content_str: str) -> str:
     content_str = content_str.lstrip()
+    while content_str.startswith("<!--"):
+        end = content_str.find("-->")
+        if end == -1:
+            return ""
+        content_str = content_str[end + 3 :].lstrip()
+    return content_str
 
-    if re.match(r"<\?xml", content_str):
-        if "xhtml" in content_str[:1000]:
+
+def detect_html_xhtml(content):
+    content_str = bytes(content[:FORMAT_SNIFF_BYTES]).decode("ascii", errors="ignore").lower()
+    # Skip XML comments before the first tag
+    content_str = _skip_leading_comments(content_str)
+
+    if XML_DECLARATION_PATTERN.match(content_str):
+        if "xhtml" in XML_COMMENT_PATTERN.sub("", content_str)[:1000]:
             return "application/xhtml+xml"
 
-    if re.match(r"<!doctype\s+html|<html|<head|<body", content_str):
+    if HTML_START_PATTERN.match(content_str):
         return "text/html"
 
     return None
@@ -82,7 +131,8 @@ def guess_format(obj: bytes, filename: str = None):
     mime = None
 
     if isinstance(obj, bytes):
-        content = obj
+        # never copy more than the sniffing window out of large uploads
+        content = bytes(memoryview(obj)[:FORMAT_SNIFF_BYTES])
         mime = filetype.guess_mime(content)
         if mime is None:
             ext = filename.rsplit(".", 1)[-1] if ("." in filename and not filename.startswith(".")) else ""
@@ -109,48 +159,216 @@ def is_file_format_supported(file_bytes: bytes, filename: str) -> bool:
     return guess_format(file_bytes, filename) in FormatToExtensions.keys()
 
 
+VLM_RETRYABLE_ERROR_CODES = {
+    "ThrottlingException",
+    "ServiceUnavailableException",
+    "InternalServerException",
+    "ModelTimeoutException",
+    "ModelNotReadyException",
+}
+
+_bedrock_clients: Dict[str, "boto3.client"] = {}
+_bedrock_clients_lock = threading.Lock()
+_vlm_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_bedrock_client(region_name: str = VLM_REGION):
+    """Shared, connection-pooled bedrock-runtime client (boto3 clients are thread-safe)."""
+    with _bedrock_clients_lock:
+        client = _bedrock_clients.get(region_name)
+        if client is None:
+            client = boto3.client(
+                "bedrock-runtime",
+                region_name=region_name,
+                config=Config(
+                    max_pool_connections=VLM_MAX_CONCURRENCY,
+                    connect_timeout=VLM_TIMEOUT,
+                    read_timeout=VLM_TIMEOUT,
+                    # retries are done by image_to_text with jittered backoff
+                    retries={"total_max_attempts": 1},
+                ),
+            )
+            _bedrock_clients[region_name] = client
+        return client
+
+
+def _get_vlm_executor() -> ThreadPoolExecutor:
+    global _vlm_executor
+    with _bedrock_clients_lock:
+        if _vlm_executor is None:
+            _vlm_executor = ThreadPoolExecutor(max_workers=VLM_MAX_CONCURRENCY, thread_name_prefix="vlm")
+        return _vlm_executor
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, ClientError):
+        return error.response.get("Error", {}).get("Code") in VLM_RETRYABLE_ERROR_CODES
+    return isinstance(error, (BotoCoreError, BotoConnectionError))
+
+
 def image_to_text(
-    base64_image: str,
-    region_name="us-east-1",
+    image: bytes,
+    region_name=VLM_REGION,
     max_tokens=256,
     temperature=0.3,
     top_p=0.95,
 ) -> str:
-    inference_profile_id = "us.meta.llama3-2-11b-instruct-v1:0"
+    inference_profile_id = VLM_MODEL_ID
 
-    # Initialize the Bedrock client
-    client = boto3.client("bedrock-runtime", region_name=region_name)  # Adjust region as necessary
+    # Shared Bedrock client, see get_bedrock_client
+    client = get_bedrock_client(region_name)
 
     # Prepare the messages for the model invocation
     prompt = """<|begin_of_text|><|start_header_id|>system<|end_header_id|>You are a helpful AI extraction for extracting text from images. No add any additional text.<|eot_id|><|start_header_id|>user<|end_header_id|>Extract all text in the given image in markdown.<|eot_id|><|start_header_id|>assistant<|end_header_id|>"""  # noqa: E501
 
-    # Call the model with cross-region inference
+    body = json.dumps(
+        {
+            "temperature": temperature,
+            "top_p": top_p,
+            "max_gen_len": max_tokens,
+            "prompt": prompt,
+            # the only place the PNG is base64-encoded, the invoke_model body is JSON
+            "images": [base64.b64encode(image).decode()],
+        },
+    )
+
+    # Call the model with cross-region inference, retrying transient errors with full-jitter backoff
+    with timed("vlm"):
+        for attempt in range(VLM_MAX_RETRIES + 1):
+            started_at = time.perf_counter()
+            try:
+                response = client.invoke_model(
+                    modelId=inference_profile_id,
+                    body=body,
+                    contentType="application/json",
+                    accept="application/json",
+                )
+                response_body = json.loads(response.get("body").read())
+
+                # text
+                result = response_body.get("generation").strip()
+
+                logger.info(f"Successful for calling {inference_profile_id}.")
+                _observe_vlm_request("success", started_at)
+
+                return result
+
+            except Exception as e:
+                if attempt < VLM_MAX_RETRIES and _is_retryable(e):
+                    _observe_vlm_request("retry", started_at)
+                    delay = random.uniform(0, VLM_BACKOFF_BASE * 2**attempt)
+                    logger.warning(f"Retrying {inference_profile_id} in {delay:.2f}s after error: {e}.")
+                    time.sleep(delay)
+                    continue
+                _observe_vlm_request("error", started_at)
+                logger.exception(f"An error occurred while invoking the model: {e}.")
+                return ""
+
+    return ""
+
+
+def _observe_vlm_request(outcome: str, started_at: float) -> None:
+    VLM_REQUESTS.inc(outcome=outcome)
+    VLM_REQUEST_SECONDS.observe(time.perf_counter() - started_at, outcome=outcome)
+
+
+# Memo keys of the pictures the VLM failed to describe in the current conversion, see `collect_vlm_failures`
+_vlm_failures: contextvars.ContextVar[Optional[List[str]]] = contextvars.ContextVar("vlm_failures", default=None)
+
+
+@contextmanager
+def collect_vlm_failures() -> Iterator[List[str]]:
+    """Collect the pictures described in this context that the VLM failed on into a fresh list.
+
+    Those pictures keep only their caption, so a result containing them must not be cached like a complete one.
+    """
+    failures: List[str] = []
+    token = _vlm_failures.set(failures)
     try:
-        body = json.dumps(
-            {
-                "temperature": temperature,
-                "top_p": top_p,
-                "max_gen_len": max_tokens,
-                "prompt": prompt,
-                "images": [base64_image],
-            },
-        )
-
-        response = client.invoke_model(
-            modelId=inference_profile_id,
-            body=body,
-            contentType="application/json",
-            accept="application/json",
-        )
-        response_body = json.loads(response.get("body").read())
-
-        # text
-        result = response_body.get("generation").strip()
-
-        logger.info(f"Successful for calling {inference_profile_id}.")
-
-        return result
-
-    except Exception as e:
-        logger.exception(f"An error occurred while invoking the model: {e}.")
-        return ""
+        yield failures
+    finally:
+        _vlm_failures.reset(token)
+
+
+class ImageTextMemo:
+    """Memo layer in front of `image_to_text`.
+
+    Keys are the SHA-256 of the PNG bytes plus the model id and sampling parameters, values are the
+    text after `postprocess`. Identical images requested concurrently share a single VLM call.
+    """
+
+    def __init__(self, cache: Optional[TieredCache]):
+        self.cache = cache
+        self._flights = SingleFlight()
+
+    @staticmethod
+    def key(image: bytes, max_tokens: int, temperature: float, top_p: float) -> str:
+        digest = hashlib.sha256(image)
+        digest.update(json.dumps([VLM_MODEL_ID, max_tokens, temperature, top_p]).encode())
+        return digest.hexdigest()
+
+    def _describe(self, key: str, image: bytes, postprocess: Callable[[str], str], **kwargs) -> Optional[str]:
+        image_text = image_to_text(image, **kwargs)
+        # image_to_text returns "" when the call failed, which must not be remembered
+        if not image_text:
+            return None
+        text = postprocess(image_text)
+        if self.cache is not None:
+            self.cache.set(key, text.encode())
+        return text
+
+    def images_to_text(
+        self,
+        images: List[bytes],
+        postprocess: Callable[[str], str],
+        max_tokens: int = 256,
+        temperature: float = 0.3,
+        top_p: float = 0.95,
+    ) -> List[str]:
+        texts: List[Optional[str]] = [None] * len(images)
+        keys = [self.key(image, max_tokens, temperature, top_p) for image in images]
+        futures = {}
+        for i, (key, image) in enumerate(zip(keys, images)):
+            cached = self.cache.get(key) if self.cache is not None else None
+            if cached is not None:
+                texts[i] = cached.decode()
+                continue
+
+            futures[i] = self._flights.submit(
+                key,
+                # run in a copy of the caller's context so VLM time lands in its request's Server-Timing
+                lambda key=key, image=image: _get_vlm_executor().submit(
+                    contextvars.copy_context().run,
+                    self._describe,
+                    key,
+                    image,
+                    postprocess,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    top_p=top_p,
+                ),
+            )
+
+        failures = _vlm_failures.get()
+        for i, future in futures.items():
+            texts[i] = future.result()
+            if texts[i] is None:
+                # every caller sharing a failed flight reports it
+                texts[i] = postprocess("")
+                if failures is not None:
+                    failures.append(keys[i])
+        return texts
+
+
+image_text_memo = ImageTextMemo(
+    create_cache(
+        memory_mb=IMAGE_CACHE_MEMORY_MB,
+        backend=IMAGE_CACHE_BACKEND,
+        ttl=IMAGE_CACHE_TTL,
+        directory=IMAGE_CACHE_DIR,
+        disk_mb=IMAGE_CACHE_DISK_MB,
+        namespace="images",
+    )
+    if IMAGE_CACHE_ENABLED
+    else None
+)
@@ -0,0 +1,32 @@
+"""Standalone conversion worker, drains the shared job store without serving HTTP.
+
+Run with `JOB_STORE=redis python -m doc_parser.worker` so workers scale independently of the API pods.
+"""
+import signal
+import threading
+
+from doc_parser.jobs import ConversionWorkerPool, create_job_store
+from doc_parser.service import DoclingDocumentConversion
+from doc_parser.settings import CONVERTER_POOL_WARM_UP, JOB_WORKERS, STARTUP_SAMPLE_CONVERSION
+from doc_parser.startup import convert_sample_document
+
+
+def main() -> None:
+    converter = DoclingDocumentConversion()
+    if CONVERTER_POOL_WARM_UP:
+        converter.warm_up()
+    if STARTUP_SAMPLE_CONVERSION:
+        convert_sample_document(converter)
+
+    workers = ConversionWorkerPool(create_job_store(), converter, num_workers=max(1, JOB_WORKERS))
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    signal.signal(signal.SIGINT, lambda *_: stopped.set())
+
+    workers.start()
+    stopped.wait()
+    workers.stop()
+
+
+if __name__ == "__main__":
+    main()